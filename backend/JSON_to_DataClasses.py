@@ -1,19 +1,28 @@
+import codecs
+import gc
+import io
 import json
-from dataclasses import dataclass
-from typing import List, Optional, Union, Any, Dict
+import os
+import re
+from sys import intern
+from contextlib import contextmanager
+from threading import Lock
+from dataclasses import dataclass, field
+from typing import IO, Callable, Iterator, List, Optional, Union, Any, Dict
 
 #################################### DATACLASSES ############################################################################################################
 # This file contains the dataclasses that represent the AST of the JSON file and the logic to convert it.
 # Each dataclass corresponds to an AST element. 
 # We then work on the dataclass tree to build the MLIR.
+# The dataclasses use __slots__, the netlists have hundreds of thousands of nodes and a __dict__ for each one is expensive.
 
-@dataclass
+@dataclass(slots=True)
 class ASTNode:
     kind: str
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Assignment:
     kind: str
     type: str
@@ -23,7 +32,7 @@ class Assignment:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class BinaryOp:
     kind: str
     type: str
@@ -33,7 +42,7 @@ class BinaryOp:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class UnaryOp:
     kind: str
     type: str
@@ -42,20 +51,20 @@ class UnaryOp:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class CompilationUnit:
     kind: str
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class ContinuousAssign:
     kind: str
     assignment: 'Assignment'
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Conversion:
     kind: str
     type: str
@@ -64,14 +73,14 @@ class Conversion:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Instance:
     kind: str
     body: 'InstanceBody'
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class InstanceBody:
     kind: str
     members: List[Union['Port', 'PrimitiveInstance', 'Variable', 'ContinuousAssign', 'ProceduralBlock', 'Net']]
@@ -79,7 +88,7 @@ class InstanceBody:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class IntegerLiteral:
     kind: str
     type: str
@@ -88,7 +97,7 @@ class IntegerLiteral:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class NamedValue:
     kind: str
     type: str
@@ -97,7 +106,7 @@ class NamedValue:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Net:
     kind: str
     type: str
@@ -105,14 +114,14 @@ class Net:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class NetType:
     kind: str
     type: str
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Port:
     kind: str
     type: str
@@ -121,7 +130,7 @@ class Port:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class PrimitiveInstance:
     kind: str
     primitiveType: str
@@ -129,14 +138,16 @@ class PrimitiveInstance:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Root:
     kind: str
     members: List[Union['CompilationUnit', 'Instance']]
     name: Optional[str] = None
     addr: Optional[int] = None
+    # Metrics and symbols of the input file, filled by the conversion
+    context: Optional['ConversionContext'] = field(default=None, compare=False, repr=False)
 
-@dataclass
+@dataclass(slots=True)
 class Variable:
     kind: str
     type: str
@@ -144,7 +155,7 @@ class Variable:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class ProceduralBlock:
     kind: str
     body : 'Block'
@@ -152,7 +163,7 @@ class ProceduralBlock:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Block:
     kind: str
     blockKind : str
@@ -160,7 +171,7 @@ class Block:
     name: Optional[str] = None
     addr: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class ExpressionStatement:
     kind: str
     expr: List[Union['Assignment', 'BinaryOp', 'UnaryOp', 'NamedValue', 'Conversion']]
@@ -170,130 +181,474 @@ class ExpressionStatement:
 
 ##################################################################################################################################################################
 ### Below are methods to traverse the JSON tree and transform it in Dataclasses
-### The global variables are used to measure metrics in the input file
-
-# Number of AND gates in input file
-num_ands = 0
-# Number of OR gates in input file
-num_ors = 0
-# Number of NOT gates in input file
-num_nots = 0
-# Number of XOR gates in input file
-num_xors = 0
-# Number of inputs in input file
-num_inputs = 0
-# Number of outputs in input file
-num_outputs = 0
-# Number of local variables in input file
-num_locals = 0
-# List of names to distinguish between local variables and inputs/outputs
-inout_names = []
-
-def from_dict(data: Dict[str, Any]) -> ASTNode:
-    global num_ands
-    global num_ors
-    global num_nots
-    global num_xors
-    global num_inputs
-    global num_outputs
-    global num_locals
-    global inout_names
-
-    if isinstance(data, list):
-        return [from_dict(item) for item in data]
-
-    if isinstance(data, dict):
-        kind = data.get('kind', None)
-        common_fields = {
-            'name': data.get('name'),
-            'kind': kind,
-            'addr': data.get('addr')
-        }
-
-        if kind == 'Assignment':
-            return Assignment(type=data['type'], left=from_dict(data['left']), right=from_dict(data['right']), isNonBlocking=data['isNonBlocking'], **common_fields)
-        elif kind == 'BinaryOp':
-            if data['op'] == 'BinaryAnd':
-                num_ands += 1
-            elif data['op'] == 'BinaryOr':
-                num_ors += 1
-            elif data['op'] == 'BinaryXor':
-                num_xors += 1
-            return BinaryOp(type=data['type'], op=data['op'], left=from_dict(data['left']), right=from_dict(data['right']), **common_fields)
-        elif kind == 'UnaryOp':
-            num_nots += 1
-            return UnaryOp(type=data['type'], op=data['op'], operand=from_dict(data['operand']), **common_fields)
-        elif kind == 'CompilationUnit':
-            return CompilationUnit(**common_fields)
-        elif kind == 'ContinuousAssign':
-            return ContinuousAssign(assignment=from_dict(data['assignment']), **common_fields)
-        elif kind == 'Conversion':
-            if 'constant' in data:
-                return Conversion(type=data['type'], operand=from_dict(data['operand']), constant=data['constant'], **common_fields)
-            else:
-                return Conversion(type=data['type'], operand=from_dict(data['operand']), **common_fields)
-        elif kind == 'Instance':
-            return Instance(body=from_dict(data['body']), **common_fields)
-        elif kind == 'InstanceBody':
-            return InstanceBody(members=from_dict(data['members']), definition=data['definition'], **common_fields)
-        elif kind == 'NamedValue':
-            return NamedValue(type=data['type'], symbol=data['symbol'], constant=data.get('constant', None), **common_fields)
-        elif kind == 'Net':
-            return Net(type=data['type'], netType=from_dict(data['netType']), **common_fields)
-        elif kind == 'NetType':
-            return NetType(type=data['type'], **common_fields)
-        elif kind == 'Port':
-            if(data['direction']=='Out'):
-                inout_names.append(data['name'])
-                num_outputs += 1
-            elif(data['direction']=='In'): 
-                inout_names.append(data['name'])
-                num_inputs += 1
-            return Port(type=data['type'], direction=data['direction'], internalSymbol=data['internalSymbol'], **common_fields)
-        elif kind == 'PrimitiveInstance':
-            return PrimitiveInstance(primitiveType=data['primitiveType'], ports=from_dict(data['ports']), **common_fields)
-        elif kind == 'Root':
-            return Root(members=from_dict(data['members']), **common_fields)
-        elif kind == 'Variable':
-            if(data['name'] not in inout_names): num_locals += 1
-            return Variable(type=data['type'], lifetime=data['lifetime'], **common_fields)
-        elif kind == 'ProceduralBlock':
-            return ProceduralBlock(body=from_dict(data['body']), procedureKind=data['procedureKind'], **common_fields)
-        elif kind == 'Block':
-            return Block(blockKind=data['blockKind'], body=from_dict(data['body']), **common_fields)
-        elif kind == 'ExpressionStatement':
-            return ExpressionStatement(expr=from_dict(data['expr']), **common_fields)
-        elif kind == "List":
-            return [from_dict(item) for item in data['list']]
-        elif kind == "IntegerLiteral":
-            return IntegerLiteral(type=data['type'], value=data['value'], constant=data['constant'], **common_fields)
+### The metrics of the input file are measured in a ConversionContext, one for each conversion,
+### so that several files can be converted at the same time (e.g. by a thread pool or a long-lived worker).
+
+# Side table of the slang symbols ("1234567890 n2997") used by the compact AST: each symbol string is stored once
+# and the nodes (NamedValue.symbol, Port.internalSymbol) only keep its integer id.
+class SymbolTable:
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    # id of a symbol, a new one is assigned the first time the symbol is met
+    def id(self, symbol: str) -> int:
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.ids[symbol] = len(self.names)
+            self.names.append(symbol)
+        return symbol_id
+
+    def name(self, symbol_id: int) -> str:
+        return self.names[symbol_id]
+
+# State of the conversion of one file, available as root.context once the conversion is over
+class ConversionContext:
+
+    def __init__(self, compact: bool = False):
+        # Number of AND gates in input file
+        self.num_ands = 0
+        # Number of OR gates in input file
+        self.num_ors = 0
+        # Number of NOT gates in input file
+        self.num_nots = 0
+        # Number of XOR gates in input file
+        self.num_xors = 0
+        # Number of inputs in input file
+        self.num_inputs = 0
+        # Number of outputs in input file
+        self.num_outputs = 0
+        # Number of local variables in input file
+        self.num_locals = 0
+        # List of names to distinguish between local variables and inputs/outputs
+        self.inout_names = []
+        # Symbols of the file in compact mode, None if the nodes keep the symbol strings
+        self.symbol_table: Optional[SymbolTable] = SymbolTable() if compact else None
+
+    # Symbol stored in a node during the conversion
+    def node_symbol(self, symbol: str) -> Union[str, int]:
+        if self.symbol_table is None:
+            return symbol
+        return self.symbol_table.id(symbol)
+
+    # Symbol string of a node, whatever the mode of the conversion
+    def symbol_name(self, symbol: Union[str, int]) -> str:
+        if isinstance(symbol, int):
+            return self.symbol_table.name(symbol)
+        return symbol
+
+    # Methods updating the metrics of the input file, called when a node of the corresponding kind is met
+    def count_binary_op(self, data: Dict[str, Any]):
+        if data['op'] == 'BinaryAnd':
+            self.num_ands += 1
+        elif data['op'] == 'BinaryOr':
+            self.num_ors += 1
+        elif data['op'] == 'BinaryXor':
+            self.num_xors += 1
+
+    def count_unary_op(self, data: Dict[str, Any]):
+        self.num_nots += 1
+
+    def count_port(self, data: Dict[str, Any]):
+        if(data['direction']=='Out'):
+            self.inout_names.append(data['name'])
+            self.num_outputs += 1
+        elif(data['direction']=='In'): 
+            self.inout_names.append(data['name'])
+            self.num_inputs += 1
+
+    def count_variable(self, data: Dict[str, Any]):
+        if(data['name'] not in self.inout_names): self.num_locals += 1
+
+COUNTERS = {
+    'BinaryOp': ConversionContext.count_binary_op,
+    'UnaryOp': ConversionContext.count_unary_op,
+    'Port': ConversionContext.count_port,
+    'Variable': ConversionContext.count_variable,
+}
+
+# Dispatch table of the conversion. For each kind:
+# - the fields converted to dataclasses (children of the node)
+# - the function building the dataclass from the JSON dict, the list of its converted children and the ConversionContext
+# The kind, type and op strings repeat on every node and are interned, so that all the nodes share one copy.
+KINDS = {
+    'Assignment': (('left', 'right'),
+        lambda d, c, x: Assignment(kind=intern(d['kind']), type=intern(d['type']), left=c[0], right=c[1], isNonBlocking=d['isNonBlocking'], name=d.get('name'), addr=d.get('addr'))),
+    'BinaryOp': (('left', 'right'),
+        lambda d, c, x: BinaryOp(kind=intern(d['kind']), type=intern(d['type']), op=intern(d['op']), left=c[0], right=c[1], name=d.get('name'), addr=d.get('addr'))),
+    'UnaryOp': (('operand',),
+        lambda d, c, x: UnaryOp(kind=intern(d['kind']), type=intern(d['type']), op=intern(d['op']), operand=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'CompilationUnit': ((),
+        lambda d, c, x: CompilationUnit(kind=intern(d['kind']), name=d.get('name'), addr=d.get('addr'))),
+    'ContinuousAssign': (('assignment',),
+        lambda d, c, x: ContinuousAssign(kind=intern(d['kind']), assignment=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'Conversion': (('operand',),
+        lambda d, c, x: Conversion(kind=intern(d['kind']), type=intern(d['type']), operand=c[0], constant=d.get('constant'), name=d.get('name'), addr=d.get('addr'))),
+    'Instance': (('body',),
+        lambda d, c, x: Instance(kind=intern(d['kind']), body=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'InstanceBody': (('members',),
+        lambda d, c, x: InstanceBody(kind=intern(d['kind']), members=c[0], definition=d['definition'], name=d.get('name'), addr=d.get('addr'))),
+    'NamedValue': ((),
+        lambda d, c, x: NamedValue(kind=intern(d['kind']), type=intern(d['type']), symbol=x.node_symbol(d['symbol']), constant=d.get('constant'), name=d.get('name'), addr=d.get('addr'))),
+    'Net': (('netType',),
+        lambda d, c, x: Net(kind=intern(d['kind']), type=intern(d['type']), netType=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'NetType': ((),
+        lambda d, c, x: NetType(kind=intern(d['kind']), type=intern(d['type']), name=d.get('name'), addr=d.get('addr'))),
+    'Port': ((),
+        lambda d, c, x: Port(kind=intern(d['kind']), type=intern(d['type']), direction=d['direction'], internalSymbol=x.node_symbol(d['internalSymbol']), name=d.get('name'), addr=d.get('addr'))),
+    'PrimitiveInstance': (('ports',),
+        lambda d, c, x: PrimitiveInstance(kind=intern(d['kind']), primitiveType=d['primitiveType'], ports=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'Root': (('members',),
+        lambda d, c, x: Root(kind=intern(d['kind']), members=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'Variable': ((),
+        lambda d, c, x: Variable(kind=intern(d['kind']), type=intern(d['type']), lifetime=d['lifetime'], name=d.get('name'), addr=d.get('addr'))),
+    'ProceduralBlock': (('body',),
+        lambda d, c, x: ProceduralBlock(kind=intern(d['kind']), body=c[0], procedureKind=d['procedureKind'], name=d.get('name'), addr=d.get('addr'))),
+    'Block': (('body',),
+        lambda d, c, x: Block(kind=intern(d['kind']), blockKind=d['blockKind'], body=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'ExpressionStatement': (('expr',),
+        lambda d, c, x: ExpressionStatement(kind=intern(d['kind']), expr=c[0], name=d.get('name'), addr=d.get('addr'))),
+    'IntegerLiteral': ((),
+        lambda d, c, x: IntegerLiteral(kind=intern(d['kind']), type=intern(d['type']), value=d['value'], constant=d['constant'], name=d.get('name'), addr=d.get('addr'))),
+    # a List is replaced by the list of its converted items
+    'List': (('list',),
+        lambda d, c, x: c[0]),
+}
+
+# Convert a JSON value (dict, list or plain value) to dataclasses.
+# The tree is walked with an explicit stack, so the depth of the expressions is not bounded by the recursion limit.
+# Values that are not dicts or lists (e.g. nodes already converted by the streaming reader) are left untouched.
+# The metrics are measured in the given context, a Root keeps it as root.context.
+def from_dict(data: Dict[str, Any], context: Optional[ConversionContext] = None) -> ASTNode:
+    if context is None:
+        context = ConversionContext()
+    # Values still to visit. A (build, dict, number of children) marker is pushed below the children of a node
+    # and builds it once all of them are on the results stack (build is None for lists).
+    work = [data]
+    results = []
+
+    while work:
+        item = work.pop()
+        item_type = type(item)
+
+        if item_type is tuple:
+            build, node_data, count = item
+            children = results[-count:] if count else []
+            del results[len(results) - count:]
+            results.append(children if build is None else build(node_data, children, context))
+
+        elif item_type is dict:
+            kind = item.get('kind', None)
+            try:
+                child_fields, build = KINDS[kind]
+            except KeyError:
+                raise ValueError(f"Unknown kind: {kind}") from None
+            # metrics are updated in the same order as the JSON
+            if kind in COUNTERS:
+                COUNTERS[kind](context, item)
+            # leaves are built right away
+            if not child_fields:
+                results.append(build(item, (), context))
+                continue
+            work.append((build, item, len(child_fields)))
+            for field in reversed(child_fields):
+                work.append(item[field])
+
+        elif item_type is list:
+            work.append((None, None, len(item)))
+            work.extend(reversed(item))
+
         else:
-            raise ValueError(f"Unknown kind: {kind}")
-    return data
+            results.append(item)
+
+    result = results[0]
+    if type(result) is Root:
+        result.context = context
+    return result
 
 ##################################################################################################################################################################
 
-# function that takes as input a JSON string and returns a Root dataclass
-def json_to_dataclass(json_data: str) -> Root:
-    global num_ands
-    global num_ors
-    global num_nots
-    global num_xors
-    global num_inputs
-    global num_outputs
-    global num_locals
-    global inout_names
-    num_ands = 0
-    num_ors = 0
-    num_nots = 0
-    num_xors = 0
-    num_inputs = 0
-    num_outputs = 0
-    num_locals = 0
-    inout_names = []
-    # Load the JSON data
-    data = json.loads(json_data)
-    return from_dict(data)
+# The dataclass tree has no reference cycles, during the conversion the cyclic garbage collector
+# would only rescan the growing tree over and over, so it is paused.
+# The collector is shared by the whole process: it is enabled again when the last of the conversions running at the same time ends.
+_gc_lock = Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+@contextmanager
+def paused_gc():
+    global _gc_pauses
+    global _gc_was_enabled
+    with _gc_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
+
+##################################################################################################################################################################
+### Decoding of the JSON values.
+### The decoder of the json module recurses once per nesting level, so an expression nested a few thousand times
+### (e.g. a long chain of XORs written inline) raises RecursionError. Such values are decoded again by
+### iterative_raw_decode, which keeps the open objects and arrays on an explicit stack.
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_number = json.scanner.NUMBER_RE
+_constants = {'t': ('true', True), 'f': ('false', False), 'n': ('null', None)}
+_decoder = json.JSONDecoder()
+
+# Read the key of an object member and the ':' after it, returns the key and the position of its value
+def _decode_key(s: str, idx: int):
+    idx = _whitespace.match(s, idx).end()
+    if s[idx:idx + 1] != '"':
+        raise json.JSONDecodeError("Expecting property name enclosed in double quotes", s, idx)
+    key, idx = json.decoder.scanstring(s, idx + 1)
+    idx = _whitespace.match(s, idx).end()
+    if s[idx:idx + 1] != ':':
+        raise json.JSONDecodeError("Expecting ':' delimiter", s, idx)
+    return intern(key), idx + 1
+
+# Same as json.JSONDecoder.raw_decode, without recursion.
+# Returns the value starting at idx and the position after it, raises JSONDecodeError also when the value is truncated.
+def iterative_raw_decode(s: str, idx: int = 0):
+    # the open objects and arrays, each with the key of the member being read (None for arrays)
+    stack = []
+    while True:
+        # read a value: a scalar, an empty container or the opening of a container
+        idx = _whitespace.match(s, idx).end()
+        char = s[idx:idx + 1]
+        if char == '"':
+            value, idx = json.decoder.scanstring(s, idx + 1)
+        elif char == '{' or char == '[':
+            after = _whitespace.match(s, idx + 1).end()
+            if s[after:after + 1] == ('}' if char == '{' else ']'):
+                value, idx = ({} if char == '{' else []), after + 1
+            elif char == '{':
+                key, idx = _decode_key(s, after)
+                stack.append(({}, key))
+                continue
+            else:
+                stack.append(([], None))
+                idx = after
+                continue
+        elif char in _constants:
+            word, value = _constants[char]
+            if not s.startswith(word, idx):
+                raise json.JSONDecodeError("Expecting value", s, idx)
+            idx += len(word)
+        else:
+            match = _number.match(s, idx)
+            if match is None:
+                raise json.JSONDecodeError("Expecting value", s, idx)
+            integer, fraction, exponent = match.groups()
+            value = float(integer + (fraction or '') + (exponent or '')) if fraction or exponent else int(integer)
+            idx = match.end()
+
+        # store the value in its container, closing the containers that end after it
+        while stack:
+            container, key = stack[-1]
+            if key is None:
+                container.append(value)
+            else:
+                container[key] = value
+            idx = _whitespace.match(s, idx).end()
+            char = s[idx:idx + 1]
+            if char == ',':
+                if key is not None:
+                    key, idx = _decode_key(s, idx + 1)
+                    stack[-1] = (container, key)
+                else:
+                    idx += 1
+                break
+            if char != (']' if key is None else '}'):
+                raise json.JSONDecodeError("Expecting ',' delimiter", s, idx)
+            stack.pop()
+            value = container
+            idx += 1
+        else:
+            return value, idx
+
+# Decode the JSON value starting at idx with the decoder of the json module, falling back to iterative_raw_decode
+# for the values too deep for it.
+def raw_decode(s: str, idx: int = 0):
+    try:
+        return _decoder.raw_decode(s, idx)
+    except RecursionError:
+        return iterative_raw_decode(s, idx)
+
+# function that takes as input a JSON string and returns a Root dataclass.
+# Everything after the end of the root object (e.g. what slang prints after the AST) is ignored.
+def json_to_dataclass(json_data: Union[str, bytes], compact: bool = False) -> Root:
+    context = ConversionContext(compact)
+    if isinstance(json_data, (bytes, bytearray)):
+        json_data = json_data.decode('utf-8')
+    with paused_gc():
+        # Load the JSON data
+        data, _ = raw_decode(json_data, _whitespace.match(json_data).end())
+        return from_dict(data, context)
+
+##################################################################################################################################################################
+### Streaming conversion: the JSON is read in chunks and the dataclass tree is built while reading.
+### Only the values of the keys in STREAMED_KEYS (the members lists and the bodies containing them) are walked
+### piece by piece, every other value (e.g. a whole ContinuousAssign) is decoded as a small dict and converted right away.
+### This way the dict tree of the whole document is never held in memory.
+
+# For each kind, the key whose value is read incrementally instead of being decoded at once
+STREAMED_KEYS = {'Root': 'members', 'Instance': 'body', 'InstanceBody': 'members'}
+# Kinds whose streamed list contains objects that must be read incrementally too (the Instances of the Root)
+NESTED_STREAMED_KINDS = ('Root',)
+# Number of characters read from the file or pipe each time the buffer runs out
+STREAM_CHUNK_SIZE = 1 << 16
+
+class JSONStreamReader:
+
+    # When lower is given, it is called with each member of an InstanceBody as soon as the member is converted,
+    # then with the InstanceBody itself. The members are not kept in the tree, so that a frontend can consume them
+    # one at a time (see frontend/fused_ir_gen.py).
+    def __init__(self, stream: IO, context: ConversionContext, lower: Optional[Callable[[ASTNode], None]] = None, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.stream = stream
+        self.context = context
+        self.lower = lower
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        # pipes and files opened in binary mode give bytes, multi-byte characters may be split between two chunks
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    # Append a new chunk of at least size characters to the buffer, dropping the part already consumed.
+    # Returns False when the stream is over.
+    def _fill(self, size: int = 0) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(max(size, self.chunk_size))
+        if isinstance(chunk, bytes):
+            chunk = self.utf8.decode(chunk, final=not chunk)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    # Skip the whitespaces and return the next character without consuming it ('' at the end of the stream)
+    def _peek(self) -> str:
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in the JSON stream, found '{found}'")
+        self.pos += 1
+
+    # Decode a complete JSON value starting at the current position.
+    # A value ending exactly at the end of the buffer may be a truncated number, so it is accepted only at the end of the stream.
+    # A truncated value is decoded again from its start, the buffer is doubled each time so that a value spanning
+    # many chunks (e.g. a very long expression) is not decoded once per chunk.
+    def _decode(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(len(self.buffer) - self.pos)
+
+    # Read the next value, walking objects and arrays incrementally
+    def read_value(self, nested: bool = True) -> Any:
+        char = self._peek()
+        if char == '{':
+            return self._read_object()
+        if char == '[':
+            return self._read_array(nested)
+        return self._decode()
+
+    def _read_object(self) -> Any:
+        self._expect('{')
+        data = {}
+        if self._peek() == '}':
+            self.pos += 1
+            return from_dict(data, self.context)
+        while True:
+            key = self._decode()
+            self._expect(':')
+            # the kind always comes before the children of a node
+            kind = data.get('kind')
+            if key == STREAMED_KEYS.get(kind):
+                data[key] = self.read_value(kind in NESTED_STREAMED_KINDS)
+            else:
+                data[key] = self._decode()
+            char = self._peek()
+            self.pos += 1
+            if char == '}':
+                break
+            if char != ',':
+                raise ValueError(f"Expected ',' or '}}' in the JSON stream, found '{char}'")
+        # nested streamed values are already dataclasses, from_dict leaves them untouched
+        node = from_dict(data, self.context)
+        if self.lower is not None and type(node) is InstanceBody:
+            self.lower(node)
+        return node
+
+    # Read a list converting one item at a time. Not nested items (the members of an InstanceBody) are decoded at once.
+    def _read_array(self, nested: bool) -> list:
+        self._expect('[')
+        items = []
+        if self._peek() == ']':
+            self.pos += 1
+            return items
+        while True:
+            if nested:
+                items.append(self.read_value())
+            else:
+                item = from_dict(self._decode(), self.context)
+                if self.lower is None:
+                    items.append(item)
+                else:
+                    self.lower(item)
+            char = self._peek()
+            self.pos += 1
+            if char == ']':
+                break
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in the JSON stream, found '{char}'")
+        return items
+
+# function that takes as input a file or a pipe containing the JSON and returns a Root dataclass.
+# Everything after the end of the root object is ignored.
+def json_stream_to_dataclass(stream: IO, compact: bool = False) -> Root:
+    with paused_gc():
+        return JSONStreamReader(stream, ConversionContext(compact)).read_value()
+
+# function that takes the slang output as bytes, as the path of a file or as an open file (or pipe) and returns a Root dataclass.
+# The input is never modified, with stream=False the whole document is loaded before the conversion.
+def load_dataclass(source: Union[bytes, str, os.PathLike, IO], stream: bool = True, compact: bool = False) -> Root:
+    if isinstance(source, (bytes, bytearray)):
+        if not stream:
+            return json_to_dataclass(source, compact)
+        source = io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            return load_dataclass(file, stream, compact)
+    if stream:
+        return json_stream_to_dataclass(source, compact)
+    return json_to_dataclass(source.read(), compact)
 
 ##################################################################################################################################################################
 
@@ -302,95 +657,102 @@ def read_json_file(file_path: str) -> str:
         return file.read()
 
 ##################################################################################################################################################################
-# This function takes a Root dataclass and returns a formatted string representation of the AST
-def format_root(root: Root, indent: int = 0) -> str:
-    return format_ast(root, indent)
-
-# This recursive function takes an ASTNode and returns a formatted string representation of the AST
-def format_ast(ast: ASTNode, indent: int = 0) -> str:
-    lines = []
-    indent_str = " " * indent
-
-    def append_info(prefix: str, obj: Optional[ASTNode]):
-        if obj:
-            if hasattr(obj, 'name') and obj.name:
-                lines.append(f"{indent_str}{prefix} Name: {obj.name}")
-            if hasattr(obj, 'type'):
-                lines.append(f"{indent_str}{prefix} Type: {obj.type}")
-            if hasattr(obj, 'symbol'):
-                lines.append(f"{indent_str}{prefix} Symbol: {obj.symbol}")
-            if hasattr(obj, 'value'):
-                if hasattr(obj, 'selector'):
-                    lines.append(f"{indent_str}{prefix} Value: {obj.value.symbol}")
-                    if isinstance(obj.selector, NamedValue):
-                        lines.append(f"{indent_str}{prefix} Selector:")
-                        lines.extend(format_ast(obj.selector, indent + 4))
-                    elif isinstance(obj.selector, BinaryOp):
-                        lines.append(f"{indent_str}{prefix} Selector:")
-                        lines.extend(format_ast(obj.selector, indent + 4))
-                    elif isinstance(obj.selector, UnaryOp):
-                        lines.append(f"{indent_str}{prefix} Selector:")
-                        lines.extend(format_ast(obj.selector, indent + 4))
+# This function takes a Root dataclass and returns the lines of a formatted string representation of the AST
+def format_root(root: Root, indent: int = 0) -> Iterator[str]:
+    return format_ast(root, indent, root.context)
+
+# This function writes the formatted AST to a file one line at a time
+def write_ast(root: Root, file: IO):
+    separator = ""
+    for line in format_root(root):
+        file.write(separator)
+        file.write(line)
+        separator = "\n"
+
+# This generator takes an ASTNode and yields the lines of a formatted string representation of the AST.
+# The tree is walked with an explicit stack holding the nodes still to format, as (node, indent), and the lines
+# that come after them. The symbols of a compact AST are resolved with the context of its conversion.
+def format_ast(ast: ASTNode, indent: int = 0, context: Optional[ConversionContext] = None) -> Iterator[str]:
+    if context is None:
+        context = ConversionContext()
+    work = [(ast, indent)]
+
+    while work:
+        item = work.pop()
+        if isinstance(item, str):
+            yield item
+            continue
+
+        ast, indent = item
+        indent_str = " " * indent
+
+        if isinstance(ast, InstanceBody):
+            yield f"{indent_str}{ast.kind} Name: {ast.name if hasattr(ast, 'name') else 'Unknown'}"
+        elif hasattr(ast, 'kind'):
+            yield f"{indent_str}{ast.kind}"
+
+        # children are pushed in reverse order
+        if isinstance(ast, Root):
+            work.extend((member, indent + 2) for member in reversed(ast.members))
+        elif isinstance(ast, Instance):
+            work.append((ast.body, indent + 2))
+        elif isinstance(ast, InstanceBody):
+            work.extend((member, indent + 2) for member in reversed(ast.members))
+        elif isinstance(ast, PrimitiveInstance):
+            work.extend((port, indent + 2) for port in reversed(ast.ports))
+        elif isinstance(ast, ContinuousAssign):
+            work.append((ast.assignment, indent + 2))
+        elif isinstance(ast, Conversion):
+            yield indent_str + "  Type: " + ast.type
+            work.append((ast.operand, indent + 2))
+        elif isinstance(ast, Assignment):
+            work.append((ast.right, indent + 2))
+            work.append((ast.left, indent + 2))
+        elif isinstance(ast, BinaryOp):
+            yield indent_str + "    Operator: " + ast.op
+            yield indent_str + "    Left Operand:"
+            work.append((ast.right, indent + 4))
+            work.append(indent_str + "    Right Operand:")
+            work.append((ast.left, indent + 4))
+        elif isinstance(ast, UnaryOp):
+            yield indent_str + "    Operator: " + ast.op
+            yield indent_str + "    Operand:"
+            work.append((ast.operand, indent + 4))
+        elif isinstance(ast, Port):
+            direction = ast.direction if hasattr(ast, 'direction') else "Unknown"
+            yield indent_str + f"  Port: {ast.name} Direction: {direction}"
+        elif isinstance(ast, ProceduralBlock):
+            yield indent_str + f"  ProcedureKind: {ast.procedureKind}"
+            work.append((ast.body, indent + 2))
+        elif isinstance(ast, Block):
+            yield indent_str + f"  BlockKind: {ast.blockKind}"
+            work.append((ast.body, indent + 2))
+        elif isinstance(ast, ExpressionStatement):
+            work.append((ast.expr, indent + 2))
+        elif isinstance(ast, list):
+            work.extend((item, indent) for item in reversed(ast))
+        elif isinstance(ast, Net):
+            yield indent_str + f"  NetType: {ast.netType.type}" + f"  Name: {ast.name}"
+        elif isinstance(ast, IntegerLiteral):
+            yield indent_str + f"  Value: {ast.value}"
+        elif ast:
+            prefix = " "
+            if hasattr(ast, 'name') and ast.name:
+                yield f"{indent_str}{prefix} Name: {ast.name}"
+            if hasattr(ast, 'type'):
+                yield f"{indent_str}{prefix} Type: {ast.type}"
+            if hasattr(ast, 'symbol'):
+                yield f"{indent_str}{prefix} Symbol: {context.symbol_name(ast.symbol)}"
+            if hasattr(ast, 'value'):
+                if hasattr(ast, 'selector'):
+                    yield f"{indent_str}{prefix} Value: {ast.value.symbol}"
+                    if isinstance(ast.selector, (NamedValue, BinaryOp, UnaryOp)):
+                        yield f"{indent_str}{prefix} Selector:"
+                        work.append((ast.selector, indent + 4))
                 else:
-                    lines.append(f"{indent_str}{prefix} Value: {obj.value}")
-            elif hasattr(obj, 'constant') and obj.constant:
-                lines.append(f"{indent_str}{prefix} Constant: {obj.constant}")
-
-    if isinstance(ast, InstanceBody):
-        lines.append(f"{indent_str}{ast.kind} Name: {ast.name if hasattr(ast, 'name') else 'Unknown'}")
-    elif hasattr(ast, 'kind'):
-        lines.append(f"{indent_str}{ast.kind}")
-    if isinstance(ast, Root):
-        for member in ast.members:
-            lines.extend(format_ast(member, indent + 2))
-    elif isinstance(ast, Instance):
-        lines.extend(format_ast(ast.body, indent + 2))
-    elif isinstance(ast, InstanceBody):
-        for member in ast.members:
-            lines.extend(format_ast(member, indent + 2))
-    elif isinstance(ast, PrimitiveInstance):
-        for port in ast.ports:
-            lines.extend(format_ast(port, indent + 2))
-    elif isinstance(ast, ContinuousAssign):
-        lines.extend(format_ast(ast.assignment, indent + 2))
-    elif isinstance(ast, Conversion):
-        lines.append(indent_str + "  Type: " + ast.type)
-        lines.extend(format_ast(ast.operand, indent + 2))
-    elif isinstance(ast, Assignment):
-        lines.extend(format_ast(ast.left, indent + 2))
-        lines.extend(format_ast(ast.right, indent + 2))
-    elif isinstance(ast, BinaryOp):
-        lines.append(indent_str + "    Operator: " + ast.op)
-        lines.append(indent_str + "    Left Operand:")
-        lines.extend(format_ast(ast.left, indent + 4))
-        lines.append(indent_str + "    Right Operand:")
-        lines.extend(format_ast(ast.right, indent + 4))
-    elif isinstance(ast, UnaryOp):
-        lines.append(indent_str + "    Operator: " + ast.op)
-        lines.append(indent_str + "    Operand:")
-        lines.extend(format_ast(ast.operand, indent + 4))
-    elif isinstance(ast, Port):
-        direction = ast.direction if hasattr(ast, 'direction') else "Unknown"
-        lines.append(indent_str + f"  Port: {ast.name} Direction: {direction}")
-    elif isinstance(ast, ProceduralBlock):
-        lines.append(indent_str + f"  ProcedureKind: {ast.procedureKind}")
-        lines.extend(format_ast(ast.body, indent + 2))
-    elif isinstance(ast, Block):
-        lines.append(indent_str + f"  BlockKind: {ast.blockKind}")
-        lines.extend(format_ast(ast.body, indent + 2))
-    elif isinstance(ast, ExpressionStatement):
-        lines.extend(format_ast(ast.expr, indent + 2))
-    elif isinstance(ast, list):
-        for item in ast:
-            lines.extend(format_ast(item, indent))
-    elif isinstance(ast, Net):
-        lines.append(indent_str + f"  NetType: {ast.netType.type}" + f"  Name: {ast.name}")
-    elif isinstance(ast, IntegerLiteral):
-        lines.append(indent_str + f"  Value: {ast.value}")
-    else:
-        append_info(" ", ast)
-    
-    return lines
+                    yield f"{indent_str}{prefix} Value: {ast.value}"
+            elif hasattr(ast, 'constant') and ast.constant:
+                yield f"{indent_str}{prefix} Constant: {ast.constant}"
 
 ##################################################################################################################################################################
 
@@ -0,0 +1,219 @@
+import copyreg
+import dataclasses
+import hashlib
+import os
+import pickle
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from operator import attrgetter
+from typing import Any, Dict, Iterator, Optional
+
+import backend.JSON_to_DataClasses as JSON_to_DataClasses
+
+##################################################################################################################################################################
+### On-disk cache of the dataclass ASTs.
+### The same SystemVerilog files are compiled over and over (CI, design-space sweeps), so the Root tree built from
+### a source is pickled together with its context (the metrics of the input file and the symbols of the compact AST). The entries are content-addressed: the key is a hash
+### of the source, of the frontend (the verilog_to_json executable and the modules building the tree) and of the conversion mode.
+### A hit skips slang and the JSON completely. The least recently used entries are evicted when the cache exceeds max_size.
+### The ASTs specialized on constant inputs (see frontend/constant_propagation.py) are cached too, by source and constants.
+
+# Directory of the cache, can be moved with the QUANTUMIR_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get('QUANTUMIR_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'quantumir', 'ast'))
+# Maximum size of the cache in bytes, can be changed with the QUANTUMIR_CACHE_SIZE environment variable
+CACHE_SIZE = int(os.environ.get('QUANTUMIR_CACHE_SIZE', 1 << 30))
+# Executable built with cmake that dumps the slang AST to output.json in its working directory
+VERILOG_TO_JSON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build', 'verilog_to_json')
+# Files with these suffixes are compiled through slang (and the cache), everything else is read as the JSON produced by slang
+VERILOG_SUFFIXES = ('.sv', '.v')
+# Suffix of the cache entries
+ENTRY_SUFFIX = '.ast'
+# Ways of compiling a SystemVerilog file: the verilog_to_json executable and its JSON, or slang in-process through pyslang
+VERILOG_FRONTENDS = ('binary', 'pyslang')
+
+# The nodes are pickled as (class, field values): attrgetter collects the slots in C, which is much faster than
+# the __getstate__ generated for slotted dataclasses, and the entries are about half the size
+def node_reducer(cls):
+    fields = attrgetter(*cls.__slots__)
+    return lambda node: (cls, fields(node))
+
+DISPATCH_TABLE = dict(copyreg.dispatch_table)
+DISPATCH_TABLE.update((cls, node_reducer(cls)) for cls in vars(JSON_to_DataClasses).values()
+                      if isinstance(cls, type) and dataclasses.is_dataclass(cls))
+
+# True if the path is a SystemVerilog source instead of the JSON produced by slang
+def is_verilog(path) -> bool:
+    return isinstance(path, (str, os.PathLike)) and os.fspath(path).endswith(VERILOG_SUFFIXES)
+
+# Digests of the files already hashed by this process, by (path, size, modification time)
+_file_digests: Dict[Any, str] = {}
+
+def file_digest(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 'none'
+    stamp = (path, stat.st_size, stat.st_mtime_ns)
+    if stamp not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        _file_digests[stamp] = digest.hexdigest()
+    return _file_digests[stamp]
+
+# Version of the frontend: a change of the slang executable (or of pyslang), of the dataclasses or of the cache format invalidates all the entries
+def frontend_version(frontend: str = 'binary', executable: str = VERILOG_TO_JSON) -> str:
+    if frontend == 'pyslang':
+        import backend.pyslang_frontend as pyslang_frontend
+        slang = f"pyslang-{pyslang_frontend.pyslang_version()}:{file_digest(pyslang_frontend.__file__)}"
+    else:
+        slang = file_digest(executable)
+    return ":".join([slang] + [file_digest(path) for path in (JSON_to_DataClasses.__file__, __file__)])
+
+# Run slang on a SystemVerilog file in a temporary directory, gives the path of the JSON it produced
+@contextmanager
+def slang_json(source_path: str, executable: str = VERILOG_TO_JSON) -> Iterator[str]:
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.run([executable, os.path.abspath(source_path)], cwd=workdir, stdout=subprocess.DEVNULL, check=True)
+        yield os.path.join(workdir, 'output.json')
+
+# Run slang on a SystemVerilog file and convert its output
+def verilog_to_dataclass(source_path: str, stream: bool = True, compact: bool = False, executable: str = VERILOG_TO_JSON,
+                         frontend: str = 'binary') -> JSON_to_DataClasses.Root:
+    if frontend == 'pyslang':
+        import backend.pyslang_frontend as pyslang_frontend
+        return pyslang_frontend.pyslang_to_dataclass(source_path, compact)
+    with slang_json(source_path, executable) as json_path:
+        return JSON_to_DataClasses.load_dataclass(json_path, stream, compact)
+
+class ASTCache():
+
+    def __init__(self, directory: str = CACHE_DIR, max_size: int = CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    # Key of the AST of a source file
+    def key(self, source_path: str, compact: bool = False, frontend: str = 'binary') -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{frontend_version(frontend)}:{int(compact)}:".encode())
+        with open(source_path, 'rb') as file:
+            digest.update(file.read())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    # Root of a cached AST, None on a miss. On a hit the entry becomes the most recently used one.
+    def get(self, key: str) -> Optional[JSON_to_DataClasses.Root]:
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file, JSON_to_DataClasses.paused_gc():
+                root = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            # Truncated or stale entry, it is simply rebuilt
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return root
+
+    # Store the AST just converted
+    def put(self, key: str, root: JSON_to_DataClasses.Root):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written to a temporary file and renamed, so that parallel compiles never read a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                pickler = pickle.Pickler(file, pickle.HIGHEST_PROTOCOL)
+                pickler.dispatch_table = DISPATCH_TABLE
+                pickler.dump(root)
+            os.replace(temp_path, self.path(key))
+        except RecursionError:
+            # pickle recurses on the tree, expressions too deep for it are simply not cached
+            self.remove(temp_path)
+            return
+        except BaseException:
+            self.remove(temp_path)
+            raise
+        self.evict()
+
+    # Remove the least recently used entries until the cache fits in max_size
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in self.entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    # Remove every entry, returns the number of entries removed
+    def clear(self) -> int:
+        removed = 0
+        for entry in self.entries():
+            removed += self.remove(entry.path)
+        return removed
+
+    # Total size of the entries in bytes
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in self.entries())
+
+    def entries(self):
+        try:
+            with os.scandir(self.directory) as scan:
+                return [entry for entry in scan if entry.name.endswith(ENTRY_SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    # Root of the AST of a SystemVerilog file, slang is only run on a miss
+    def load(self, source_path: str, stream: bool = True, compact: bool = False, frontend: str = 'binary') -> JSON_to_DataClasses.Root:
+        key = self.key(source_path, compact, frontend)
+        root = self.get(key)
+        if root is None:
+            root = verilog_to_dataclass(source_path, stream, compact, frontend=frontend)
+            self.put(key, root)
+        return root
+
+    # Key of the AST of a source file specialized on constant input ports
+    def specialized_key(self, source_path: str, constants: Dict[str, int], compact: bool = False, frontend: str = 'binary',
+                        simplification: bool = True) -> str:
+        import frontend.constant_propagation as constant_propagation
+        digest = hashlib.sha256()
+        digest.update(f"{self.key(source_path, compact, frontend)}:{file_digest(constant_propagation.__file__)}:{int(simplification)}:".encode())
+        digest.update(repr(sorted(constants.items())).encode())
+        return digest.hexdigest()
+
+    # Root of the AST of a SystemVerilog file with its constants propagated (and its operations simplified) and the input
+    # ports in constants fixed.
+    # A sweep over the values of some inputs runs slang once, each specialization is computed once.
+    def load_specialized(self, source_path: str, constants: Dict[str, int], stream: bool = True, compact: bool = False,
+                         frontend: str = 'binary', simplification: bool = True) -> JSON_to_DataClasses.Root:
+        from frontend.constant_propagation import ConstantPropagation
+        key = self.specialized_key(source_path, constants, compact, frontend, simplification)
+        root = self.get(key)
+        if root is None:
+            root = ConstantPropagation(constants, simplification).apply(self.load(source_path, stream, compact, frontend))
+            self.put(key, root)
+        return root
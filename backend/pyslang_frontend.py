@@ -0,0 +1,166 @@
+import os
+from typing import Any, Callable, Dict, Optional
+
+from backend.JSON_to_DataClasses import ASTNode, ConversionContext, Root, from_dict, paused_gc
+
+# pyslang is optional, without it only the verilog_to_json executable can be used
+try:
+    import pyslang
+    from pyslang import ast as slang_ast
+except ImportError:
+    pyslang = None
+
+##################################################################################################################################################################
+### In-process frontend: the SystemVerilog source is elaborated with the slang Python bindings and its AST is walked
+### into the dataclasses, with no verilog_to_json process, no JSON text and no file in between.
+### Each node is described with the same dict the ASTSerializer would write for it and converted by from_dict,
+### so the dataclasses and the metrics of the input file are the ones of the JSON path.
+### The symbols are written as "<address> <name>" like in the JSON, the address being the position of the declaration.
+
+class SlangError(Exception):
+    pass
+
+# Parse and elaborate a SystemVerilog file, the errors reported by slang are raised as a SlangError
+def compile_file(source_path: str) -> 'slang_ast.Compilation':
+    if pyslang is None:
+        raise SlangError("The pyslang frontend needs the slang Python bindings (pip install pyslang)")
+    tree = pyslang.syntax.SyntaxTree.fromFile(os.fspath(source_path))
+    compilation = slang_ast.Compilation()
+    compilation.addSyntaxTree(tree)
+    diagnostics = compilation.getAllDiagnostics()
+    if any(diagnostic.isError() for diagnostic in diagnostics):
+        raise SlangError(pyslang.DiagnosticEngine.reportAll(compilation.sourceManager, diagnostics))
+    return compilation
+
+# Version of the bindings, part of the key of the cached ASTs
+def pyslang_version() -> str:
+    if pyslang is None:
+        return 'none'
+    return getattr(pyslang, '__version__', 'unknown')
+
+# Unique number of a symbol, stands for the address written by the ASTSerializer
+def symbol_address(symbol) -> int:
+    location = symbol.location
+    return (location.buffer.id << 32) | location.offset
+
+def symbol_reference(symbol) -> str:
+    return f"{symbol_address(symbol)} {symbol.name}"
+
+# Dict of an expression or of a statement, as in the JSON.
+# The dicts are created top-down with an explicit stack, so the depth of the expressions is not bounded by the recursion limit.
+# Kinds the ASTSerializer would write with more fields are left with their kind only, from_dict rejects them as in the JSON path.
+def node_dict(node) -> Dict[str, Any]:
+    root = {}
+    work = [(node, root)]
+
+    while work:
+        node, data = work.pop()
+        kind = node.kind.name
+        data['kind'] = kind
+
+        if kind == 'NamedValue':
+            data['type'] = str(node.type)
+            data['symbol'] = symbol_reference(node.symbol)
+        elif kind == 'BinaryOp':
+            data['type'] = str(node.type)
+            data['op'] = node.op.name
+            data['left'] = {}
+            data['right'] = {}
+            work.append((node.right, data['right']))
+            work.append((node.left, data['left']))
+        elif kind == 'UnaryOp':
+            data['type'] = str(node.type)
+            data['op'] = node.op.name
+            data['operand'] = {}
+            work.append((node.operand, data['operand']))
+        elif kind == 'Conversion':
+            data['type'] = str(node.type)
+            data['operand'] = {}
+            if node.constant is not None:
+                data['constant'] = str(node.constant)
+            work.append((node.operand, data['operand']))
+        elif kind == 'IntegerLiteral':
+            data['type'] = str(node.type)
+            data['value'] = str(node.value)
+            data['constant'] = str(node.constant)
+        elif kind == 'Assignment':
+            data['type'] = str(node.type)
+            data['isNonBlocking'] = node.isNonBlocking
+            data['left'] = {}
+            data['right'] = {}
+            work.append((node.right, data['right']))
+            work.append((node.left, data['left']))
+        # statements
+        elif kind == 'Block':
+            data['blockKind'] = node.blockKind.name
+            data['body'] = {}
+            work.append((node.body, data['body']))
+        elif kind == 'List':
+            data['list'] = [{} for _ in node.list]
+            work.extend(zip(node.list, data['list']))
+        elif kind == 'ExpressionStatement':
+            data['expr'] = {}
+            work.append((node.expr, data['expr']))
+
+    return root
+
+# Dict of a member of an InstanceBody
+def member_dict(member) -> Dict[str, Any]:
+    kind = member.kind.name
+    data = {'name': member.name, 'kind': kind, 'addr': symbol_address(member)}
+
+    if kind == 'Port':
+        data['type'] = str(member.type)
+        data['direction'] = member.direction.name
+        data['internalSymbol'] = symbol_reference(member.internalSymbol)
+    elif kind == 'Net':
+        data['type'] = str(member.type)
+        data['netType'] = {'name': member.netType.name, 'kind': 'NetType', 'type': str(member.type)}
+    elif kind == 'Variable':
+        data['type'] = str(member.type)
+        data['lifetime'] = member.lifetime.name
+    elif kind == 'ContinuousAssign':
+        data['assignment'] = node_dict(member.assignment)
+    elif kind == 'ProceduralBlock':
+        data['procedureKind'] = member.procedureKind.name
+        data['body'] = node_dict(member.body)
+
+    return data
+
+# Builds the dataclass AST of a SystemVerilog file.
+# As for JSONStreamReader, when lower is given it is called with each member of an InstanceBody as soon as the member
+# is converted, then with the InstanceBody itself, and the members are not kept in the tree.
+class PyslangReader:
+
+    def __init__(self, source_path: str, context: ConversionContext, lower: Optional[Callable[[ASTNode], None]] = None):
+        self.source_path = source_path
+        self.context = context
+        self.lower = lower
+
+    def read(self) -> Root:
+        compilation = compile_file(self.source_path)
+        members = [from_dict({'name': "", 'kind': 'CompilationUnit'}, self.context)]
+        for instance in compilation.getRoot().topInstances:
+            members.append(self.read_instance(instance))
+        return from_dict({'name': "$root", 'kind': 'Root', 'members': members}, self.context)
+
+    def read_instance(self, instance) -> ASTNode:
+        members = []
+        for member in instance.body:
+            node = from_dict(member_dict(member), self.context)
+            if self.lower is None:
+                members.append(node)
+            else:
+                self.lower(node)
+
+        address = symbol_address(instance)
+        body = from_dict({'name': instance.name, 'kind': 'InstanceBody', 'addr': address, 'members': members,
+                          'definition': f"{address} {instance.name}"}, self.context)
+        if self.lower is not None:
+            self.lower(body)
+        return from_dict({'name': instance.name, 'kind': 'Instance', 'addr': address, 'body': body}, self.context)
+
+# function that takes the path of a SystemVerilog file and returns a Root dataclass
+def pyslang_to_dataclass(source_path: str, compact: bool = False) -> Root:
+    with paused_gc():
+        return PyslangReader(source_path, ConversionContext(compact)).read()
@@ -0,0 +1,144 @@
+from main import QuantumIR
+import backend.ast_cache as ast_cache
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+######### BATCH COMPILATION #########
+# Compile many SystemVerilog files at once. Slang runs in verilog_to_json subprocesses, each one in its own temporary
+# directory, while the JSON already produced is compiled by a pool of Python processes: the C++ parse of a file overlaps
+# with the optimization of the others. The number of slang processes and of Python workers are limited separately.
+# Each file is reported as soon as it is done, a failure only stops its own file.
+
+# Outcome of the compilation of a file
+@dataclass
+class FileResult:
+    source: str
+    error: str | None = None
+    # Seconds spent in slang (0 when the AST was cached) and in the Python pipeline
+    parse_time: float = 0.0
+    compile_time: float = 0.0
+    # Gates and qubits after each iteration of the transformations
+    gateslist: list = field(default_factory=list)
+    qubitlist: list = field(default_factory=list)
+
+# Run verilog_to_json on a file in workdir, returns the path of the JSON
+async def run_slang(source, workdir, executable = ast_cache.VERILOG_TO_JSON):
+    process = await asyncio.create_subprocess_exec(executable, os.path.abspath(source), cwd=workdir,
+                                                   stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(executable)} exited with {process.returncode}: {stderr.decode(errors='replace').strip()}")
+    return os.path.join(workdir, 'output.json')
+
+# Python side of a compilation, runs in a worker process.
+# source is the SystemVerilog file and json_path the output of slang, None when the AST is read from the cache
+# or when slang runs in-process (pyslang). The AST converted from the JSON is added to the cache.
+def compile_job(source, json_path, options):
+    start = time.perf_counter()
+    quantum_ir = QuantumIR(source)
+    quantum_ir.use_cache = options.use_cache
+    quantum_ir.verilog_frontend = options.frontend
+    if options.fused:
+        quantum_ir.run_fused_ir_gen(json_path or source, print_output = False)
+    else:
+        if json_path is None:
+            quantum_ir.run_dataclass(source)
+        else:
+            # the cache holds the AST as converted, before the constant propagation
+            quantum_ir.run_dataclass(json_path, propagate = False)
+            if options.use_cache:
+                cache = ast_cache.ASTCache()
+                cache.put(cache.key(source, quantum_ir.compact_ast, options.frontend), quantum_ir.root)
+            quantum_ir.run_constant_propagation()
+        quantum_ir.run_generate_ir(print_output = False)
+    gateslist = []
+    qubitlist = []
+    quantum_ir.run_transformations(False, gateslist, qubitlist)
+    return time.perf_counter() - start, gateslist, qubitlist
+
+# True if slang has to run for the file, false when the in-process frontend is used or the AST is already cached
+def needs_slang(source, options):
+    if options.frontend != 'binary':
+        return False
+    if options.use_cache and not options.fused:
+        cache = ast_cache.ASTCache()
+        return not os.path.exists(cache.path(cache.key(source, QuantumIR.compact_ast, options.frontend)))
+    return True
+
+async def compile_file(source, options, slang_slots, pool):
+    result = FileResult(source)
+    loop = asyncio.get_running_loop()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            json_path = None
+            if needs_slang(source, options):
+                async with slang_slots:
+                    start = time.perf_counter()
+                    json_path = await run_slang(source, workdir)
+                    result.parse_time = time.perf_counter() - start
+            result.compile_time, result.gateslist, result.qubitlist = await loop.run_in_executor(pool, compile_job, source, json_path, options)
+    except Exception as error:
+        result.error = f"{type(error).__name__}: {error}"
+    return result
+
+def report(result):
+    name = os.path.basename(result.source)
+    if result.error is not None:
+        print(f"{name:45} FAILED  {result.error}", flush=True)
+    else:
+        print(f"{name:45} {result.parse_time:9.3f}s {result.compile_time:9.3f}s {result.gateslist[0]:>10} {result.gateslist[-1]:>10} {result.qubitlist[0]:>8} {result.qubitlist[-1]:>8}", flush=True)
+
+async def run_batch(sources, options):
+    slang_slots = asyncio.Semaphore(options.parsers)
+    print(f"{'File':45} {'Slang':>10} {'Python':>10} {'Gates':>10} {'Opt gates':>10} {'Qubits':>8} {'Opt qub.':>8}", flush=True)
+    results = []
+    with ProcessPoolExecutor(options.workers) as pool:
+        tasks = [asyncio.create_task(compile_file(source, options, slang_slots, pool)) for source in sources]
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            report(result)
+            results.append(result)
+    return results
+
+# Expand the directories given on the command line to the SystemVerilog files they contain
+def collect_sources(sources):
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files += sorted(os.path.join(source, name) for name in os.listdir(source) if ast_cache.is_verilog(name))
+        else:
+            files.append(source)
+    return files
+
+######### MAIN #########
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a batch of SystemVerilog files, overlapping slang with the Python pipeline")
+    parser.add_argument('sources', nargs='*', default=['test-inputs/crypto_benchmarks'], help="files or directories (default: test-inputs/crypto_benchmarks)")
+    parser.add_argument('--parsers', type=int, default=os.cpu_count(), help="maximum number of verilog_to_json processes at once")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of Python worker processes")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help="always run slang, without looking in the AST cache")
+    parser.add_argument('--fused', action='store_true', help="generate the IR while reading the JSON, without the dataclass AST")
+    parser.add_argument('--frontend', choices=ast_cache.VERILOG_FRONTENDS, default=QuantumIR.verilog_frontend,
+                        help="compile with the verilog_to_json executable or in-process with pyslang (in the workers)")
+    options = parser.parse_args()
+    if options.parsers < 1 or options.workers < 1:
+        parser.error("--parsers and --workers must be at least 1")
+
+    sources = collect_sources(options.sources)
+    start = time.perf_counter()
+    results = asyncio.run(run_batch(sources, options))
+    failed = [result for result in results if result.error is not None]
+    print(f"\n{len(results) - len(failed)} of {len(results)} files compiled in {time.perf_counter() - start:.3f}s")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
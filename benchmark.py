@@ -0,0 +1,720 @@
+import backend.JSON_to_DataClasses as JSON_to_DataClasses
+from main import QuantumIR
+from frontend.ir_gen import IRGen, OR_LOWERINGS, bit_width
+from frontend.fused_ir_gen import fused_ir_gen
+from frontend.constant_propagation import ConstantPropagation
+from frontend.common_subexpr_elimination import CommonSubexpressionElimination, OperationInfo, ValueNumbering
+import backend.ast_cache as ast_cache
+import dialect.qubits as qubits
+from xdsl.printer import Printer
+
+import argparse
+import dataclasses
+import gc
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+######### FUNCTIONS #########
+
+# Executable built with cmake that dumps the slang AST to output.json in its working directory
+VERILOG_TO_JSON = os.path.abspath('build/verilog_to_json')
+# Default set of files to benchmark
+DEFAULT_SOURCES = ['test-inputs/crypto_benchmarks']
+
+# Expand the directories given on the command line to the files they contain
+def collect_sources(sources):
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files += sorted(os.path.join(source, name) for name in os.listdir(source) if os.path.isfile(os.path.join(source, name)))
+        else:
+            files.append(source)
+    return files
+
+# Run slang on a SystemVerilog file and return the path of the produced JSON.
+# JSON files are used as they are.
+def verilog_to_json(source, workdir):
+    if source.endswith('.json'):
+        return source
+    subprocess.run([VERILOG_TO_JSON, os.path.abspath(source)], cwd=workdir, stdout=subprocess.DEVNULL, check=True)
+    return os.path.join(workdir, 'output.json')
+
+# Peak resident memory of the current process in MB
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Run a measurement in a fresh interpreter, so that the peak memory of one run does not hide the next one.
+# The child prints its wall time and its peak memory.
+def run_child(*args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), *args], check=True, capture_output=True, text=True).stdout
+    elapsed, rss = output.split()
+    return float(elapsed), float(rss)
+
+# Build the dataclass AST from the JSON with the given loader
+def load(loader, json_path):
+    if loader == 'stream':
+        with open(json_path, 'rb') as file:
+            return JSON_to_DataClasses.json_stream_to_dataclass(file)
+    json_data = JSON_to_DataClasses.read_json_file(json_path)
+    return JSON_to_DataClasses.json_to_dataclass(json_data)
+
+# Number of AST nodes (JSON objects with a kind) in a decoded document
+def count_nodes(data):
+    count = 0
+    work = [data]
+    while work:
+        item = work.pop()
+        if isinstance(item, dict):
+            count += 'kind' in item
+            work.extend(item.values())
+        elif isinstance(item, list):
+            work.extend(item)
+    return count
+
+# Number of nodes of a dataclass AST
+def count_ast_nodes(root):
+    count = 0
+    work = [root]
+    while work:
+        item = work.pop()
+        if isinstance(item, list):
+            work.extend(item)
+        elif dataclasses.is_dataclass(item):
+            count += 1
+            work.extend(getattr(item, field.name) for field in dataclasses.fields(item))
+    return count
+
+# Synthetic assign whose right side is a chain of depth XOR operations
+def deep_assign(depth):
+    def named_value(name):
+        return {'kind': 'NamedValue', 'type': 'logic', 'symbol': f"0 {name}"}
+    expression = named_value('x0')
+    for i in range(1, depth + 1):
+        expression = {'kind': 'BinaryOp', 'type': 'logic', 'op': 'BinaryXor', 'left': expression, 'right': named_value(f"x{i}")}
+    assignment = {'kind': 'Assignment', 'type': 'logic', 'left': named_value('y'), 'right': expression, 'isNonBlocking': False}
+    return {'kind': 'ContinuousAssign', 'assignment': assignment}
+
+# Synthetic module with some single-bit inputs and one output, assigned a chain of depth operations op on the inputs
+def deep_module(depth, op='BinaryXor', inputs=8):
+    def named_value(name):
+        return {'kind': 'NamedValue', 'type': 'logic', 'symbol': f"0 {name}"}
+    ports = [{'kind': 'Port', 'name': f"x{i}", 'type': 'logic', 'direction': 'In', 'internalSymbol': f"0 x{i}"} for i in range(inputs)]
+    ports.append({'kind': 'Port', 'name': 'y', 'type': 'logic', 'direction': 'Out', 'internalSymbol': "0 y"})
+    expression = named_value('x0')
+    for i in range(1, depth + 1):
+        expression = {'kind': 'BinaryOp', 'type': 'logic', 'op': op, 'left': expression, 'right': named_value(f"x{i % inputs}")}
+    assignment = {'kind': 'Assignment', 'type': 'logic', 'left': named_value('y'), 'right': expression, 'isNonBlocking': False}
+    body = {'kind': 'InstanceBody', 'name': 'deep', 'definition': "0 deep", 'members': ports + [{'kind': 'ContinuousAssign', 'assignment': assignment}]}
+    return {'kind': 'Root', 'name': '$root', 'members': [{'kind': 'Instance', 'name': 'deep', 'body': body}]}
+
+# Write a decoded document as JSON. The values are walked with an explicit stack, json.dump cannot write the synthetic
+# expressions deeper than the recursion limit.
+def write_json(data, file):
+    # strings in tuples are written as they are, the other items are JSON values
+    work = [data]
+    while work:
+        item = work.pop()
+        if type(item) is tuple:
+            file.write(item[0])
+        elif isinstance(item, dict):
+            file.write('{')
+            work.append(('}',))
+            for index, (key, value) in reversed(list(enumerate(item.items()))):
+                work.append(value)
+                work.append((f"{',' if index else ''}{json.dumps(key)}:",))
+        elif isinstance(item, list):
+            file.write('[')
+            work.append((']',))
+            for index, value in reversed(list(enumerate(item))):
+                work.append(value)
+                if index:
+                    work.append((',',))
+        else:
+            file.write(json.dumps(item))
+
+# Write a synthetic document to a JSON file in workdir and return its path
+def synthetic_json(data, workdir, name):
+    json_path = os.path.join(workdir, f"{name}.json")
+    with open(json_path, 'w') as file:
+        write_json(data, file)
+    return json_path
+
+# Synthetic module on registers of width bits: every assign is an operation on whole vectors
+def register_module(width, inputs=4):
+    vector = f"logic[{width - 1}:0]"
+    def named_value(name):
+        return {'kind': 'NamedValue', 'type': vector, 'symbol': f"0 {name}"}
+    def binary(op, left, right):
+        return {'kind': 'BinaryOp', 'type': vector, 'op': op, 'left': left, 'right': right}
+    def assign(name, expression):
+        assignment = {'kind': 'Assignment', 'type': vector, 'left': named_value(name), 'right': expression, 'isNonBlocking': False}
+        return {'kind': 'ContinuousAssign', 'assignment': assignment}
+    x = [named_value(f"x{i}") for i in range(inputs)]
+    outputs = [
+        ('y0', binary('BinaryXor', binary('BinaryXor', x[0], x[1]), x[2])),
+        ('y1', binary('BinaryOr', binary('BinaryAnd', x[0], x[1]), x[3])),
+        ('y2', {'kind': 'UnaryOp', 'type': vector, 'op': 'BitwiseNot', 'operand': binary('BinaryAnd', x[2], x[3])}),
+    ]
+    ports = [{'kind': 'Port', 'name': f"x{i}", 'type': vector, 'direction': 'In', 'internalSymbol': f"0 x{i}"} for i in range(inputs)]
+    ports += [{'kind': 'Port', 'name': name, 'type': vector, 'direction': 'Out', 'internalSymbol': f"0 {name}"} for name, _ in outputs]
+    body = {'kind': 'InstanceBody', 'name': 'registers', 'definition': "0 registers", 'members': ports + [assign(name, expression) for name, expression in outputs]}
+    return {'kind': 'Root', 'name': '$root', 'members': [{'kind': 'Instance', 'name': 'registers', 'body': body}]}
+
+# Synthetic module with single-bit inputs and outputs, outputs is a list of (name, expression)
+def bit_module(name, inputs, outputs):
+    def assign(output, expression):
+        assignment = {'kind': 'Assignment', 'type': 'logic', 'left': bit('NamedValue', symbol=f"0 {output}"), 'right': expression, 'isNonBlocking': False}
+        return {'kind': 'ContinuousAssign', 'assignment': assignment}
+    ports = [{'kind': 'Port', 'name': port, 'type': 'logic', 'direction': 'In', 'internalSymbol': f"0 {port}"} for port in inputs]
+    ports += [{'kind': 'Port', 'name': output, 'type': 'logic', 'direction': 'Out', 'internalSymbol': f"0 {output}"} for output, _ in outputs]
+    body = {'kind': 'InstanceBody', 'name': name, 'definition': f"0 {name}", 'members': ports + [assign(output, expression) for output, expression in outputs]}
+    return {'kind': 'Root', 'name': '$root', 'members': [{'kind': 'Instance', 'name': name, 'body': body}]}
+
+# Single-bit AST node of the given kind
+def bit(kind, **fields):
+    return {'kind': kind, 'type': 'logic', **fields}
+
+# Synthetic multiplexer of inputs single bits (rounded up to a power of 2): a tree of 2 to 1 multiplexers
+# (a & ~s) | (b & s), one level for each select bit
+def mux_module(inputs):
+    select_bits = max(1, (inputs - 1).bit_length())
+    level = [bit('NamedValue', symbol=f"0 d{i}") for i in range(1 << select_bits)]
+    for j in range(select_bits):
+        select = bit('NamedValue', symbol=f"0 s{j}")
+        not_select = bit('UnaryOp', op='BitwiseNot', operand=select)
+        level = [bit('BinaryOp', op='BinaryOr',
+                     left=bit('BinaryOp', op='BinaryAnd', left=level[i], right=not_select),
+                     right=bit('BinaryOp', op='BinaryAnd', left=level[i + 1], right=select))
+                 for i in range(0, len(level), 2)]
+    inputs = [f"d{i}" for i in range(1 << select_bits)] + [f"s{j}" for j in range(select_bits)]
+    return bit_module('mux', inputs, [('y', level[0])])
+
+# Synthetic unsigned comparator a > b of width bits: a[i] & ~b[i] | ~(a[i] ^ b[i]) & (the comparison of the lower bits)
+def comparator_module(width):
+    def named_value(name):
+        return bit('NamedValue', symbol=f"0 {name}")
+    def greater(i):
+        return bit('BinaryOp', op='BinaryAnd', left=named_value(f"a{i}"), right=bit('UnaryOp', op='BitwiseNot', operand=named_value(f"b{i}")))
+    expression = greater(0)
+    for i in range(1, width):
+        equal = bit('UnaryOp', op='BitwiseNot', operand=bit('BinaryOp', op='BinaryXor', left=named_value(f"a{i}"), right=named_value(f"b{i}")))
+        expression = bit('BinaryOp', op='BinaryOr', left=greater(i), right=bit('BinaryOp', op='BinaryAnd', left=equal, right=expression))
+    inputs = [f"a{i}" for i in range(width)] + [f"b{i}" for i in range(width)]
+    return bit_module('comparator', inputs, [('gt', expression)])
+
+# Synthetic module with size copies of test-inputs/cse.sv on a chain of inputs: y_i = x_i & x_i+1 and
+# z_i = (x_i & x_i+1) op x_i+2. Without structural hashing the second AND is a copy of the first one: with op an AND the
+# CSE eliminates it, with op a XOR it has to keep it, the XOR being written on it while y_i is still to be measured
+def cse_module(size, op='BinaryAnd'):
+    def named_value(name):
+        return bit('NamedValue', symbol=f"0 {name}")
+    def conjunction(i):
+        return bit('BinaryOp', op='BinaryAnd', left=named_value(f"x{i}"), right=named_value(f"x{i + 1}"))
+    outputs = []
+    for i in range(size):
+        outputs.append((f"y{i}", conjunction(i)))
+        outputs.append((f"z{i}", bit('BinaryOp', op=op, left=conjunction(i), right=named_value(f"x{i + 2}"))))
+    return bit_module('cse', [f"x{i}" for i in range(size + 2)], outputs)
+
+# Number of layers of gates of the functions of module, with the registers expanded to single qubits
+def circuit_depth(module):
+    depth = 0
+    for func in module.body.block.ops:
+        indexes, count = qubits.qubit_indexes(func.body.block)
+        layers = [0] * count
+        for op in func.body.block.ops:
+            if op.name in ("quantum.init", "quantum.measure"):
+                continue
+            for bits in qubits.expand_gate(op, indexes):
+                layer = max(layers[index] for index in bits) + 1
+                for index in bits:
+                    layers[index] = layer
+                depth = max(depth, layer)
+    return depth
+
+######### BENCHMARKS #########
+
+# Compare the whole-document loader with the streaming one on every file
+def bench_loader(args):
+    print(f"{'File':45} {'Loader':8} {'Time':>10} {'Peak RSS':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            json_path = verilog_to_json(source, workdir)
+            for loader in ('load', 'stream'):
+                elapsed, rss = run_child('_load', loader, json_path)
+                print(f"{os.path.basename(source):45} {loader:8} {elapsed:9.3f}s {rss:9.1f} MB")
+
+# Throughput of the conversion from the decoded JSON to dataclasses
+def bench_convert(args):
+    print(f"{'File':45} {'Nodes':>10} {'Time':>10} {'Nodes/s':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            json_data = JSON_to_DataClasses.read_json_file(verilog_to_json(source, workdir))
+            measure_convert(os.path.basename(source), JSON_to_DataClasses.raw_decode(json_data)[0])
+        if args.depth:
+            measure_convert(f"synthetic chain of depth {args.depth}", deep_assign(args.depth))
+            # the same kind of chain read back from a file, with both loaders
+            data = deep_module(args.depth)
+            json_path = synthetic_json(data, workdir, 'deep')
+            for loader in ('load', 'stream'):
+                measure_load(f"synthetic chain of depth {args.depth} ({loader})", loader, json_path, count_nodes(data))
+
+def measure_convert(name, data):
+    nodes = count_nodes(data)
+    with JSON_to_DataClasses.paused_gc():
+        start = time.perf_counter()
+        JSON_to_DataClasses.from_dict(data)
+        end = time.perf_counter()
+    print(f"{name:45} {nodes:10} {end - start:9.3f}s {nodes / (end - start):12.0f}")
+
+# Time to load a JSON file with the given loader, checking that the AST has all the nodes of the document
+def measure_load(name, loader, json_path, nodes):
+    start = time.perf_counter()
+    root = load(loader, json_path)
+    end = time.perf_counter()
+    if count_ast_nodes(root) != nodes:
+        sys.exit(f"{name}: the AST has {count_ast_nodes(root)} nodes, the JSON {nodes}")
+    print(f"{name:45} {nodes:10} {end - start:9.3f}s {nodes / (end - start):12.0f}")
+
+# Memory retained by the dataclass AST, with plain and compact nodes
+def bench_ast_memory(args):
+    print(f"{'File':45} {'AST':8} {'Nodes':>10} {'Memory':>12} {'Per node':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            json_path = verilog_to_json(source, workdir)
+            for mode in ('plain', 'compact'):
+                nodes, size = run_child('_ast_memory', mode, json_path)
+                print(f"{os.path.basename(source):45} {mode:8} {nodes:10.0f} {size / 10**6:9.2f} MB {size / nodes:8.1f} B")
+
+# Wall time of IRGen alone, on the dataclass AST already built
+def bench_irgen(args):
+    print(f"{'File':45} {'Gates':>10} {'Time':>10} {'Gates/s':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            measure_irgen(os.path.basename(source), JSON_to_DataClasses.load_dataclass(verilog_to_json(source, workdir), compact=True))
+        # the chains are loaded from a JSON file, as the files compiled by main.py
+        if args.depth:
+            for op in ('BinaryXor', 'BinaryAnd', 'BinaryOr'):
+                json_path = synthetic_json(deep_module(args.depth, op), workdir, op)
+                measure_irgen(f"synthetic {op} chain of depth {args.depth}", JSON_to_DataClasses.load_dataclass(json_path, compact=True))
+
+def measure_irgen(name, root):
+    with JSON_to_DataClasses.paused_gc():
+        start = time.perf_counter()
+        module = IRGen().ir_gen_module(root)
+        end = time.perf_counter()
+    gates = sum(1 for func in module.body.block.ops for _ in func.body.block.ops)
+    print(f"{name:45} {gates:10} {end - start:9.3f}s {gates / (end - start):12.0f}")
+
+# Size of the IR generated with and without structural hashing, and iterations of run_transformations to its fixed point
+def bench_hashing(args):
+    compare_ir_gen_option(args.sources, 'structural_hashing', 'Hashing', 'structural_hits', 'Hits')
+
+# The same with and without the liveness in-placing of the XORs
+def bench_liveness(args):
+    compare_ir_gen_option(args.sources, 'liveness_inplacing', 'Liveness', 'liveness_writes', 'Writes')
+
+# The same with and without the elimination of the assignments that don't reach an output
+def bench_dead_logic(args):
+    compare_ir_gen_option(args.sources, 'dead_logic_elimination', 'Dead', 'dead_assignments', 'Removed')
+
+# The same with the assignments lowered in the order of the source and in the order of IRGen.schedule
+def bench_scheduling(args):
+    compare_ir_gen_option(args.sources, 'scheduling', 'Schedule', 'max_live', 'Live')
+
+# Generate the IR of each file with the IRGen option turned off and on, counter is the IRGen attribute counting its uses
+def compare_ir_gen_option(sources, option, label, counter, counter_label):
+    print(f"{'File':45} {label:8} {counter_label:>8} {'Gates':>10} {'Qubits':>8} {'Gen time':>10} {'Iter.':>6} {'Opt gates':>10} {'Opt qub.':>8} {'Opt time':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(sources):
+            root = JSON_to_DataClasses.load_dataclass(verilog_to_json(source, workdir), compact=True)
+            for enabled in (False, True):
+                ir_gen = IRGen()
+                setattr(ir_gen, option, enabled)
+                quantum_ir = QuantumIR()
+                start = time.perf_counter()
+                quantum_ir.module = ir_gen.ir_gen_module(root)
+                generated = time.perf_counter()
+                gateslist = []
+                qubitlist = []
+                quantum_ir.run_transformations(False, gateslist, qubitlist)
+                end = time.perf_counter()
+                print(f"{os.path.basename(source):45} {'on' if enabled else 'off':8} {getattr(ir_gen, counter):8} {gateslist[0]:10} {qubitlist[0]:8} "
+                      f"{generated - start:9.3f}s {len(gateslist):6} {gateslist[-1]:10} {qubitlist[-1]:8} {end - generated:9.3f}s", flush=True)
+
+# Gates, depth and compile time of the IR with each lowering of the ORs, on the files and on synthetic multiplexers and
+# comparators of each size of --sizes
+def bench_or_lowering(args):
+    print(f"{'File':45} {'Lowering':9} {'ORs':>16} {'Gates':>8} {'Qubits':>8} {'Opt gates':>10} {'Opt qub.':>8} {'Depth':>8} {'Time':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        modules = [(os.path.basename(source), JSON_to_DataClasses.load_dataclass(verilog_to_json(source, workdir), compact=True))
+                   for source in collect_sources(args.sources)]
+    for size in args.sizes:
+        modules.append((f"synthetic multiplexer of {size} inputs", JSON_to_DataClasses.from_dict(mux_module(size))))
+        modules.append((f"synthetic comparator of {size} bits", JSON_to_DataClasses.from_dict(comparator_module(size))))
+    for name, root in modules:
+        for lowering in OR_LOWERINGS + ('cost',):
+            ir_gen = IRGen()
+            ir_gen.or_lowering = lowering
+            ir_gen.not_cost, ir_gen.cnot_cost, ir_gen.ccnot_cost = args.gate_costs
+            quantum_ir = QuantumIR()
+            gateslist = []
+            qubitlist = []
+            start = time.perf_counter()
+            quantum_ir.module = ir_gen.ir_gen_module(root)
+            quantum_ir.run_transformations(False, gateslist, qubitlist)
+            end = time.perf_counter()
+            counts = '/'.join(str(ir_gen.or_counts[option]) for option in OR_LOWERINGS)
+            print(f"{name:45} {lowering:9} {counts:>16} {gateslist[0]:8} {qubitlist[0]:8} {gateslist[-1]:10} {qubitlist[-1]:8} "
+                  f"{circuit_depth(quantum_ir.module):8} {end - start:9.3f}s", flush=True)
+
+# Gates of the generated IR and iterations of the transformations with the constants folded, without and with the
+# boolean identities. Rewrites counts the operations they remove, AST time is the time of the whole AST pass.
+def bench_simplification(args):
+    print(f"{'File':45} {'Simplify':8} {'Rewrites':>8} {'AST time':>10} {'Gates':>10} {'Qubits':>8} {'Iter.':>6} {'Opt gates':>10} {'Opt qub.':>8} {'Opt time':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            root = JSON_to_DataClasses.load_dataclass(verilog_to_json(source, workdir), compact=True)
+            for enabled in (False, True):
+                constant_propagation = ConstantPropagation(simplification=enabled)
+                quantum_ir = QuantumIR()
+                start = time.perf_counter()
+                quantum_ir.root = constant_propagation.apply(root)
+                simplified = time.perf_counter()
+                quantum_ir.run_generate_ir(print_output = False)
+                generated = time.perf_counter()
+                gateslist = []
+                qubitlist = []
+                quantum_ir.run_transformations(False, gateslist, qubitlist)
+                end = time.perf_counter()
+                print(f"{os.path.basename(source):45} {'on' if enabled else 'off':8} {constant_propagation.simplifications:8} {simplified - start:9.3f}s "
+                      f"{gateslist[0]:10} {qubitlist[0]:8} {len(gateslist):6} {gateslist[-1]:10} {qubitlist[-1]:8} {end - generated:9.3f}s", flush=True)
+
+# Sweep of specializations of each file: --points random values of its first --inputs input ports (each 0 or all ones).
+# The ASTs go through an empty cache: the first load of a point propagates its constants on the cached AST of the source,
+# the second one is a hit. The gates and qubits are the ones of the generated IR and after the transformations.
+def bench_specialize(args):
+    print(f"{'File':45} {'Point':>6} {'Load':>10} {'Hit':>10} {'Gates':>8} {'Qubits':>8} {'Opt gates':>10} {'Opt qub.':>8} {'Opt time':>10}")
+    rng = random.Random(args.seed)
+    for source in collect_sources(args.sources):
+        if not ast_cache.is_verilog(source):
+            continue
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ast_cache.ASTCache(cache_dir)
+            start = time.perf_counter()
+            root = cache.load(source, compact=True)
+            load_time = time.perf_counter() - start
+            body = next(member.body for member in root.members if isinstance(member, JSON_to_DataClasses.Instance))
+            ports = [member for member in body.members if isinstance(member, JSON_to_DataClasses.Port) and member.direction == "In"][:args.inputs]
+            print_specialization(source, 'none', load_time, None, ConstantPropagation().apply(root))
+            for point in range(args.points):
+                constants = {port.name: rng.choice((0, (1 << bit_width(port.type)) - 1)) for port in ports}
+                start = time.perf_counter()
+                cache.load_specialized(source, constants, compact=True)
+                load_time = time.perf_counter() - start
+                start = time.perf_counter()
+                root = cache.load_specialized(source, constants, compact=True)
+                hit_time = time.perf_counter() - start
+                print_specialization(source, point, load_time, hit_time, root)
+
+def print_specialization(source, point, load_time, hit_time, root):
+    quantum_ir = QuantumIR()
+    quantum_ir.root = root
+    quantum_ir.run_generate_ir(print_output = False)
+    gateslist = []
+    qubitlist = []
+    start = time.perf_counter()
+    quantum_ir.run_transformations(False, gateslist, qubitlist)
+    end = time.perf_counter()
+    hit = '-' if hit_time is None else f"{hit_time:9.3f}s"
+    print(f"{os.path.basename(source):45} {point:>6} {load_time:9.3f}s {hit:>10} {gateslist[0]:8} {qubitlist[0]:8} {gateslist[-1]:10} {qubitlist[-1]:8} {end - start:9.3f}s", flush=True)
+
+# Wall time and peak traced memory of one run of the common subexpression elimination on the generated IR of each file,
+# and of the synthetic modules of cse_module of each size of --sizes (always without structural hashing).
+# The IR is generated twice, the time is measured without tracing the memory. Classes counts the value numbers of the
+# qubit states, Elim. the operations eliminated.
+def bench_cse(args):
+    print(f"{'File':45} {'Gates':>10} {'Classes':>10} {'Elim.':>8} {'Time':>10} {'Peak mem.':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            root = JSON_to_DataClasses.load_dataclass(verilog_to_json(source, workdir), compact=True)
+            measure_cse(os.path.basename(source), root, not args.no_structural_hashing)
+    for size in args.sizes:
+        measure_cse(f"synthetic cse.sv x {size}", JSON_to_DataClasses.from_dict(cse_module(size)), False)
+        measure_cse(f"synthetic cse.sv x {size}, XOR", JSON_to_DataClasses.from_dict(cse_module(size, 'BinaryXor')), False)
+
+def measure_cse(name, root, structural_hashing):
+    quantum_ir = QuantumIR()
+    quantum_ir.root = root
+    quantum_ir.structural_hashing = structural_hashing
+    quantum_ir.run_generate_ir(print_output = False)
+    gates = sum(1 for func in quantum_ir.module.body.block.ops for _ in func.body.block.ops)
+    cse = CommonSubexpressionElimination()
+    start = time.perf_counter()
+    cse.apply(quantum_ir.module)
+    end = time.perf_counter()
+    quantum_ir.run_generate_ir(print_output = False)
+    tracemalloc.start()
+    CommonSubexpressionElimination().apply(quantum_ir.module)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:45} {gates:10} {len(cse.cseDriver.numbering.classes):10} {cse.cse_eliminations:8} {end - start:9.3f}s {peak / 10**6:9.2f} MB", flush=True)
+
+# Wall time of building the OperationInfo of every gate of the generated IR of each file, as the CSE does on its first
+# run: the key of each operation from the classes of its operands. Best of --repeat runs, each with a new numbering.
+def bench_cse_keys(args):
+    print(f"{'File':45} {'Gates':>10} {'Classes':>10} {'Time':>10} {'Per gate':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            quantum_ir = QuantumIR()
+            quantum_ir.root = JSON_to_DataClasses.load_dataclass(verilog_to_json(source, workdir), compact=True)
+            quantum_ir.run_generate_ir(print_output = False)
+            gates = [op for func in quantum_ir.module.body.block.ops for op in func.body.block.ops
+                     if op.name not in ("quantum.init", "quantum.measure")]
+            best = None
+            for _ in range(args.repeat):
+                numbering = ValueNumbering()
+                start = time.perf_counter()
+                for op in gates:
+                    OperationInfo(op, numbering)
+                end = time.perf_counter()
+                best = end - start if best is None else min(best, end - start)
+            print(f"{os.path.basename(source):45} {len(gates):10} {len(numbering.classes):10} {best:9.3f}s {best / len(gates) * 10**6:7.2f} us", flush=True)
+
+# Size, wall time and traced memory of the transformations on the same module with registers of growing width
+def bench_registers(args):
+    print(f"{'Width':>8} {'Gates':>8} {'Opt gates':>10} {'Qubits':>8} {'Opt qub.':>8} {'Bit gates':>10} {'Bit qub.':>8} {'Time':>10} {'Peak mem.':>12}")
+    for width in args.widths:
+        quantum_ir = QuantumIR()
+        quantum_ir.module = IRGen().ir_gen_module(JSON_to_DataClasses.from_dict(register_module(width)))
+        gateslist = []
+        qubitlist = []
+        tracemalloc.start()
+        start = time.perf_counter()
+        quantum_ir.run_transformations(False, gateslist, qubitlist)
+        end = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        func = next(iter(quantum_ir.module.body.block.ops))
+        indexes, bit_qubits = qubits.qubit_indexes(func.body.block)
+        bit_gates = sum(len(qubits.expand_gate(op, indexes)) for op in func.body.block.ops if op.name not in ("quantum.init", "quantum.measure"))
+        print(f"{width:8} {gateslist[0]:8} {gateslist[-1]:10} {qubitlist[0]:8} {qubitlist[-1]:8} {bit_gates:10} {bit_qubits:8} {end - start:9.3f}s {peak / 10**6:9.2f} MB", flush=True)
+
+# Compare the dataclass frontend (JSON -> dataclass AST -> IR) with the fused one (JSON -> IR)
+def bench_frontend(args):
+    print(f"{'File':45} {'Frontend':10} {'Time':>10} {'Peak RSS':>12}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for source in collect_sources(args.sources):
+            json_path = verilog_to_json(source, workdir)
+            for frontend in ('dataclass', 'fused'):
+                elapsed, rss = run_child('_frontend', frontend, json_path)
+                print(f"{os.path.basename(source):45} {frontend:10} {elapsed:9.3f}s {rss:9.1f} MB")
+
+# Compare the two ways of compiling a SystemVerilog file: verilog_to_json and its JSON, or pyslang in-process
+def bench_verilog(args):
+    print(f"{'File':45} {'Frontend':10} {'Time':>10} {'Peak RSS':>12}")
+    for source in collect_sources(args.sources):
+        if not ast_cache.is_verilog(source):
+            continue
+        for frontend in ast_cache.VERILOG_FRONTENDS:
+            elapsed, rss = run_child('_verilog', frontend, source)
+            print(f"{os.path.basename(source):45} {frontend:10} {elapsed:9.3f}s {rss:9.1f} MB")
+
+# Compile every file serially, then again in a thread pool, and check that each compile gives the same result.
+# In the pool each file is compiled repeat times, so that compiles of the same design run at the same time.
+def bench_parallel(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        sources = collect_sources(args.sources)
+        json_paths = []
+        # each file needs its own JSON, slang always writes output.json
+        for index, source in enumerate(sources):
+            json_path = verilog_to_json(source, workdir)
+            if json_path != source:
+                json_path = os.path.join(workdir, f"{index}.json")
+                os.replace(os.path.join(workdir, 'output.json'), json_path)
+            json_paths.append(json_path)
+
+        start = time.perf_counter()
+        serial = [compile_result(json_path) for json_path in json_paths]
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.jobs) as pool:
+            parallel = list(pool.map(compile_result, json_paths * args.repeat))
+        parallel_time = time.perf_counter() - start
+
+    print(f"{len(json_paths)} files, serial {serial_time:.3f}s, {args.repeat} times each on {args.jobs} threads {parallel_time:.3f}s")
+    mismatches = sorted({source for source, first, second in zip(sources * args.repeat, serial * args.repeat, parallel) if first != second})
+    if mismatches:
+        sys.exit(f"Parallel compiles differ from the serial ones: {' '.join(mismatches)}")
+
+# Final IR, gate and qubit counts and statistics of a compile
+def compile_result(json_path):
+    quantum_ir = QuantumIR(json_path)
+    quantum_ir.run_dataclass()
+    quantum_ir.run_generate_ir(print_output = False)
+    gateslist = []
+    qubitlist = []
+    quantum_ir.run_transformations(False, gateslist, qubitlist)
+    output = io.StringIO()
+    Printer(stream=output).print_op(quantum_ir.module)
+    context = quantum_ir.root.context
+    return (output.getvalue(), gateslist, qubitlist,
+            (context.num_ands, context.num_ors, context.num_nots, context.num_xors, context.num_inputs, context.num_outputs, context.num_locals),
+            (quantum_ir.num_cse, quantum_ir.cse_gate_elim, quantum_ir.num_dce, quantum_ir.dce_gate_elim, quantum_ir.dce_init_elim,
+             quantum_ir.num_hge, quantum_ir.hge_gate_elim, quantum_ir.num_inplacing, quantum_ir.inplacing_gate_elim, quantum_ir.inplacing_init_elim,
+             quantum_ir.cse_samequbit))
+
+def child_load(args):
+    start = time.perf_counter()
+    load(args.loader, args.json)
+    end = time.perf_counter()
+    print(end - start, peak_rss())
+
+def child_frontend(args):
+    start = time.perf_counter()
+    if args.frontend == 'fused':
+        fused_ir_gen(args.json, compact=True)
+    else:
+        IRGen().ir_gen_module(JSON_to_DataClasses.load_dataclass(args.json, compact=True))
+    end = time.perf_counter()
+    print(end - start, peak_rss())
+
+def child_verilog(args):
+    start = time.perf_counter()
+    ast_cache.verilog_to_dataclass(args.source, compact=True, frontend=args.frontend)
+    end = time.perf_counter()
+    print(end - start, peak_rss())
+
+# Prints the number of nodes and the bytes still allocated once the AST is built (the JSON text excluded)
+def child_ast_memory(args):
+    json_data = JSON_to_DataClasses.read_json_file(args.json)
+    tracemalloc.start()
+    root = JSON_to_DataClasses.json_to_dataclass(json_data, compact=args.mode == 'compact')
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(count_ast_nodes(root), size)
+
+######### MAIN #########
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the QuantumIR pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    loader = commands.add_parser('loader', help="wall time and peak RSS of the JSON loaders")
+    loader.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    loader.set_defaults(func=bench_loader)
+
+    convert = commands.add_parser('convert', help="throughput of the JSON to dataclasses conversion in nodes/second")
+    convert.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    convert.add_argument('--depth', type=int, default=0, help="also convert a synthetic expression of the given depth")
+    convert.set_defaults(func=bench_convert)
+
+    ast_memory = commands.add_parser('ast-memory', help="memory per node of the plain and of the compact dataclass AST")
+    ast_memory.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    ast_memory.set_defaults(func=bench_ast_memory)
+
+    irgen = commands.add_parser('irgen', help="wall time of IRGen on the dataclass AST")
+    irgen.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    irgen.add_argument('--depth', type=int, default=0, help="also lower synthetic XOR, AND and OR chains of the given depth")
+    irgen.set_defaults(func=bench_irgen)
+
+    hashing = commands.add_parser('hashing', help="gates of the generated IR and iterations of the transformations, with and without structural hashing")
+    hashing.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    hashing.set_defaults(func=bench_hashing)
+
+    liveness = commands.add_parser('liveness', help="gates of the generated IR and iterations of the transformations, with and without the liveness in-placing of the XORs")
+    liveness.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    liveness.set_defaults(func=bench_liveness)
+
+    dead_logic = commands.add_parser('dead-logic', help="gates of the generated IR and iterations of the transformations, with and without the elimination of the assignments that don't reach an output")
+    dead_logic.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    dead_logic.set_defaults(func=bench_dead_logic)
+
+    scheduling = commands.add_parser('scheduling', help="gates of the generated IR and iterations of the transformations, with the assignments in the order of the source and scheduled")
+    scheduling.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    scheduling.set_defaults(func=bench_scheduling)
+
+    simplification = commands.add_parser('simplification', help="gates of the generated IR and iterations of the transformations, with and without the boolean simplification of the AST")
+    simplification.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    simplification.set_defaults(func=bench_simplification)
+
+    cse = commands.add_parser('cse', help="wall time and peak traced memory of the common subexpression elimination on the generated IR")
+    cse.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    cse.add_argument('--sizes', type=int, nargs='*', default=[], help="also run on synthetic modules with this many copies of test-inputs/cse.sv, with the copies eliminated and kept")
+    cse.add_argument('--no-structural-hashing', action='store_true', help="generate the IR without structural hashing, leaving the repeated subexpressions to the CSE")
+    cse.set_defaults(func=bench_cse)
+
+    cse_keys = commands.add_parser('cse-keys', help="wall time of building the CSE key of every gate of the generated IR")
+    cse_keys.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    cse_keys.add_argument('--repeat', type=int, default=5, help="number of runs, the best one is reported")
+    cse_keys.set_defaults(func=bench_cse_keys)
+
+    registers = commands.add_parser('registers', help="transformations on a synthetic module with vector ports of growing width")
+    registers.add_argument('--widths', type=int, nargs='+', default=[1, 8, 64, 512, 4096], help="widths of the registers")
+    registers.set_defaults(func=bench_registers)
+
+    or_lowering = commands.add_parser('or-lowering', help="gates, depth and compile time of each lowering of the ORs on multiplexers and comparators")
+    or_lowering.add_argument('sources', nargs='*', default=['test-inputs/multiplexer.sv', 'test-inputs/eqComparator.sv'])
+    or_lowering.add_argument('--sizes', type=int, nargs='+', default=[4, 16, 64], help="inputs of the synthetic multiplexers and bits of the synthetic comparators")
+    or_lowering.add_argument('--gate-costs', type=float, nargs=3, metavar=('NOT', 'CNOT', 'CCNOT'), default=QuantumIR.gate_costs,
+                             help="weights of the gates in the choice of the 'cost' lowering")
+    or_lowering.set_defaults(func=bench_or_lowering)
+
+    specialize = commands.add_parser('specialize', help="compile time, gates and qubits of a sweep over constant values of some input ports, through the AST cache")
+    specialize.add_argument('sources', nargs='*', default=['test-inputs/crypto_benchmarks/DES-non-expanded_untilsat.v'])
+    specialize.add_argument('--inputs', type=int, default=8, help="number of input ports fixed, the first ones of the module")
+    specialize.add_argument('--points', type=int, default=8, help="number of random values of the fixed ports")
+    specialize.add_argument('--seed', type=int, default=0, help="seed of the random values")
+    specialize.set_defaults(func=bench_specialize)
+
+    frontend = commands.add_parser('frontend', help="wall time and peak RSS of the dataclass and of the fused frontend")
+    frontend.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    frontend.set_defaults(func=bench_frontend)
+
+    verilog = commands.add_parser('verilog', help="wall time and peak RSS of verilog_to_json and of pyslang, from the source to the dataclass AST")
+    verilog.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    verilog.set_defaults(func=bench_verilog)
+
+    parallel = commands.add_parser('parallel', help="compile the files serially and in a thread pool and compare the results")
+    parallel.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    parallel.add_argument('--jobs', type=int, default=max(4, os.cpu_count()), help="number of threads")
+    parallel.add_argument('--repeat', type=int, default=4, help="compiles of each file in the thread pool")
+    parallel.set_defaults(func=bench_parallel)
+
+    # Commands used internally to measure a single run in a separate process
+    child = commands.add_parser('_load')
+    child.add_argument('loader', choices=['load', 'stream'])
+    child.add_argument('json')
+    child.set_defaults(func=child_load)
+
+    child = commands.add_parser('_frontend')
+    child.add_argument('frontend', choices=['dataclass', 'fused'])
+    child.add_argument('json')
+    child.set_defaults(func=child_frontend)
+
+    child = commands.add_parser('_verilog')
+    child.add_argument('frontend', choices=ast_cache.VERILOG_FRONTENDS)
+    child.add_argument('source')
+    child.set_defaults(func=child_verilog)
+
+    child = commands.add_parser('_ast_memory')
+    child.add_argument('mode', choices=['plain', 'compact'])
+    child.add_argument('json')
+    child.set_defaults(func=child_ast_memory)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
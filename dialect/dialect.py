@@ -104,7 +104,7 @@ class CCNotOp(IRDLOperation):
 class MeasureOp(IRDLOperation):
 
     name = "quantum.measure"
-    target: Operand = operand_def(IntegerType(1))
+    target: Operand = operand_def(TypeVar("AttributeInvT", bound=Attribute))
     res: OpResult = result_def()
 
     def __init__(self, target: SSAValue):
@@ -0,0 +1,98 @@
+import re
+import weakref
+
+from xdsl.dialects.builtin import VectorType
+from xdsl.ir import Block, BlockArgument, Operation, SSAValue
+
+# Identity of the SSAValues of the quantum dialect.
+# Every SSAValue is a temporal state of a qubit: a function argument or the result of an InitOp is state 0 of a new qubit,
+# every gate gives the next state of the qubit it writes (its target).
+# The qubit number and the state are kept in a table beside the IR, by id of the SSAValue, and are what the passes read
+# (qubit_of, version_of) and compare. An entry is dropped with its SSAValue. The name qN_M is written from them only for
+# the printer.
+# A value that never went through set_qubit (e.g. the result of an operation cloned by xDSL) gets its entry from the IR
+# on its first read: the next state of the target for a gate, the qubit of its name for an argument or an InitOp.
+
+# qubit, state and weak reference of each SSAValue, by id. The reference removes the entry when the value is collected,
+# before its id can be reused
+_states: dict[int, tuple[int, int, weakref.ref]] = {}
+
+_qubit_name = re.compile(r"q(\d+)")
+
+# Make value the state version of qubit
+def set_qubit(value: SSAValue, qubit: int, version: int = 0) -> SSAValue:
+    key = id(value)
+    entry = _states.get(key)
+    if entry is None or entry[2]() is not value:
+        reference = weakref.ref(value, lambda _, key=key: _states.pop(key, None))
+    else:
+        reference = entry[2]
+    _states[key] = (qubit, version, reference)
+    value._name = f"q{qubit}_{version}"
+    return value
+
+# Make value the state following previous, on the same qubit
+def next_version(value: SSAValue, previous: SSAValue) -> SSAValue:
+    entry = _states.get(id(previous)) or _derive_state(previous)
+    return set_qubit(value, entry[0], entry[1] + 1)
+
+# Qubit of which value is a state
+def qubit_of(value: SSAValue) -> int:
+    return (_states.get(id(value)) or _derive_state(value))[0]
+
+# State of its qubit that value is, 0 for the first one
+def version_of(value: SSAValue) -> int:
+    return (_states.get(id(value)) or _derive_state(value))[1]
+
+# Key identifying a state of a qubit, two SSAValues with the same key print with the same name
+def qubit_key(value: SSAValue) -> tuple[int, int]:
+    entry = _states.get(id(value)) or _derive_state(value)
+    return entry[0], entry[1]
+
+# Entry of a value created outside the passes. The gates are followed back along their targets to a known state, an
+# argument or an InitOp, iteratively since the chain of states of a qubit can be long.
+def _derive_state(value: SSAValue) -> tuple[int, int, weakref.ref]:
+    chain = []
+    while id(value) not in _states:
+        owner = value.owner
+        if isinstance(value, BlockArgument) or not owner.operands:
+            match = _qubit_name.match(value.name_hint or "")
+            if match is None:
+                raise ValueError(f"{value} is not a qubit state: it was not numbered by set_qubit and has no qN name")
+            set_qubit(value, int(match.group(1)))
+            break
+        chain.append(value)
+        value = owner.operands[-1]
+    for state in reversed(chain):
+        next_version(state, state.owner.operands[-1])
+    return _states[id(chain[0] if chain else value)]
+
+######### REGISTERS #########
+# A value of vector type is a register: a vector of qubits with a single qubit number, on which the gates act bit by bit.
+# The passes treat a register as one qubit, so an operation on N bits stays one operation. It is expanded to N gates on
+# single qubits only when the circuit is exported (metrics.py, validate.py): the qubits of a register get consecutive
+# indexes, in the order the registers are defined.
+
+# Number of qubits of value: 1 for a single qubit, N for a register of N qubits
+def register_width(value: SSAValue) -> int:
+    if isinstance(value.type, VectorType):
+        return value.type.get_shape()[0]
+    return 1
+
+# Index of the first qubit of each register of a function block, by qubit number, and the total number of qubits
+def qubit_indexes(block: Block) -> tuple[dict[int, int], int]:
+    indexes = {}
+    count = 0
+    for arg in block.args:
+        indexes[qubit_of(arg)] = count
+        count += register_width(arg)
+    for op in block.ops:
+        if op.name == "quantum.init":
+            indexes[qubit_of(op.res)] = count
+            count += register_width(op.res)
+    return indexes, count
+
+# Gates on single qubits equivalent to op, as the indexes of their operands: one gate for each bit of the registers
+def expand_gate(op: Operation, indexes: dict[int, int]) -> list[list[int]]:
+    firsts = [indexes[qubit_of(operand)] for operand in op.operands]
+    return [[first + bit for first in firsts] for bit in range(register_width(op.res))]
@@ -5,6 +5,7 @@ from xdsl.rewriter import Rewriter
 from xdsl.dialects.builtin import ModuleOp
 
 from dialect.dialect import HadamardOp, TGateOp,TDaggerGateOp, CNotOp, MeasureOp,InitOp,FuncOp
+from dialect.qubits import next_version
 
 # pattern rewriting pass to transform CCNOT operations in a sequence of CNOT, Hadamard and T-gate operations
 # in order to use existing metrics for the evaluation of the circuit performances.
@@ -23,7 +24,7 @@ class CCnot_decomposition(RewritePattern):
             using_operation = use.operation
             target_idx = len(using_operation.operands) - 1
             if using_operation.operands[target_idx] == changed:
-                using_operation.res._name = changed._name.split("_")[0] + "_" + str(int(changed._name.split("_")[1])+1)
+                next_version(using_operation.res, changed)
                 self.fixnames(using_operation.res)
         
 
@@ -40,7 +41,7 @@ class CCnot_decomposition(RewritePattern):
             target_idx = len(using_operation.operands) - 1
             if using_operation.operands[target_idx] == old:
                 using_operation.operands[target_idx] = new
-                using_operation.res._name = new._name.split("_")[0] + "_" + str(int(new._name.split("_")[1])+1)
+                next_version(using_operation.res, new)
                 self.fixnames(using_operation.res)
             else: # used as a control
                 using_operation.operands[using_operation.operands.index(old)] = new
@@ -69,64 +70,64 @@ class CCnot_decomposition(RewritePattern):
             res = op.res
 
             h1_res = self.builder.insert(HadamardOp.from_value(target)).res
-            h1_res._name = target._name.split('_')[0] +"_" + str(int(target._name.split('_')[1])+1)
+            next_version(h1_res, target)
             self.passedOperation.add(h1_res.op)
             
             cnot1_res = self.builder.insert(CNotOp.from_value(control2, h1_res)).res
-            cnot1_res._name = h1_res._name.split('_')[0] +"_" + str(int(h1_res._name.split('_')[1])+1)
+            next_version(cnot1_res, h1_res)
             self.passedOperation.add(cnot1_res.op)
         
             tcross1_res = self.builder.insert(TDaggerGateOp.from_value(cnot1_res)).res
-            tcross1_res._name = cnot1_res._name.split('_')[0] +"_" + str(int(cnot1_res._name.split('_')[1])+1)
+            next_version(tcross1_res, cnot1_res)
             self.passedOperation.add(tcross1_res.op)
 
             cnot2_res = self.builder.insert(CNotOp.from_value(control1, tcross1_res)).res
-            cnot2_res._name = tcross1_res._name.split('_')[0] +"_" + str(int(tcross1_res._name.split('_')[1])+1)
+            next_version(cnot2_res, tcross1_res)
             self.passedOperation.add(cnot2_res.op)
 
             t1_res = self.builder.insert(TGateOp.from_value(cnot2_res)).res
-            t1_res._name = cnot2_res._name.split('_')[0] +"_" + str(int(cnot2_res._name.split('_')[1])+1)
+            next_version(t1_res, cnot2_res)
             self.passedOperation.add(t1_res.op)
 
             cnot3_res = self.builder.insert(CNotOp.from_value(control2, t1_res)).res
-            cnot3_res._name = t1_res._name.split('_')[0] +"_" + str(int(t1_res._name.split('_')[1])+1)
+            next_version(cnot3_res, t1_res)
             self.passedOperation.add(cnot3_res.op)
 
             tcross2_res = self.builder.insert(TDaggerGateOp.from_value(cnot3_res)).res
-            tcross2_res._name = cnot3_res._name.split('_')[0] +"_" + str(int(cnot3_res._name.split('_')[1])+1)
+            next_version(tcross2_res, cnot3_res)
             self.passedOperation.add(tcross2_res.op)
 
             cnot4_res = self.builder.insert(CNotOp.from_value(control1, tcross2_res)).res
-            cnot4_res._name = tcross2_res._name.split('_')[0] +"_" + str(int(tcross2_res._name.split('_')[1])+1)
+            next_version(cnot4_res, tcross2_res)
             self.passedOperation.add(cnot4_res.op)
             cnot5_res = self.builder.insert(CNotOp.from_value(control1, control2)).res
-            cnot5_res._name = control2._name.split('_')[0] +"_" + str(int(control2._name.split('_')[1])+1)
+            next_version(cnot5_res, control2)
             self.passedOperation.add(cnot5_res.op)
 
             tcross3_res = self.builder.insert(TDaggerGateOp.from_value(cnot5_res)).res
-            tcross3_res._name = cnot5_res._name.split('_')[0] +"_" + str(int(cnot5_res._name.split('_')[1])+1)
+            next_version(tcross3_res, cnot5_res)
             self.passedOperation.add(tcross3_res.op)
             cnot6_res = self.builder.insert(CNotOp.from_value(control1, tcross3_res)).res
-            cnot6_res._name = tcross3_res._name.split('_')[0] +"_" + str(int(tcross3_res._name.split('_')[1])+1)
+            next_version(cnot6_res, tcross3_res)
             self.passedOperation.add(cnot6_res.op)
 
             # new control1
             t2_res = self.builder.insert(TGateOp.from_value(control1)).res
-            t2_res._name = control1._name.split('_')[0] +"_" + str(int(control1._name.split('_')[1])+1)
+            next_version(t2_res, control1)
             self.passedOperation.add(t2_res.op)
 
             # new control2
             t3_res = self.builder.insert(TGateOp.from_value(cnot6_res)).res
-            t3_res._name = cnot6_res._name.split('_')[0] +"_" + str(int(cnot6_res._name.split('_')[1])+1)
+            next_version(t3_res, cnot6_res)
             self.passedOperation.add(t3_res.op)
 
 
             # new target
             t4_res = self.builder.insert(TGateOp.from_value(cnot4_res)).res
-            t4_res._name = cnot4_res._name.split('_')[0] +"_" + str(int(cnot4_res._name.split('_')[1])+1)
+            next_version(t4_res, cnot4_res)
             self.passedOperation.add(t4_res.op)
             h2_res = self.builder.insert(HadamardOp.from_value(t4_res)).res
-            h2_res._name = t4_res._name.split('_')[0] +"_" + str(int(t4_res._name.split('_')[1])+1)
+            next_version(h2_res, t4_res)
             self.passedOperation.add(h2_res.op)
 
 
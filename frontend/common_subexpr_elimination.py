@@ -1,110 +1,104 @@
-from xdsl.ir import Operation, Block, Region, BlockArgument, OpResult
-from xdsl.dialects.builtin import ModuleOp, UnregisteredOp, IntegerType
+from xdsl.ir import Operation, Block, Region, BlockArgument, OpResult, SSAValue
+from xdsl.dialects.builtin import ModuleOp, UnregisteredOp
 from xdsl.passes import ModulePass
 from xdsl.builder import Builder
 from xdsl.rewriter import Rewriter
 from xdsl.traits import IsolatedFromAbove
 from dataclasses import dataclass
 from dialect.dialect import FuncOp, MeasureOp, InitOp, CCNotOp, CNotOp
+from dialect.qubits import qubit_key, qubit_of, set_qubit
 
-import re
                             ##### SUPPORT FUNCTIONS #####
 
-# check if the existing SSAValue(qubit) will be changed between the existing operation and the one we are substituting
-def has_other_modifications(existingOp: Operation,passedOperation:set) -> bool:
+# check if the existing SSAValue(qubit) will be changed before the current operation, or before the last use of the
+# SSAValue of the current operation: once replaced, that use would read the changed qubit
+def has_other_modifications(currentOp: Operation, existingOp: Operation, chains: "UseChains") -> bool:
 
-    from_uses = existingOp.res.uses
-
-    for use in from_uses:
-        # operation using the SSAValue
-        user_operation = use.operation
-        if isinstance(user_operation, MeasureOp):
-            continue
-        if(user_operation.operands[-1] == existingOp.res): # if the SSAValue is used as a target
-            if(user_operation in passedOperation): # and the use happens before the current operation
-                return True
-        else:
-            continue
+    writer = chains.writer(existingOp.res)
+    if writer is None:
+        return False
 
-    return False
+    write = chains.positions[writer]
+    return write < chains.positions[currentOp] or chains.last_use(currentOp.res) >= write
     
 # if the current operation res SSAValue is written after the current operation and the existing operation res SSAValue
 # is read after that write, we can't substitute the current operation with the existing one 
-def has_read_after_write(currentOp: Operation, existingOp: Operation) -> bool:
+def has_read_after_write(currentOp: Operation, existingOp: Operation, chains: "UseChains") -> bool:
 
-    next_op = currentOp.next_op
-
-    op_uses = currentOp.res.uses
-
-    found = False
-    for use in op_uses:
-        user_operation = use.operation
-        if isinstance(user_operation, MeasureOp):
-            continue
-        elif(user_operation.operands[-1] == currentOp.res): # result of current op is used as target
-            operation_using = user_operation
-            found=True
-            break
-        else:
-            continue
-    
-    if not found:
+    writer = chains.writer(currentOp.res)
+    if writer is None:
         return False
-    else:
-        next_op = operation_using.next_op
-         # check on every operation until the end
-        while next_op != None:
-
-            # if the operation is an InitOp surely it will not read the qubit 
-            if not isinstance(next_op, InitOp):
 
-                # if we find any use of the first qubit we cannot remap
-                if any(attr == existingOp.res for attr in next_op.operands):
-                    return True
-                
-            next_op = next_op.next_op
+    return chains.last_use(existingOp.res) > chains.positions[writer]
 
-        return False
 # if both results of the existing and of the current operation are measured we cannot substitute 
-def both_measured(currentOp: Operation, existingOp: Operation) -> bool:
-    current_res = currentOp.res
-    existing_res = existingOp.res
+def both_measured(currentOp: Operation, existingOp: Operation, chains: "UseChains") -> bool:
+    return chains.measured(currentOp.res) and chains.measured(existingOp.res)
 
-    current_uses = current_res.uses
-    existing_uses = existing_res.uses
 
-    current_measured = False
-    existing_measured = False
+                            ##### CLASSES TO HELP CSE MANAGMENT #####
+   
+# Value numbering of the qubit states for one run of CSEDriver.
+# Every qubit state (SSAValue) gets a small integer, its class, and two states with the same class hold the same value.
+# The class of the result of an operation is given by its name, the classes of its controls and the class of its target.
+# The controls commute: they are put in canonical order by sorting their classes, for any number of controls. The types
+# need no place in the key, the class of the target gives the type of the result (InitOps of different types have
+# different classes).
+class ValueNumbering:
+
+    # Class of each key seen: the history of a qubit state, what operation and input argument generate it, reduced to the
+    # classes of its operands. Key: operation key, (index,) of an input argument or (name, type) of an InitOp ; Value: class
+    classes: dict[tuple, int]
+    # Class of each qubit state numbered, by id of the SSAValue, with the SSAValue: it is kept alive as long as the
+    # numbering, so its id is not reused by a value created meanwhile
+    numbers: dict[int, tuple[SSAValue, int]]
 
-    for use in current_uses:
-        if isinstance(use.operation, MeasureOp):
-            current_measured = True
-            break
-    
-    for use in existing_uses:
-        if isinstance(use.operation, MeasureOp):
-            existing_measured = True
-            break
-    
-    if current_measured and existing_measured:
-        return True
-    else:
-        return False
+    def __init__(self):
+        self.classes = {}
+        self.numbers = {}
+
+    # class of a value.
+    # The results of operations already passed in CSEDriver have one. Function arguments, initialized qubits and results
+    # of operations inserted by the driver get it here.
+    def number(self, value: SSAValue) -> int:
+        cached = self.numbers.get(id(value))
+        if cached is not None:
+            return cached[1]
+        if isinstance(value, BlockArgument): # input argument
+            key = (value.index,)
+        elif isinstance(value, OpResult):
+            if isinstance(value.owner, InitOp): # newly initialized, every InitOp of the same type gives the same value
+                key = (value.owner.name, value.type)
+            else:
+                key = self.operation_key(value.owner)
+        else:
+            raise TypeError("Operand not present in dictionary nor an input argumnent or a result of an operation")
+        return self.set_number(value, key)
 
+    # give value the class of key
+    def set_number(self, value: SSAValue, key: tuple) -> int:
+        number = self.classes.setdefault(key, len(self.classes))
+        self.numbers[id(value)] = (value, number)
+        return number
+
+    # key of an operation: name, sorted classes of the controls and class of the target
+    def operation_key(self, op: Operation) -> tuple:
+        operands = op.operands
+        controls = tuple(sorted([self.number(operand) for operand in operands[:-1]]))
+        return (op.name, controls, self.number(operands[-1]))
 
-                            ##### CLASSES TO HELP CSE MANAGMENT #####
-   
 # OperationInfo is a class that contains the operation and some useful information about it.
 # It is used to compute the hash of the operations for the knownOps dictionary and to implement transformation-specific logic when two
 # operation are equal.
-# The hash is used by the dictionary KnownOps to check if two OperationInfo are equal.      
+# Operations are compared by their key in a ValueNumbering, a tuple of a few integers whatever the depth of the logic
+# computing their operands, hashed and compared in O(1).
+# The hash is used by the dictionary KnownOps to check if two OperationInfo are equal.
 @dataclass
 class OperationInfo:
     # operation for which we store the info
     op: Operation
-    # tuple containing the operands of the operation and their history in terms of operations generating
-    # the SSAValues
-    operandsHistory: tuple
+    # name, sorted classes of the controls and class of the target of the operation
+    key: tuple
     # hash of the operation
     _hash: int
 
@@ -115,87 +109,21 @@ class OperationInfo:
     @property
     def result_types(self):
         return self.op.result_types
-    
-    @property
-    def operands(self):
-        return self.op.operands._op._operands
-
-    # recursive function to get all the operands of an operation
-    def sub_operand(self, operand: OpResult, qh : dict,qHashes:dict) -> tuple:
-        all_operand = tuple() 
-        all_hashes = tuple()
-        all_operand += (operand.owner.name,) # take the name of the operation that use the operand
-        all_hashes += (hash(operand.owner.name),) # hash the name of the operation that use the operand
-
-        # order according to qubit number in order to catch the same operation with different operand order
-        # sort only the operands, not the result
-        operandlist = sorted(operand.owner.operands[:-1],key=lambda x: int(re.search(r'q(\d+)_',x._name).group(1))) + [operand.owner.operands[-1]]
-                             
-        # for every operand in the operation
-        for sub_operand in operandlist:
-            operandHistory = qh.get(sub_operand._name) 
-            operandHashes = qHashes.get(sub_operand._name)
-            # here the operand is in the dictionary since it is the result of an operation already passed in CSEDriver.
-            if(operandHistory is not None and operandHashes is not None): 
-                all_operand += operandHistory
-                all_hashes += (operandHashes,)
-            else:
-                raise TypeError("Error, the operand is not in the dictionary",sub_operand._name, sub_operand, operandHistory,operandHashes)
-                        
-        return all_operand,all_hashes
-    
-    # Get the operands of the operation for which the OperationInfo is built
-    def __init__(self,op: Operation,qh: dict, qHashes:dict):
-        self.op=op
-
-        all_operands = tuple()
-        all_hashes = tuple()
-        # order according to qubit number in order to catch the same operation with different operand order
-        # sort only the operands, not the result
-        operandlist = sorted(self.operands[:-1],key=lambda x: int(re.search(r'q(\d+)_',x._name).group(1))) + [self.operands[-1]]
-
-        for operand in operandlist:
-            operandHistory = qh.get(operand._name)
-            operandHash = qHashes.get(operand._name)
-            if(operandHistory is not None and operandHash is not None): # check if the operand history is already memorized
-                all_operands += operandHistory
-                all_hashes += (operandHash,)
-            elif isinstance(operand, BlockArgument):# else if it is an input argument
-                qh[operand._name] = (operand.index,) # add to dict
-                currentHash = hash(operand.index)   
-                qHashes[operand._name] = currentHash # add to dict
-
-                all_operands += (operand.index,)
-                all_hashes += (currentHash,)
-            elif isinstance(operand, OpResult):
-                if isinstance(operand.owner, InitOp):# if it is newly initialized
-                    qh[operand._name] = (operand.owner.name,) # add to dict
-                    currentHash = hash(operand.owner.name)
-                    qHashes[operand._name] = currentHash # add to dict
-
-                    all_operands += (operand.owner.name,)
-                    all_hashes += (currentHash,)
-                else:
-                    sub_operands,sub_hashes = self.sub_operand(operand,qh,qHashes)
-                    all_operands += sub_operands
-                    all_hashes += sub_hashes
-            else:
-                raise TypeError("Operand not present in dictionary nor an input argumnent or a result of an operation")
-        
-        # add the result of the operation to the dict. Following operations using this result will find its
-        # history already memorized
-        qh[op.res._name] = (op.name,all_operands,)
-        qHashes[op.res._name] = hash((op.name,all_hashes,))
 
-        self.operandsHistory = all_operands
+    def __init__(self, op: Operation, numbering: ValueNumbering):
+        self.op = op
+        self.key = numbering.operation_key(op)
+        self._hash = hash(self.key)
 
-        self._hash= hash((self.name,self.result_types,all_hashes))
+        # give its class to the result of the operation. Following operations using this result will find it
+        # already memorized
+        numbering.set_number(op.results[0], self.key)
 
     def __hash__(self):
         return self._hash
 
     def __eq__(self, other: object):
-        return self.name == other.name and self.operandsHistory == other.operandsHistory and self.result_types == other.result_types
+        return self.key == other.key
     
 # A dictionary used to store the passed operations during the MLIR traversing.
 # OperationInfo is the key, Operation is the value.
@@ -227,6 +155,64 @@ class KnownOps:
         return self._known_ops.pop(k)
 
 
+# Use chains of the qubit states (SSAValues) with the position of the operations in their block.
+# The chain of an SSAValue is its list of uses, that xDSL keeps up to date when the driver replaces and erases
+# operations: the operations reading it (as control or measure) and the one writing it (using it as target, at most one).
+# The positions are given once for each block, an operation inserted by the driver takes the position of the one it replaces.
+# So the legality checks look at the uses of two SSAValues and never scan the block.
+class UseChains:
+
+    positions: dict[Operation, int]
+
+    def __init__(self):
+        self.positions = {}
+
+    def add(self, op: Operation, position: int):
+        self.positions[op] = position
+
+    def remove(self, op: Operation):
+        del self.positions[op]
+
+    # position of the last operation using value, -1 if it is not used
+    def last_use(self, value: SSAValue) -> int:
+        return max((self.positions[use.operation] for use in value.uses), default=-1)
+
+    # operation writing value, None if it is not written
+    def writer(self, value: SSAValue) -> Operation | None:
+        for use in value.uses:
+            if not isinstance(use.operation, MeasureOp) and use.operation.operands[-1] == value:
+                return use.operation
+        return None
+
+    def measured(self, value: SSAValue) -> bool:
+        return any(isinstance(use.operation, MeasureOp) for use in value.uses)
+
+# Union-find of the qubit numbers renamed by the eliminations.
+# When an operation is replaced, the following states of its qubit become states of the qubit of the existing operation.
+# Instead of renaming them in all the following operations at each elimination, the driver records old -> new here and
+# gives each result its qubit when it reaches it, following the renamings recorded before it.
+class QubitAliases:
+
+    parent: dict[int, int]
+
+    def __init__(self):
+        self.parent = {}
+
+    # qubit number that qubit has been renamed to
+    def find(self, qubit: int) -> int:
+        parent = self.parent
+        while qubit in parent:
+            # path halving
+            grandparent = parent.get(parent[qubit])
+            if grandparent is not None:
+                parent[qubit] = grandparent
+            qubit = parent[qubit]
+        return qubit
+
+    # the following states of qubit old are states of qubit new
+    def union(self, old: int, new: int):
+        if old != new:
+            self.parent[old] = new
 
                             ##### CLASS TO MANAGE CSE TRANSFORMATIONS #####
 
@@ -234,36 +220,38 @@ class CSEDriver:
     # Rewriter used to modify MLIR
     _rewriter: Rewriter
     # Dict of the already passed operations
-    _known_ops: KnownOps = KnownOps()
-
-    # Dict with the history of the qubits in the program.
-    # Key: qubit._name ; Value: tuple with the history
-    qubitHistories : dict[str,tuple]
+    _known_ops: KnownOps
 
-    # Dict memorizing the hash of the history of the qubits. Used in order to reduce hash computation time.
-    #  History means what operation and input argument generate these qubits. Key: qubit._name ; Value: hash of the tuple of the history
-    qubitHashes : dict[str,int]
+    # Classes of the qubit states in the program
+    numbering : ValueNumbering
     
     # Builder for inserting new operations
     builder: Builder
     # counter for keeping track of the current highest qubit number
-    max_qubit: int = 0
+    max_qubit: int
 
-    passedOperations : set
+    # Use chains of the qubit states, for the legality checks
+    chains : UseChains
+    # Qubit numbers renamed by the eliminations
+    aliases : QubitAliases
 
-    same_qubit: int = 0
-    cse_eliminations: int = 0
+    same_qubit: int
+    cse_eliminations: int
 
+    # all the state lives in the instance, a driver is created for each run of the pass
     def __init__(self):
         self._rewriter = Rewriter()
         self._known_ops = KnownOps()
-        self.qubitHistories = {}
-        self.qubitHashes = {}
-        self.passedOperations = set()
+        self.numbering = ValueNumbering()
+        self.chains = UseChains()
+        self.aliases = QubitAliases()
+        self.max_qubit = 0
         self.same_qubit = 0
+        self.cse_eliminations = 0
 
     def _commit_erasure(self, op: Operation):
         if op.parent is not None:
+            self.chains.remove(op)
             self._rewriter.erase_op(op)
 
     # replace the SSAValue of the current operation with the existing one
@@ -274,16 +262,8 @@ class CSEDriver:
         for o, n in zip(op.results, existing.results, strict=True):
             o.replace_by(n)
 
-        next_op = op.next_op
-        
-        # change the name accordingly
-        while next_op != None:
-            if next_op.res._name.split('_')[0] == op.res._name.split('_')[0]:
-                next_op.res._name = existing.res._name.split('_')[0] + "_" + next_op.res._name.split('_')[1]
-            for attr in next_op.operands:
-                if attr._name.split('_')[0] == op.results[0]._name.split('_')[0]:
-                    attr._name = existing.results[0]._name.split('_')[0] + "_" + next_op.results[0]._name.split('_')[1]
-            next_op = next_op.next_op
+        # change the qubit accordingly: the following operations get it when _simplify_block reaches them
+        self.aliases.union(qubit_of(op.res), qubit_of(existing.res))
 
         # if there are no uses delete the operation
         if all(not r.uses for r in op.results):
@@ -295,35 +275,40 @@ class CSEDriver:
         if isinstance(op, InitOp) or isinstance(op, ModuleOp) or isinstance(op, FuncOp) or isinstance(op, MeasureOp):
             return
 
-        self.passedOperations.add(op)
-
         # check if CCNotOp has two equal control qubits.
         # In that case we can replace it with a CNotOp
         if isinstance(op, CCNotOp) and (op.control1 == op.control2):
             self.same_qubit += 1
             self.builder = Builder.before(op)
             cnotOp = self.builder.insert(CNotOp.from_value(op.control1, op.target))
+            self.chains.add(cnotOp, self.chains.positions[op])
+            # the new result is the same state of the same qubit, it must be known before the renaming in _replace_and_delete
+            set_qubit(cnotOp.res, *qubit_key(op.res))
             self._replace_and_delete(op, cnotOp)
-            cnotOp.res._name = op.res._name
+            set_qubit(cnotOp.res, *qubit_key(op.res))
+            # the CCNotOp is erased, the CNotOp takes its place
+            op = cnotOp
         
         # check if CNotOp has equal control and target qubits.
         # In that case we can replace it with an InitOp
         if isinstance(op, CNotOp) and (op.control == op.target):
             self.same_qubit += 1
             self.builder= Builder.before(op)
-            initOp = self.builder.insert(InitOp.from_value(IntegerType(1)))
-            initOp.res._name = "q" + str(self.max_qubit + 1) + "_0"
+            initOp = self.builder.insert(InitOp.from_value(op.target.type))
+            self.chains.add(initOp, self.chains.positions[op])
+            set_qubit(initOp.res, self.max_qubit + 1)
             self.max_qubit += 1
             self._replace_and_delete(op, initOp)
+            return
 
-        opInfo = OperationInfo(op,self.qubitHistories,self.qubitHashes)
+        opInfo = OperationInfo(op, self.numbering)
 
         # check if the operation is already known
         if existing := self._known_ops.get(opInfo):
 
             # if the existing op(qubit) will not be changed in the future we can replace the current operation
-            if not has_other_modifications(existing,self.passedOperations) and not has_read_after_write(op, existing) \
-                and not both_measured(op, existing):
+            if not has_other_modifications(op, existing, self.chains) and not has_read_after_write(op, existing, self.chains) \
+                and not both_measured(op, existing, self.chains):
 
                 self._replace_and_delete(op, existing)
                 self.cse_eliminations += 1
@@ -336,11 +321,20 @@ class CSEDriver:
     # simplify the block
     def _simplify_block(self, block: Block):
         
-        for op in block.ops:
+        for position, op in enumerate(block.ops):
             if isinstance(op, InitOp):
-                self.max_qubit = max(self.max_qubit, int(op.res._name.split('_')[0][1:]))
+                self.max_qubit = max(self.max_qubit, qubit_of(op.res))
+            self.chains.add(op, position)
 
         for op in block.ops:
+            # rename the qubit of the result after the eliminations before the operation
+            if self.aliases.parent and op.results:
+                res = op.results[0]
+                qubit, version = qubit_key(res)
+                alias = self.aliases.find(qubit)
+                if alias != qubit:
+                    set_qubit(res, alias, version)
+
             if op.regions:
                 might_be_isolated = isinstance(op, UnregisteredOp) or (op.get_trait(IsolatedFromAbove) is not None)
                 if might_be_isolated:
@@ -386,8 +380,8 @@ class CSEDriver:
                             ##### MAIN CLASS TO INVOKE THE TRANSFORMATION #####
 
 class CommonSubexpressionElimination(ModulePass):
-    same_qubit: int = 0 
-    cse_eliminations:int = 0
+    same_qubit: int
+    cse_eliminations:int
 
     cseDriver: CSEDriver
 
@@ -397,4 +391,6 @@ class CommonSubexpressionElimination(ModulePass):
         self.cse_eliminations += self.cseDriver.cse_eliminations
 
     def __init__(self):
-        self.cseDriver = CSEDriver()
\ No newline at end of file
+        self.cseDriver = CSEDriver()
+        self.same_qubit = 0
+        self.cse_eliminations = 0
\ No newline at end of file
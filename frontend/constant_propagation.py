@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import dataclasses
+from dataclasses import dataclass
+
+from backend.JSON_to_DataClasses import (
+    ASTNode,
+    Assignment,
+    BinaryOp,
+    ContinuousAssign,
+    Conversion,
+    Instance,
+    InstanceBody,
+    IntegerLiteral,
+    NamedValue,
+    Port,
+    ProceduralBlock,
+    Root,
+    UnaryOp,
+)
+from frontend.ir_gen import bit_width, constant_value
+
+# Constant propagation on the dataclass AST, before the IR generation.
+# The constants of the source (1'b0, ~1'b0, ...) and the input ports fixed to a constant by a specialization are folded
+# through the AND, OR, XOR and NOT operations, instead of becoming qubits that the gates read:
+# - an operation on constants is a constant;
+# - a & 0 is 0, a | 1 is 1 (all ones for a register), a & 1, a | 0 and a ^ 0 are a, a ^ 1 is ~a;
+# - a variable assigned a constant is replaced by the constant where it is read.
+# The operations are simplified with the boolean identities on the way (a & c | a is a, ~~a is a, a ^ a is 0, ...), see
+# ConstantPropagation.simplify: the gates they would need are never generated, instead of being left to CSE and to
+# HermitianGatesElimination.
+# A specialized input port is removed from the ports of its module, so it gets no qubit.
+# IRGen generates an operation at the width of its operands, before slang zero-extends them to the width of the
+# assignment (see IRGen.value_type): the constants are folded at that width too.
+# The nodes that don't change are shared with the original tree, the others are new: the AST given is never modified
+# (it can be the one of the AST cache).
+
+class SpecializationError(Exception):
+    pass
+
+# Constant value of an expression, on the number of bits IRGen computes it on
+@dataclass(frozen=True)
+class Constant:
+    value: int
+    width: int
+
+    # Bits of the constant set to 1
+    @property
+    def ones(self) -> int:
+        return (1 << self.width) - 1
+
+# Node of a constant, as slang writes them: 4'b1111
+def constant_node(constant: Constant) -> Conversion:
+    width = constant.width
+    type = "logic" if width == 1 else f"logic[{width - 1}:0]"
+    text = f"{width}'b{constant.value:0{width}b}"
+    return Conversion(kind='Conversion', type=type, operand=IntegerLiteral(kind='IntegerLiteral', type=f"bit[{width - 1}:0]", value=text, constant=text), constant=text)
+
+class ConstantPropagation():
+    # Input ports fixed to a constant, by name
+    constants: dict[str, int]
+    # Number of operations folded away
+    folds: int
+    # Number of input ports removed
+    removed_inputs: int
+    # Rewrite the operations with the boolean identities too, see simplify
+    simplification: bool
+    # Number of operations removed by the boolean identities
+    simplifications: int
+    # Value number of each subtree of the module, by operation and value numbers of its operands
+    numbers: dict[tuple, int]
+    # Value number and shape of the expression assigned to each variable, by symbol, see shape
+    variables: dict
+    # Names of the input ports of constants met in the modules
+    found: set[str]
+    # Constant value of each variable of the module known so far, by symbol
+    values: dict
+    # Width and value number of each subtree of the expression being folded, by id of the node, see subtree
+    subtrees: dict[int, tuple[int, int]]
+
+    def __init__(self, constants: dict[str, int] | None = None, simplification: bool = True):
+        self.constants = dict(constants or {})
+        self.simplification = simplification
+        self.folds = 0
+        self.removed_inputs = 0
+        self.simplifications = 0
+        self.numbers = {}
+        self.variables = {}
+        self.found = set()
+        self.values = {}
+        self.subtrees = {}
+
+    # Root with the constants of every module propagated
+    def apply(self, root: Root) -> Root:
+        self.found = set()
+        members = [dataclasses.replace(member, body=self.propagate_module(member.body)) if isinstance(member, Instance) else member
+                   for member in root.members]
+        unknown = set(self.constants) - self.found
+        if unknown:
+            raise SpecializationError(f"No input port named {', '.join(sorted(unknown))}")
+        return dataclasses.replace(root, members=members)
+
+    # Body of a module with its constants propagated, in the order of its members.
+    # A variable assigned a constant is read as the constant by the assignments after it. Its own assignment is kept, the
+    # dead logic elimination of IRGen drops it if the variable is not an output.
+    def propagate_module(self, body: InstanceBody) -> InstanceBody:
+        # constant value of each variable known so far, by symbol
+        values = {}
+        self.values = values
+        self.numbers = {}
+        self.variables = {}
+        members = []
+        for member in body.members:
+            if isinstance(member, Port) and member.direction == "In" and member.name in self.constants:
+                values[member.internalSymbol] = self.input_value(member)
+                self.found.add(member.name)
+                self.removed_inputs += 1
+            elif isinstance(member, ContinuousAssign):
+                members.append(dataclasses.replace(member, assignment=self.propagate_assignment(member.assignment, values)))
+            elif isinstance(member, ProceduralBlock):
+                statement = member.body.body
+                if isinstance(statement, list):
+                    statement = [dataclasses.replace(s, expr=self.propagate_assignment(s.expr, values)) for s in statement]
+                else:
+                    statement = dataclasses.replace(statement, expr=self.propagate_assignment(statement.expr, values))
+                members.append(dataclasses.replace(member, body=dataclasses.replace(member.body, body=statement)))
+            else:
+                members.append(member)
+        return dataclasses.replace(body, members=members)
+
+    # Value of a specialized input port. A register is initialized with a single gate, so it can only be all zeros or
+    # all ones (see IRGen.all_ones).
+    def input_value(self, port: Port) -> Constant:
+        constant = Constant(self.constants[port.name], bit_width(port.type))
+        if constant.value not in (0, constant.ones):
+            if bit_width(port.type) == 1:
+                raise SpecializationError(f"Input port {port.name} is a single bit, it can't be {constant.value}")
+            raise SpecializationError(f"Input port {port.name} of type {port.type} can only be fixed to all zeros or all ones, not {constant.value}")
+        return constant
+
+    # Assignment with its right side folded. The constant value of its variable is recorded in values, or forgotten if it
+    # is not a constant anymore (a variable assigned again in a procedural block).
+    def propagate_assignment(self, assignment: Assignment, values: dict) -> Assignment:
+        right, _ = self.fold(assignment.right, values)
+        if isinstance(right, Constant):
+            values[assignment.left.symbol] = right
+            self.variables.pop(assignment.left.symbol, None)
+            right = constant_node(right)
+        else:
+            values.pop(assignment.left.symbol, None)
+            # the variable is read as the value of its expression by the assignments after it
+            shape = self.shape(right)
+            self.variables[assignment.left.symbol] = self.subtree(right)[1], shape and shape[:2]
+            if isinstance(right, Conversion) and isinstance(right.operand, NamedValue):
+                # a variable copied, on its own bits as the operations
+                right = right.operand
+        if right is assignment.right:
+            return assignment
+        return dataclasses.replace(assignment, right=right)
+
+    # Folded expr, a Constant or the node of the expression, and the number of bits IRGen computes it on.
+    # Iterative in post-order, the expressions can be deeper than the Python recursion limit. Each subtree is folded
+    # (and simplified) once, after its operands: the rules only look at the operands and at their operands, which are
+    # already final, so a single pass reaches the fixed point.
+    def fold(self, expr: ASTNode, values: dict) -> tuple[ASTNode | Constant, int]:
+        self.subtrees = {}
+        results = {}
+        stack = [(expr, False)]
+        while stack:
+            node, visited = stack.pop()
+            if isinstance(node, BinaryOp):
+                if not visited:
+                    stack += [(node, True), (node.right, False), (node.left, False)]
+                    continue
+                results[id(node)] = self.fold_binary(node, results.pop(id(node.left)), results.pop(id(node.right)))
+            elif isinstance(node, UnaryOp):
+                if not visited:
+                    stack += [(node, True), (node.operand, False)]
+                    continue
+                results[id(node)] = self.fold_unary(node, results.pop(id(node.operand)))
+            elif isinstance(node, NamedValue):
+                results[id(node)] = self.variable(node, node.symbol, bit_width(node.type), values)
+            elif isinstance(node, Conversion) and isinstance(node.operand, NamedValue):
+                # a variable zero-extended, computed on the bits of the variable
+                results[id(node)] = self.variable(node, node.operand.symbol, bit_width(node.operand.type), values)
+            elif isinstance(node, Conversion) and node.constant is not None and constant_value(node.constant) is not None:
+                width = bit_width(node.type)
+                results[id(node)] = Constant(constant_value(node.constant) & ((1 << width) - 1), width)
+            else:
+                results[id(node)] = self.numbered(node, bit_width(node.type), ("node", id(node)))
+        folded = results[id(expr)]
+        return folded, self.subtree(folded)[0]
+
+    # Value of the variable read by node: its constant if it has one, node otherwise.
+    # A variable assigned before has the value number of its expression, an input or a variable read before its
+    # assignment one of its own.
+    def variable(self, node: ASTNode, symbol, width: int, values: dict) -> ASTNode | Constant:
+        if symbol in values:
+            return values[symbol]
+        if symbol in self.variables:
+            self.subtrees[id(node)] = width, self.variables[symbol][0]
+            return node
+        return self.numbered(node, width, ("var", symbol))
+
+    # Record the width of a node of the folded expression and its value number: two subtrees with the same number compute
+    # the same value. key is the operation and the numbers of the operands, sorted as the operations commute.
+    def numbered(self, node: ASTNode, width: int, key: tuple) -> ASTNode:
+        self.subtrees[id(node)] = width, self.numbers.setdefault(key, len(self.numbers))
+        return node
+
+    # Width and value number of a folded subtree
+    def subtree(self, folded: ASTNode | Constant) -> tuple[int, int]:
+        if isinstance(folded, Constant):
+            return folded.width, self.numbers.setdefault(("const", folded.value, folded.width), len(self.numbers))
+        return self.subtrees[id(folded)]
+
+    def fold_unary(self, node: UnaryOp, operand: ASTNode | Constant) -> ASTNode | Constant:
+        if node.op != "BitwiseNot":
+            raise SpecializationError(f"Unknown unary operation {node.op}")
+        if isinstance(operand, Constant):
+            self.folds += 1
+            return Constant(operand.value ^ operand.ones, operand.width)
+        return self.negation(operand, node)
+
+    # NOT of operand, node is the UnaryOp to keep if its operand didn't change
+    def negation(self, operand: ASTNode, node: UnaryOp) -> ASTNode:
+        shape = self.shape(operand) if self.simplification else None
+        if shape is not None and shape[0] == "BitwiseNot":          # ~~a is a
+            negated = self.reuse(shape[1][0], shape[2])
+            if negated is not None:
+                self.simplifications += 1
+                return negated
+        if operand is not node.operand:
+            node = dataclasses.replace(node, operand=operand)
+        width, number = self.subtree(operand)
+        return self.numbered(node, width, ("BitwiseNot", number))
+
+    def fold_binary(self, node: BinaryOp, left: ASTNode | Constant, right: ASTNode | Constant) -> ASTNode | Constant:
+        (width, left_number), (right_width, right_number) = self.subtree(left), self.subtree(right)
+        if isinstance(left, Constant) and isinstance(right, Constant):
+            self.folds += 1
+            width = max(width, right_width)
+            if node.op == "BinaryAnd":
+                return Constant(left.value & right.value, width)
+            if node.op == "BinaryOr":
+                return Constant(left.value | right.value, width)
+            if node.op == "BinaryXor":
+                return Constant(left.value ^ right.value, width)
+            raise SpecializationError(f"Unknown binary operation {node.op}")
+
+        # a single constant operand, the other one is zero-extended from its own bits: the constant is folded on them,
+        # if its bits beyond are 0
+        constant, operand = (left, right) if isinstance(left, Constant) else (right, left)
+        if isinstance(constant, Constant):
+            if constant is left:
+                width = right_width
+            ones = (1 << width) - 1
+            if constant.value in (0, ones):
+                self.folds += 1
+                if node.op == "BinaryAnd":
+                    return operand if constant.value else Constant(0, width)
+                if node.op == "BinaryOr":
+                    return Constant(ones, width) if constant.value else operand
+                if node.op == "BinaryXor":
+                    return self.negation(operand, UnaryOp(kind='UnaryOp', type=node.type, op='BitwiseNot', operand=None)) if constant.value else operand
+            # a constant with bits at 0 and at 1 stays an operand
+            if constant is left:
+                left = self.numbered(constant_node(constant), width, ("const", constant.value, constant.width))
+            else:
+                right = self.numbered(constant_node(constant), width, ("const", constant.value, constant.width))
+        elif self.simplification:
+            simplified = self.simplify(node.op, left, right, left_number, right_number, width)
+            if simplified is not None:
+                self.simplifications += 1
+                return simplified
+
+        if left is not node.left or right is not node.right:
+            node = dataclasses.replace(node, left=left, right=right)
+        return self.numbered(node, width, (node.op, min(left_number, right_number), max(left_number, right_number)))
+
+    # Operation on left and right rewritten by the boolean identities, None if none applies:
+    # - idempotence: a & a and a | a are a, XOR cancellation: a ^ a is 0, (a ^ b) ^ a is b;
+    # - complementation: a & ~a is 0, a | ~a and a ^ ~a are all ones;
+    # - absorption: a & (a | b) and a | (a & b) are a.
+    # The operands are compared by value number, and an operand that reads a variable is seen as the expression assigned
+    # to it: in t = a | b; y = a & t, y is a.
+    def simplify(self, op: str, left: ASTNode, right: ASTNode, left_number: int, right_number: int, width: int) -> ASTNode | Constant | None:
+        if left_number == right_number:
+            return Constant(0, width) if op == "BinaryXor" else left
+        if self.complement(left, right_number) or self.complement(right, left_number):
+            return Constant(0, width) if op == "BinaryAnd" else Constant((1 << width) - 1, width)
+        for operand, number, other in ((left, left_number, right), (right, right_number, left)):
+            shape = self.shape(other)
+            if shape is None or shape[0] == "BitwiseNot":
+                continue
+            other_op, (first, second), local = shape
+            if op == "BinaryXor" and other_op == "BinaryXor" and number in (first[0], second[0]):
+                kept = self.reuse(second if first[0] == number else first, local)
+                if kept is not None:
+                    return kept
+            if {op, other_op} == {"BinaryAnd", "BinaryOr"} and number in (first[0], second[0]):
+                return operand
+        return None
+
+    # True if operand is the NOT of the subtree numbered number
+    def complement(self, operand: ASTNode, number: int) -> bool:
+        shape = self.shape(operand)
+        return shape is not None and shape[0] == "BitwiseNot" and shape[1][0][0] == number
+
+    # Operation computing operand, with the value number, the node and the width of each of its operands, and whether
+    # they are nodes of the expression being folded; None if operand is not an operation.
+    # The operation of a variable is the one of the expression assigned to it.
+    def shape(self, operand: ASTNode) -> tuple | None:
+        if isinstance(operand, UnaryOp):
+            operands = (operand.operand,)
+        elif isinstance(operand, BinaryOp):
+            operands = (operand.left, operand.right)
+        else:
+            if isinstance(operand, Conversion):
+                operand = operand.operand
+            entry = self.variables.get(operand.symbol) if isinstance(operand, NamedValue) else None
+            if entry is None or entry[1] is None:
+                return None
+            return *entry[1], False
+        return operand.op, tuple((self.subtree(node)[1], node, self.subtree(node)[0]) for node in operands), True
+
+    # Node for an operand of a shape: the node itself in the expression being folded. An operand of the expression of a
+    # variable is copied if it is a constant or a variable that still has the same value (it can be assigned again in a
+    # procedural block), the expression is not repeated: None otherwise.
+    def reuse(self, operand: tuple, local: bool) -> ASTNode | None:
+        number, node, width = operand
+        if local:
+            return node
+        if isinstance(node, Conversion) and isinstance(node.operand, NamedValue):
+            symbol = node.operand.symbol
+        elif isinstance(node, NamedValue):
+            symbol = node.symbol
+        elif isinstance(node, Conversion):
+            symbol = None
+        else:
+            return None
+        if symbol is not None and (symbol in self.values or number != self.variables.get(symbol, (self.numbers.get(("var", symbol)),))[0]):
+            return None
+        node = dataclasses.replace(node)
+        self.subtrees[id(node)] = width, number
+        return node
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import io
+import os
+from typing import IO
+
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Block, Region
+
+from dialect.dialect import FuncOp
+
+from backend.JSON_to_DataClasses import (
+    ASTNode,
+    ContinuousAssign,
+    ConversionContext,
+    InstanceBody,
+    JSONStreamReader,
+    Port,
+    ProceduralBlock,
+    paused_gc,
+)
+import backend.ast_cache as ast_cache
+from backend.pyslang_frontend import PyslangReader
+
+from frontend.ir_gen import IRGen, IRGenError, ScopedSymbolTable
+
+# Fused frontend: the IR is generated while the JSON produced by slang is read, without building the dataclass AST.
+# The reader converts one member of the InstanceBody at a time (a Port, a ContinuousAssign, a ProceduralBlock, ...)
+# and gives it to FusedIRGen, which lowers it with the methods of IRGen and drops it.
+# The IR is the same as the one of IRGen, only the members of a module are never all in memory at once.
+# For the same reason the later reads of a variable are not known: the liveness of IRGen is never computed, no XOR
+# is written in place on a variable, the polarity of a variable is fixed only when an operation needs it and the
+# lowering of an OR is chosen on its own gates. The assignments are lowered in the order of the source, not scheduled:
+# a variable must be assigned before it is read. The assignments that don't reach an output are lowered too, and left to
+# RemoveUnusedOperations. The constants are not propagated (see frontend/constant_propagation.py), and no input can be
+# fixed to a constant.
+# Slang lists the ports of a module (with their nets and variables) before its assignments, the arguments of the function
+# are created when the first assignment arrives.
+class FusedIRGen(IRGen):
+
+    # Block of the function being generated, None until its arguments are known
+    block: Block | None
+    # Builder to restore once the function is over
+    parent_builder: object
+    # Ports met so far in the current InstanceBody
+    proto_args: list[Port]
+    proto_return: list[Port]
+
+    def __init__(self):
+        super().__init__()
+        self.block = None
+        self.parent_builder = None
+        self.proto_args = []
+        self.proto_return = []
+
+    # Generate the module reading the JSON from a file or a pipe.
+    # The IR only grows during the generation (nothing is erased), so the cyclic garbage collector stays paused
+    # as in the conversion to dataclasses: otherwise it would rescan the whole IR over and over.
+    def ir_gen_stream(self, stream: IO, context: ConversionContext) -> ModuleOp:
+        self.context = context
+        with paused_gc():
+            JSONStreamReader(stream, context, self.ir_gen_member).read_value()
+        return self.module
+
+    # Generate the module walking the AST of slang in-process, see backend/pyslang_frontend.py
+    def ir_gen_pyslang(self, source_path: str, context: ConversionContext) -> ModuleOp:
+        self.context = context
+        with paused_gc():
+            PyslangReader(source_path, context, self.ir_gen_member).read()
+        return self.module
+
+    # Called by the reader with each member of an InstanceBody, then with the InstanceBody itself
+    def ir_gen_member(self, member: ASTNode) -> None:
+
+        if self.symbol_table is None:
+            self.parent_builder = self.builder
+            self.symbol_table = ScopedSymbolTable()
+
+        if isinstance(member, InstanceBody):
+            self.ir_gen_function_end(member)
+            return
+
+        if isinstance(member, Port):
+            if member.direction == "In":
+                if self.block is not None:
+                    raise IRGenError(f"Input port {self.context.symbol_name(member.internalSymbol)} after the assignments, use the dataclass frontend")
+                self.proto_args.append(member)
+            elif member.direction == "Out":
+                self.proto_return.append(member)
+            return
+
+        # nets and variables generate no IR
+        if not isinstance(member, (ContinuousAssign, ProceduralBlock)):
+            return
+
+        if self.block is None:
+            self.block = self.ir_gen_arguments(self.proto_args)
+
+        self.ir_gen_expr(member)
+
+    # Measure the outputs and insert the function, as IRGen.ir_gen_function does
+    def ir_gen_function_end(self, body: InstanceBody) -> FuncOp:
+
+        if self.block is None:
+            self.block = self.ir_gen_arguments(self.proto_args)
+
+        self.ir_gen_measures(self.proto_return)
+
+        self.symbol_table = None
+        self.builder = self.parent_builder
+
+        func = self.builder.insert(FuncOp(body.name, Region(self.block)))
+
+        self.block = None
+        self.proto_args = []
+        self.proto_return = []
+
+        return func
+
+# Generate the IR of the slang output given as bytes, as the path of a file or as an open file (or pipe).
+# The path of a SystemVerilog source can be given too, slang is then run on it with the given frontend.
+# ir_gen is the FusedIRGen to use, with its options already set, a new one with the default options if None.
+def fused_ir_gen(source: bytes | str | os.PathLike | IO, compact: bool = False, frontend: str = 'binary',
+                 ir_gen: FusedIRGen | None = None) -> ModuleOp:
+    if ir_gen is None:
+        ir_gen = FusedIRGen()
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if ast_cache.is_verilog(source):
+        if frontend == 'pyslang':
+            return ir_gen.ir_gen_pyslang(source, ConversionContext(compact))
+        with ast_cache.slang_json(source) as json_path:
+            return fused_ir_gen(json_path, compact, ir_gen=ir_gen)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            return fused_ir_gen(file, compact, ir_gen=ir_gen)
+    return ir_gen.ir_gen_stream(source, ConversionContext(compact))
@@ -7,6 +7,7 @@ from xdsl.traits import IsolatedFromAbove
 from dataclasses import dataclass
 
 from dialect.dialect import FuncOp, MeasureOp, InitOp
+from dialect.qubits import qubit_key, qubit_of, set_qubit, version_of
 
                             ##### SUPPORT FUNCTION #####
 
@@ -34,7 +35,7 @@ class OperationInfo:
 
     def __init__(self, op: Operation):
         self.op = op
-        self.hash = hash((self.name, tuple(operand._name for operand in self.operands[:-1]), self.operands[-1]._name.split('_')[0]))
+        self.hash = hash((self.name, tuple(qubit_key(operand) for operand in self.operands[:-1]), qubit_of(self.operands[-1])))
         
     @property
     def name(self):
@@ -91,14 +92,16 @@ class KnownOps:
 class HGEDriver:
 
     _rewriter: Rewriter
-    _known_ops: KnownOps = KnownOps()
-    hge_eliminations: int = 0
+    _known_ops: KnownOps
+    hge_eliminations: int
     passedOperations: set
 
+    # all the state lives in the instance, a driver is created for each run of the pass
     def __init__(self):
         self._rewriter = Rewriter()
         self._known_ops = KnownOps()
         self.passedOperations = set()
+        self.hge_eliminations = 0
 
     # delete an operation
     def _commit_erasure(self, op: Operation):
@@ -128,8 +131,8 @@ class HGEDriver:
             return
         
         # renaming of the state of the qubits if any trasformation has changed the temporal sequence
-        if int(op.res._name.split('_')[1]) != int(op.target._name.split('_')[1]) + 1:
-            op.res._name = op.res._name.split('_')[0] + '_' + str(int(op.target._name.split('_')[1]) + 1)
+        if version_of(op.res) != version_of(op.target) + 1:
+            set_qubit(op.res, qubit_of(op.res), version_of(op.target) + 1)
 
         # MeasureOp may need a rename but is never simplified
         if isinstance(op, MeasureOp):
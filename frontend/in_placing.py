@@ -3,6 +3,7 @@ from xdsl.pattern_rewriter import PatternRewriter, RewritePattern
 from xdsl.builder import Builder
 from xdsl.rewriter import Rewriter
 from dialect.dialect import CNotOp,FuncOp,InitOp,NotOp
+from dialect.qubits import next_version, qubit_key, qubit_of
 from xdsl.dialects.builtin import ModuleOp
 
 
@@ -13,11 +14,13 @@ class InPlacing(RewritePattern):
     rewriter : Rewriter
     maxqubit : int
     passedOperation: set
-    inplacing_gate_elim: int = 0
-    inplacing_init_elim: int = 0
+    inplacing_gate_elim: int
+    inplacing_init_elim: int
 
     def __init__(self):
         self.passedOperation = set()
+        self.inplacing_gate_elim = 0
+        self.inplacing_init_elim = 0
 
     # Find the unused control bit to write the xor results on.
     def unused_operand(self,cnot_list : list):
@@ -69,7 +72,7 @@ class InPlacing(RewritePattern):
         if previous_op.name == "quantum.init" and op.name == "quantum.cnot":
             # The cnot must target the qubit initialized by the init.
             init_op = previous_op
-            if previous_op.res._name != op.target._name:
+            if qubit_key(previous_op.res) != qubit_key(op.target):
                 return
 
             cnot_list = [] # List for the cnot chain.
@@ -77,7 +80,7 @@ class InPlacing(RewritePattern):
             cnot_list.append(op)
             full_list.append(op)
             next_op = op._next_op
-            while ((next_op.name == "quantum.cnot" or next_op.name == "quantum.not") and op.res._name.split('_')[0] == next_op.res._name.split('_')[0]):
+            while ((next_op.name == "quantum.cnot" or next_op.name == "quantum.not") and qubit_of(op.res) == qubit_of(next_op.res)):
                 if next_op.name =="quantum.not":
                     full_list.append(next_op)
                     cnot_list.append(next_op)
@@ -109,12 +112,12 @@ class InPlacing(RewritePattern):
                     if cnot.name == "quantum.cnot":
                         newcnot = builder.insert(CNotOp.from_value(cnot.control, qubit_to_pass))
                         self.inplacing_gate_elim -=1 # consider the cnots that remain  
-                        newcnot.res._name = qubit_to_pass._name.split('_')[0] + "_" + str(int(qubit_to_pass._name.split('_')[1]) + 1)
+                        next_version(newcnot.res, qubit_to_pass)
                         self.passedOperation.add(newcnot) # add the new op to the set of passed operations
                         qubit_to_pass = newcnot.res
                     else:
                         newnot = builder.insert(NotOp.from_value(qubit_to_pass))
-                        newnot.res._name = qubit_to_pass._name.split('_')[0] + "_" + str(int(qubit_to_pass._name.split('_')[1]) + 1)
+                        next_version(newnot.res, qubit_to_pass)
                         qubit_to_pass = newnot.res
                         self.inplacing_gate_elim -=1
 
@@ -144,7 +147,7 @@ class InPlacing(RewritePattern):
                 target_idx = len(operands)-1
                 if(operands[target_idx] == full_list[-1].res): # if the old result is target
                     operands[target_idx] = qubit_to_pass
-                    future_op.res._name = qubit_to_pass._name.split('_')[0] + "_" + str(int(qubit_to_pass._name.split("_")[1])+1)
+                    next_version(future_op.res, qubit_to_pass)
                 else: # it's a control
                     operands[operands.index(full_list[-1].res)] = qubit_to_pass
                 
@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import NoReturn
+from typing import Generator, NoReturn
 
 from xdsl.builder import Builder
-from xdsl.dialects import builtin
 from xdsl.dialects.builtin import ModuleOp, IntegerType, VectorType
 from xdsl.ir import Block, Region, SSAValue
 
+from bisect import bisect_left
+from heapq import heapify, heappop, heappush
 import re
 
 from dialect.dialect import (
@@ -19,6 +20,8 @@ from dialect.dialect import (
     FuncOp,
 )
 
+from dialect.qubits import next_version, qubit_of, set_qubit
+
 from backend.JSON_to_DataClasses import (
     ASTNode,
     Assignment,
@@ -33,26 +36,69 @@ from backend.JSON_to_DataClasses import (
     NamedValue,
     Port,
     Root,
+    ConversionContext,
 )
 
 
+# Lowerings of the OR, see IRGen.ir_gen_or.
+# There is no in-place lowering: b = a | b is irreversible (with a = 1, b = 0 and b = 1 both give 1), so an OR written on
+# the qubit of an operand still needs a third qubit for a & b and costs the same gates as the XOR form.
+OR_LOWERINGS = ('demorgan', 'xor')
+
 class IRGenError(Exception):
     pass
 
+# Number of bits of a SystemVerilog type, logic[7:0] has 8
+def bit_width(type: str) -> int:
+    match = re.search(r"\[(\d+):(\d+)\]", type)
+    if match is None:
+        return 1
+    return abs(int(match.group(1)) - int(match.group(2))) + 1
+
+# Type of the qubits holding a value: a single qubit for one bit, a register (vector of qubits) for a packed array.
+# The operations act on whole registers, bit by bit: they are expanded to gates on single qubits only when the
+# circuit is exported, see dialect/qubits.py
+def register_type(width: int, vector: bool) -> IntegerType | VectorType:
+    if vector:
+        return VectorType(IntegerType(1), [width,])
+    return IntegerType(1)
+
+# Value of a SystemVerilog constant (6'b101010, 8'hff, 3'd5), None if it has unknown (x or z) bits
+def constant_value(constant: str) -> int | None:
+    digits = constant.split("'")[-1].lstrip("sS")
+    base = {"b": 2, "o": 8, "d": 10, "h": 16}.get(digits[:1].lower())
+    try:
+        return int(digits[1:], base) if base else int(digits)
+    except ValueError:
+        return None
+
+# A value computed by IRGen: the qubit holding it, and whether the value is the complement of what the qubit holds.
+# The qubit itself can hold its values complemented too, see IRGen.polarity.
+@dataclass(frozen=True)
+class QubitValue:
+    qubit: int
+    negated: bool = False
+
+    # The complement of the value, on the same qubit: a NOT of the verilog emits no gate
+    def __invert__(self) -> QubitValue:
+        return QubitValue(self.qubit, not self.negated)
+
+# Lowering of an expression: a generator that yields the lowerings of its sub-expressions, receives back their values
+# and returns the value of the expression. See IRGen.lower
+Lowering = Generator['Lowering', QubitValue, QubitValue]
+
 @dataclass
 class ScopedSymbolTable:
-    "A mapping from variable names to SSAValues, append-only"
-    table: dict[str, SSAValue] = field(default_factory=dict)
+    "A mapping from variable names to QubitValues"
+    table: dict[str, QubitValue] = field(default_factory=dict)
 
     def __contains__(self, __o: object) -> bool:
         return __o in self.table
 
-    def __getitem__(self, __key: str) -> SSAValue:
+    def __getitem__(self, __key: str) -> QubitValue:
         return self.table[__key]
 
-    def __setitem__(self, __key: str, __value: SSAValue) -> None:
-        if __key in self:
-            raise AssertionError(f"Cannot add value for key {__key} in scope {self}")
+    def __setitem__(self, __key: str, __value: QubitValue) -> None:
         self.table[__key] = __value
 
 
@@ -63,27 +109,124 @@ class IRGen:
 
     builder: Builder
 
-    # Stores the active SSAValues
-    # variables coming from the verilog have as key their symbol(1234567890 a), temporary SSAValues have as key their name(q4_7)
+    # Stores the value of each variable coming from the verilog, with its symbol (1234567890 a, or its integer id in the
+    # compact AST) as key. Several variables can be on the same qubit.
     symbol_table: ScopedSymbolTable | None = None
 
+    # Context of the conversion of the AST, resolves the integer symbols of the compact AST
+    context: ConversionContext | None = None
+
     n_qubit: int = 0  # n_qubits that used when generating the first IR
     n_args: int = 0   # n_args taken as input in the verilog
-    
+
+    # Polarity tracking: a NOT of the verilog only flips QubitValue.negated, the gates read the qubits as they are and
+    # the NOT gates are emitted only where a physical inversion is needed: AND needs its operands as they are, OR needs
+    # them complemented (a | b = ~(~a & ~b)) and the measures need the outputs as they are. XOR needs nothing, the
+    # inversions of its operands pass to its result.
+    # Current state of each qubit, by qubit number: a gate always reads and writes the last state of its qubits
+    states: dict[int, SSAValue]
+    # True for the qubits holding the complement of their values. A NOT gate emitted to give an operand the polarity an
+    # operation needs flips it, so the values read from the qubit don't change
+    polarity: dict[int, bool]
+    # Number of CNot and CCNot gates that wrote each qubit: a value recorded on a qubit written afterwards is lost
+    writes: dict[int, int]
+
+    # Structural hashing: an operand already computed in the function is not lowered again, the gate reads the qubit
+    # still holding it. See structural_lookup
+    structural_hashing: bool = True
+    # Number of each structure (operation and numbers of its operands) met in the function
+    structures: dict[tuple, int]
+    # Number of assignments of each variable before its current value: a variable assigned again in a procedural block
+    # is a new operand for the structures. See declare
+    generations: dict[str, int]
+    # Structure number of each sub-expression of the assignment being lowered, by id of the AST node
+    expr_numbers: dict[int, int]
+    # Value holding the result of each structure number, with the writes of its qubit when it was recorded
+    structural_table: dict[int, tuple[QubitValue, int]]
+    # Qubits read through more than one variable or sub-expression, they must not be written in place
+    shared: set[int]
+    # Number of operands read from an existing qubit instead of lowered again
+    structural_hits: int = 0
+    # Type of the value of the sub-expressions of the assignment being lowered, by id of the AST node. See value_type
+    value_types: dict[int, IntegerType | VectorType]
+    # Liveness: a XOR writes in place on a variable operand read for the last time, instead of on a new qubit.
+    # See dead_operand
+    liveness_inplacing: bool = True
+    # Index of the last assignment of the function reading each symbol, and how many times it reads it
+    last_uses: dict[str, tuple[int, int]]
+    # Reads of each symbol needing a polarity: index of the assignment and polarity needed. See compute_liveness
+    demands: dict[str, list[tuple[int, bool]]]
+    # Index of the assignment being lowered, in the order of the members of the function
+    assignment_index: int = 0
+    # Number of XORs written in place on a variable read for the last time
+    liveness_writes: int = 0
+    # Largest number of variables live at once between two assignments, in the order they are lowered. See
+    # compute_liveness
+    max_live: int = 0
+    # Dead logic elimination: the assignments whose values never reach an output are dropped before the lowering.
+    # See output_cone
+    dead_logic_elimination: bool = True
+    # Number of assignments dropped
+    dead_assignments: int = 0
+    # Variables read by each assignment of the function, by id of the assignment. See assignment_reads
+    assignments_reads: dict[int, dict[str, int]]
+    # Member of the function (index in the InstanceBody) of each of its assignments, by id of the assignment: the
+    # statements of a procedural block share it. See function_assignments
+    assignments_members: dict[int, int]
+    # Scheduling: the assignments are lowered in an order of their dependencies that reads each value soon after it is
+    # computed, instead of the order of the source. See schedule
+    scheduling: bool = True
+    # Lowering of the ORs: one of OR_LOWERINGS for every OR, or 'cost' to choose for each OR the lowering of lowest cost.
+    # See ir_gen_or
+    or_lowering: str = 'cost'
+    # Weights of the gates in the cost of the lowerings of an OR
+    not_cost: float = 1.0
+    cnot_cost: float = 1.0
+    ccnot_cost: float = 1.0
+    # Polarity needed for the result of each OR of the function, by id of the AST node. See compute_liveness
+    or_demands: dict[int, bool]
+    # Number of ORs lowered with each lowering
+    or_counts: dict[str, int]
+
     def __init__(self):
 
         self.module = ModuleOp([])
         self.builder = Builder.at_end(self.module.body.blocks[0])
-    
-    # Add a new entry in the symbol_table
-    def declare(self, var: str, value: SSAValue) -> bool:
-        
+        self.states = {}
+        self.polarity = {}
+        self.writes = {}
+        self.structures = {}
+        self.generations = {}
+        self.expr_numbers = {}
+        self.structural_table = {}
+        self.shared = set()
+        self.value_types = {}
+        self.last_uses = {}
+        self.demands = {}
+        self.or_demands = {}
+        self.or_counts = dict.fromkeys(OR_LOWERINGS, 0)
+        self.assignments_reads = {}
+        self.assignments_members = {}
+
+    # Bind a variable to its value in the symbol_table. A variable assigned again (in a procedural block) is bound to
+    # the new value, the reads lowered afterwards get it. Returns False if the variable was already bound.
+    def declare(self, var: str, value: QubitValue) -> bool:
+
         assert self.symbol_table is not None
-        if var in self.symbol_table:
-            return False
+        self.generations[var] = self.generations[var] + 1 if var in self.generations else 0
+        bound = var in self.symbol_table
         self.symbol_table[var] = value
-        return True
-    
+        return not bound
+
+    # Value of a variable read by an expression. A variable can be read before its assignment only if the assignments
+    # are lowered in the order of the source (with scheduling off or in the fused frontend)
+    def lookup(self, var: str) -> QubitValue:
+
+        assert self.symbol_table is not None
+        if var not in self.symbol_table:
+            self.error(f"Variable {self.context.symbol_name(var)} read before it is assigned")
+        return self.symbol_table[var]
+
     # Delete an entry from the symbol_table
     def delete(self, var: str) -> bool:
         assert self.symbol_table is not None
@@ -92,9 +235,29 @@ class IRGen:
             return True
         return False
 
+    # Run a lowering and the lowerings it yields with an explicit stack, in post-order.
+    # The methods lowering expressions (ir_gen_bin, ir_gen_unary and the ones they call) don't call themselves on a
+    # sub-expression: they yield its lowering and get its value back. The gates are emitted in the same order as
+    # a recursive descent, but the depth of the expressions is not bounded by the Python recursion limit.
+    def lower(self, lowering: Lowering) -> QubitValue:
+        stack = [lowering]
+        value = None
+        while stack:
+            try:
+                sub_lowering = stack[-1].send(value)
+            except StopIteration as done:
+                stack.pop()
+                value = done.value
+            else:
+                stack.append(sub_lowering)
+                value = None
+        return value
+
     # Acts on the whole tree
     def ir_gen_module(self, ast: Root) -> ModuleOp:
 
+        self.context = ast.context if ast.context is not None else ConversionContext()
+
         for f in ast.members:
             if (isinstance(f, Instance)):
                 self.ir_gen_function(f.body)
@@ -110,50 +273,27 @@ class IRGen:
 
         # Input arguments
         proto_args = [member for member in body.members if isinstance(member, Port) and member.direction == "In"]
-        
-        # Parsing input arguments
-        arg_types=[]
-        for member in proto_args:
-            # Check if it is a vector
-            if "[" in member.type and "]" in member.type:
-                match = re.match(r"(\w+)\[(\d+):(\d+)\]", member.type) # regex to match the vector type and size
-                if match:
-                    # Extract the high index, and low index
-                    high_index = int(match.group(2))
-                    low_index = int(match.group(3))
-                    size = high_index - low_index + 1
-
-                    element_type = IntegerType(1) #Type of the elements in the vector
-                    arg_types.append(builtin.VectorType(element_type, [size,]))
-            else:
-                # It's a single bit
-                arg_types.append(builtin.i1)
+        block = self.ir_gen_arguments(proto_args)
 
-        block = Block(arg_types=arg_types)
-        self.builder = Builder.at_end(block)
-        self.n_args = len(block.args)
+        # Assignments in the order they are lowered
+        assignments = self.function_assignments(body.members)
+        if self.dead_logic_elimination:
+            assignments = self.output_cone(body.members, assignments)
+        if self.scheduling:
+            assignments = self.schedule(assignments)
 
-        # Declare each input argument as a new qubit
-        for name, value in zip(proto_args, block.args):
-            value._name = "q" + str(self.n_qubit) + "_0"
-            self.n_qubit += 1
-            self.declare(name.internalSymbol, value)
+        # Last reads of the variables, before lowering the assignments that write them in place
+        if self.liveness_inplacing:
+            self.compute_liveness(body.members, assignments)
 
         # Create operations for computations inside the function
-        for member in body.members:
-                self.ir_gen_expr(member)
+        for assignment in assignments:
+            self.ir_gen_assign(assignment)
 
         # Output arguments
         proto_return = [member for member in body.members if isinstance(member, Port) and member.direction == "Out"]
+        self.ir_gen_measures(proto_return)
 
-        # Add a MeasureOp for each output argument of the function
-        for var in proto_return:
-            try:
-                measure = self.builder.insert(MeasureOp.from_value(self.symbol_table[var.internalSymbol])).res
-                measure._name = str(self.symbol_table[var.internalSymbol]._name.split('_')[0]) + "_" + str(int(self.symbol_table[var.internalSymbol]._name.split('_')[1]) + 1)
-            except:
-                raise IRGenError(f"Variable {var.internalSymbol} not found in the symbol table, may be uninitilized output var")
-       
         self.symbol_table = None
         self.builder = parent_builder
 
@@ -161,9 +301,258 @@ class IRGen:
 
         return func
 
+    # Create the block of the function with an argument for each input port and declare them as the first qubits.
+    # The builder is moved at the end of the new block.
+    def ir_gen_arguments(self, proto_args: list[Port]) -> Block:
+
+        # Parsing input arguments: a qubit for a single bit, a register for a vector
+        arg_types = [self.type_of(member.type) for member in proto_args]
+
+        block = Block(arg_types=arg_types)
+        self.builder = Builder.at_end(block)
+        self.n_args = len(block.args)
+
+        # The qubits, the structures and the liveness refer to the symbols of this function
+        self.states = {}
+        self.polarity = {}
+        self.writes = {}
+        self.structures = {}
+        self.generations = {}
+        self.structural_table = {}
+        self.shared = set()
+        self.last_uses = {}
+        self.demands = {}
+        self.or_demands = {}
+        self.assignments_reads = {}
+        self.assignments_members = {}
+        self.assignment_index = 0
+
+        # Declare each input argument as a new qubit
+        for name, value in zip(proto_args, block.args):
+            set_qubit(value, self.n_qubit)
+            self.states[self.n_qubit] = value
+            self.declare(name.internalSymbol, QubitValue(self.n_qubit))
+            self.n_qubit += 1
+
+        return block
+
+    # Add a MeasureOp for each output argument of the function.
+    # A qubit is measured once: an output on the qubit of an output before it is copied first. Then each qubit gets a
+    # NOT if it holds the complement of its output.
+    def ir_gen_measures(self, proto_return: list[Port]) -> None:
+
+        outputs = []
+        for var in proto_return:
+            if var.internalSymbol not in self.symbol_table:
+                raise IRGenError(f"Variable {self.context.symbol_name(var.internalSymbol)} not found in the symbol table, may be uninitilized output var")
+            value = self.symbol_table[var.internalSymbol]
+            if any(output.qubit == value.qubit for output in outputs):
+                value = self.copy(value)
+            outputs.append(value)
+
+        for value in outputs:
+            self.set_inverted(value, False)
+            state = self.states[value.qubit]
+            measure = self.builder.insert(MeasureOp.from_value(state)).res
+            next_version(measure, state)
+
+    # Liveness of the variables of the function, before it is lowered.
+    # last_uses gets the index of the last assignment reading each variable and the number of its reads there. The
+    # assignments are numbered from 1 in the order they are lowered, the statements of a procedural block one by one.
+    # The outputs are read by the measures at the end of the function and never get an entry.
+    # demands gets the reads of each variable that need a polarity, in order: the index of the assignment and True if
+    # the qubit must hold the complement of the variable. An AND needs its operands as they are, an OR complemented,
+    # a measure as it is; a NOT in between flips the polarity and a XOR passes to its operands the polarity needed for
+    # its result. The result of an assignment needs the polarity of the next read of its variable, so the assignments
+    # are visited from the last one. or_demands gets the polarity needed for the result of each OR, see or_costs.
+    def compute_liveness(self, members: list[ASTNode], assignments: list[Assignment]) -> None:
+        outputs = {member.internalSymbol for member in members if isinstance(member, Port) and member.direction == "Out"}
+
+        self.last_uses = {}
+        self.or_demands = {}
+        # built from the last read, reversed at the end
+        self.demands = {symbol: [(len(assignments) + 1, False)] for symbol in outputs}
+        live = set(outputs)
+        for index in range(len(assignments), 0, -1):
+            assignment = assignments[index - 1]
+            reads = {}
+            # polarity needed for the result of the assignment
+            result_demands = self.demands.get(assignment.left.symbol)
+            result_inverted = result_demands[-1][1] if result_demands else None
+            # node, polarity needed for it (None if no read needs one)
+            stack = [(assignment.right, result_inverted)]
+            while stack:
+                node, inverted = stack.pop()
+                if isinstance(node, NamedValue):
+                    reads[node.symbol] = reads.get(node.symbol, 0) + 1
+                    if inverted is not None:
+                        self.demands.setdefault(node.symbol, []).append((index, inverted))
+                elif isinstance(node, BinaryOp):
+                    if node.op == "BinaryAnd":
+                        inverted = False
+                    elif node.op == "BinaryOr":
+                        if inverted is not None:
+                            self.or_demands[id(node)] = inverted
+                        # only the De Morgan lowering needs the operands of an OR complemented
+                        inverted = True if self.or_lowering in ('demorgan', 'cost') else None
+                    stack += [(node.right, inverted), (node.left, inverted)]
+                elif isinstance(node, UnaryOp):
+                    stack.append((node.operand, None if inverted is None else not inverted))
+                elif isinstance(node, Conversion) and node.operand is not None:
+                    stack.append((node.operand, inverted))
+            for symbol, count in reads.items():
+                if symbol not in outputs and symbol not in self.last_uses:
+                    self.last_uses[symbol] = (index, count)
+            # live after the assignment: the variables read afterwards and the outputs
+            self.max_live = max(self.max_live, len(live))
+            live.discard(assignment.left.symbol)
+            live.update(reads)
+        for demands in self.demands.values():
+            demands.reverse()
+
+    # Assignments of the members of a function in the order of the source, the statements of a procedural block one by one
+    def function_assignments(self, members: list[ASTNode]) -> list[Assignment]:
+        assignments = []
+        for index, member in enumerate(members):
+            if isinstance(member, ContinuousAssign):
+                statements = [member.assignment]
+            elif isinstance(member, ProceduralBlock):
+                statement = member.body.body
+                statements = [s.expr for s in statement] if isinstance(statement, list) else [statement.expr]
+            else:
+                continue
+            for assignment in statements:
+                self.assignments_members[id(assignment)] = index
+            assignments += statements
+        return assignments
+
+    # Assignments whose values reach an output, in the order of assignments: the outputs are assigned by them, and
+    # the variables they read too, back to the inputs. The others would only be removed from the IR by
+    # RemoveUnusedOperations, one gate at a time over several sweeps.
+    # A variable assigned more than once keeps all its assignments.
+    def output_cone(self, members: list[ASTNode], assignments: list[Assignment]) -> list[Assignment]:
+        writers = {}
+        for index, assignment in enumerate(assignments):
+            writers.setdefault(assignment.left.symbol, []).append(index)
+
+        needed = {member.internalSymbol for member in members if isinstance(member, Port) and member.direction == "Out"}
+        work = list(needed)
+        live = [False] * len(assignments)
+        while work:
+            for index in writers.get(work.pop(), ()):
+                if live[index]:
+                    continue
+                live[index] = True
+                for symbol in self.assignment_reads(assignments[index]):
+                    if symbol not in needed:
+                        needed.add(symbol)
+                        work.append(symbol)
+
+        self.dead_assignments += live.count(False)
+        return [assignment for assignment, reached in zip(assignments, live) if reached]
+
+    # Symbols of the variables read by the right side of an assignment, with the number of their reads.
+    # Computed once for each assignment of the function, see assignments_reads
+    def assignment_reads(self, assignment: Assignment) -> dict[str, int]:
+        reads = self.assignments_reads.get(id(assignment))
+        if reads is not None:
+            return reads
+        reads = self.assignments_reads[id(assignment)] = {}
+        stack = [assignment.right]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, NamedValue):
+                reads[node.symbol] = reads.get(node.symbol, 0) + 1
+            elif isinstance(node, BinaryOp):
+                stack += [node.right, node.left]
+            elif isinstance(node, (UnaryOp, Conversion)) and node.operand is not None:
+                stack.append(node.operand)
+        return reads
+
+    # Order in which the assignments are lowered: each one after the assignments of the variables it reads, so a
+    # variable can be read before its assignment in the source. A variable assigned more than once (in a procedural
+    # block) keeps the order of its assignments and of the reads between them: a statement of the block reads the last
+    # assignment before it in the block, the other members read the last one of the block. If the assignments depend on
+    # each other in a loop, the order of the source is kept.
+    # Among the assignments ready, the one reading for the last time the most variables goes first: it ends their live
+    # ranges, and fewer values are live at once. On equal counts the last one to become ready goes first, so the cone
+    # of a value follows it instead of waiting for the assignments before it in the source.
+    def schedule(self, assignments: list[Assignment]) -> list[Assignment]:
+        writers = {}
+        for index, assignment in enumerate(assignments):
+            writers.setdefault(assignment.left.symbol, []).append(index)
+
+        reads = [self.assignment_reads(assignment) for assignment in assignments]
+        members = [self.assignments_members.get(id(assignment)) for assignment in assignments]
+        # assignments each one must follow
+        dependencies = [set() for _ in assignments]
+        # assignments reading the value of each assignment of a variable assigned more than once
+        readers_of = {}
+        for index, assignment in enumerate(assignments):
+            for symbol in reads[index]:
+                symbol_writers = writers.get(symbol)
+                if symbol_writers is None:
+                    continue
+                position = bisect_left(symbol_writers, index)
+                if position and members[symbol_writers[position - 1]] == members[index]:
+                    writer = symbol_writers[position - 1]
+                else:
+                    writer = symbol_writers[-1]
+                if writer != index:
+                    dependencies[index].add(writer)
+                if len(symbol_writers) > 1:
+                    readers_of.setdefault(writer, []).append(index)
+            # an assignment follows the one before it of the same variable and the reads of its value
+            symbol_writers = writers[assignment.left.symbol]
+            position = bisect_left(symbol_writers, index)
+            if position:
+                previous = symbol_writers[position - 1]
+                dependencies[index].add(previous)
+                dependencies[index].update(reader for reader in readers_of.get(previous, ()) if reader != index)
+
+        consumers = [[] for _ in assignments]
+        pending = [len(dependency) for dependency in dependencies]
+        for index, dependency in enumerate(dependencies):
+            for other in dependency:
+                consumers[other].append(index)
+
+        # assignments still to lower reading each variable, and number of variables each one reads for the last time
+        readers = {}
+        for index, symbols in enumerate(reads):
+            for symbol in symbols:
+                readers.setdefault(symbol, set()).add(index)
+        last_reads = [sum(len(readers[symbol]) == 1 for symbol in symbols) for symbols in reads]
+
+        # ready assignments by (-last_reads, -time they got ready): an entry is stale once last_reads changes
+        is_ready = [not count for count in pending]
+        ready = [(-last_reads[index], 0, index) for index in range(len(assignments)) if is_ready[index]]
+        heapify(ready)
+        order = []
+        while ready:
+            count, _, index = heappop(ready)
+            if -count != last_reads[index] or not is_ready[index]:
+                continue
+            is_ready[index] = False
+            order.append(assignments[index])
+            for symbol in reads[index]:
+                symbol_readers = readers[symbol]
+                symbol_readers.discard(index)
+                if len(symbol_readers) == 1:
+                    reader = next(iter(symbol_readers))
+                    last_reads[reader] += 1
+                    if is_ready[reader]:
+                        heappush(ready, (-last_reads[reader], -len(order), reader))
+            for consumer in consumers[index]:
+                pending[consumer] -= 1
+                if not pending[consumer]:
+                    is_ready[consumer] = True
+                    heappush(ready, (-last_reads[consumer], -len(order), consumer))
+
+        return order if len(order) == len(assignments) else assignments
+
     # Act as a switch for the different types of expressions
-    def ir_gen_expr(self, expr: ASTNode) -> SSAValue:
-        
+    def ir_gen_expr(self, expr: ASTNode) -> QubitValue:
+
         # The two ways one can write combinatorial assignments in SystemVerilog
         if isinstance(expr, ContinuousAssign):
             return self.ir_gen_assign(expr.assignment)
@@ -171,8 +560,8 @@ class IRGen:
             return self.ir_gen_procedural_block(expr)
 
     # Create operations from expression in the procedural block
-    def ir_gen_procedural_block(self, expr: ProceduralBlock) -> SSAValue:
-            
+    def ir_gen_procedural_block(self, expr: ProceduralBlock) -> QubitValue:
+
             # Extract the block and the statement containing the operations
             block = expr.body
             statement = block.body
@@ -183,7 +572,10 @@ class IRGen:
                 self.ir_gen_assign(statement.expr)
 
     # Acts as a switch for the different types of assignements
-    def ir_gen_assign(self, assignment: Assignment) -> SSAValue:
+    def ir_gen_assign(self, assignment: Assignment) -> QubitValue:
+
+        self.value_types = {}
+        self.assignment_index += 1
 
         if isinstance(assignment.right, Conversion): # initialization of a variable
             return self.ir_gen_init(assignment)
@@ -193,246 +585,322 @@ class IRGen:
             return self.ir_gen_unary_op(assignment)
         if isinstance(assignment.right, NamedValue): # copy of a variable
             return self.ir_gen_copy(assignment)
-    
-    # copy of a variable
-    def ir_gen_copy(self, expr: Assignment) -> SSAValue:
-
-        # create a new qubit
-        initOp_ssa = self.builder.insert(InitOp.from_value(IntegerType(1))).res
-        initOp_ssa._name = "q" + str(self.n_qubit) + "_0"
-        self.n_qubit += 1                    
-            
-        self.declare(initOp_ssa._name, initOp_ssa)
 
-        # copy the value of the variable
-        cnotOp_ssa = self.builder.insert(CNotOp.from_value(self.symbol_table[expr.right.symbol], initOp_ssa)).res
-        cnotOp_ssa._name = initOp_ssa._name.split('_')[0] + "_" + str(int(initOp_ssa._name.split('_')[1]) + 1)
+    # copy of a variable: the new variable is on the same qubit, see alias
+    def ir_gen_copy(self, expr: Assignment) -> QubitValue:
 
-        self.declare(cnotOp_ssa._name, cnotOp_ssa)
-        self.declare(expr.left.symbol, cnotOp_ssa)
+        value = self.lookup(expr.right.symbol)
+        self.alias(expr.right, value)
+        self.declare(expr.left.symbol, value)
 
-        return cnotOp_ssa
+        return value
 
     # Initialization of a new qubit
-    def ir_gen_init(self, expr: Assignment) -> SSAValue:
+    def ir_gen_init(self, expr: Assignment) -> QubitValue:
 
         # Insert the InitOp
-        initOp_ssa = self.builder.insert(InitOp.from_value(IntegerType(1))).res
+        value = self.new_qubit(self.type_of(expr.right.type))
 
-        # Set the name of the qubit
-        initOp_ssa._name = "q" + str(self.n_qubit) + "_0"
-        self.n_qubit += 1
+        # the value 1 is the complement of the qubit at 0
+        if self.all_ones(expr.right):
+            value = ~value
 
-        # Add the new SSAValue(qubit) in the symbol_table
-        self.declare(initOp_ssa._name, initOp_ssa)
+        # Add the new value in the symbol_table
+        self.declare(expr.left.symbol, value)
 
-        # negate it if the value is 1
-        if expr.right.constant == "1'b1":
-            self.delete(initOp_ssa._name)
-            notOp_ssa = self.builder.insert(NotOp.from_value(initOp_ssa)).res
-            notOp_ssa._name = initOp_ssa._name.split('_')[0] + "_" + str(int(initOp_ssa._name.split('_')[1]) + 1)
-            initOp_ssa = notOp_ssa
+        return value
 
-        # Add the new SSAValue(qubit) in the symbol_table
-        self.declare(expr.left.symbol, initOp_ssa)
-
-        return initOp_ssa
-    
     # Generation of a unary operation from verilog from a direct assignment
-    def ir_gen_unary_op(self, expr: Assignment) -> SSAValue:
-        
+    def ir_gen_unary_op(self, expr: Assignment) -> QubitValue:
+
         # Symbol from verilog
         symbol = expr.left.symbol
 
-        final_op_ssa = self.ir_gen_unary(expr.right,directAssignment=True)
+        if self.structural_hashing:
+            self.number_expression(expr.right)
+
+        value = self.lower(self.ir_gen_unary(expr.right))
 
-        # add the SSAValue to the symbol_table
-        self.declare(symbol, final_op_ssa)
-        
-        return final_op_ssa
+        # the negation of a variable is on the qubit of the variable
+        self.alias(expr.right, value)
+
+        # add the value to the symbol_table
+        self.declare(symbol, value)
+
+        return value
 
     # Generation of a unary operation
-    def ir_gen_unary(self, expr: UnaryOp,directAssignment: bool) -> SSAValue:
-        
+    def ir_gen_unary(self, expr: UnaryOp) -> Lowering:
+
         if expr.op == "BitwiseNot":     # Not operation
-            unary_ssa = self.ir_gen_not(expr, directAssignment)
-            return unary_ssa
+            # only the negation of a binary operation gives a new value, the others are variables or constants
+            if self.structural_hashing and isinstance(expr.operand, BinaryOp):
+                return self.ir_gen_recorded(expr, self.ir_gen_not(expr))
+            return self.ir_gen_not(expr)
         else:
             raise IRGenError(f"Unknown unary operation {expr.op}")
-        
-    # Generation of a Not operation
-    def ir_gen_not(self, expr: UnaryOp,directAssignment: bool) -> SSAValue:
 
-        if isinstance(expr.operand, NamedValue):                # not of a variable of the verilog (internal variable or input argument)           
-            operand = self.symbol_table[expr.operand.symbol]
-            if(directAssignment == True and int(operand._name[1]) < self.n_args):
-                newSSA = self.builder.insert(InitOp.from_value(IntegerType(1))).res
-                newSSA._name = "q" + str(self.n_qubit) + "_0"
-                self.n_qubit += 1
+    # Generation of a Not operation: the value of the operand complemented, no gate is emitted
+    def ir_gen_not(self, expr: UnaryOp) -> Lowering:
 
-            self.delete(expr.operand.symbol)
+        value = yield from self.ir_gen_operand(expr.operand)
 
-        elif isinstance(expr.operand, BinaryOp):                # Not of a binary operation
-            operand = self.ir_gen_bin(expr.operand)
-            self.delete(operand._name)
+        # the negation of a zero-extended value has the added bits at 1
+        if self.type_of(expr.type) != self.states[value.qubit].type:
+            self.error(f"Negation of a value extended from {self.states[value.qubit].type} to {self.type_of(expr.type)} is not supported")
 
-        elif isinstance(expr.operand, Conversion):              # assign "hand-made" value
-            # generate a new qubit
-
-            # Insert the InitOp
-            initOp_ssa = self.builder.insert(InitOp.from_value(IntegerType(1))).res
-
-            # Set the name of the qubit
-            initOp_ssa._name = "q" + str(self.n_qubit) + "_0"
-            self.n_qubit += 1
-
-            # Add the new SSAValue(qubit) in the symbol_table
-            self.declare(initOp_ssa._name, initOp_ssa)
-
-            operand = initOp_ssa
-
-            # negate it if the value is 1
-            if expr.operand.constant == "1'b1":
-                self.delete(operand._name)
-                notOp_ssa = self.builder.insert(NotOp.from_value(operand)).res
-                notOp_ssa._name = operand._name.split('_')[0] + "_" + str(int(operand._name.split('_')[1]) + 1)
-                operand = notOp_ssa
-
-            self.delete(operand._name)
-        
-        # Insert the NotOp
-        notOp_ssa = self.builder.insert(NotOp.from_value(operand)).res
-
-        # Set the name of the SSAValue adding 1 to the temporal state of the qubit
-        notOp_ssa._name = operand._name.split('_')[0] + "_" + str(int(operand._name.split('_')[1]) + 1)
-
-        # Add the SSAValue to the symbol_table
-        if isinstance(expr.operand, NamedValue):
-            self.declare(expr.operand.symbol, notOp_ssa) # key is the symbol they have in verilog
-            if(directAssignment==True and int(operand._name[1]) < self.n_args):
-                cnotOp_ssa = self.builder.insert(CNotOp.from_value(notOp_ssa, newSSA)).res
-                cnotOp_ssa._name = newSSA._name.split('_')[0] + "_" + str(int(newSSA._name.split('_')[1]) + 1)
-                notOp_ssa = cnotOp_ssa # change of the name to return the right value
-        elif isinstance(expr.operand, BinaryOp):
-            self.declare(operand._name, notOp_ssa)       # key is the name of the SSAValue
-        
-        return notOp_ssa
+        return ~value
 
     # Generation of a binary operation from verilog
-    def ir_gen_bin_op(self, expr: Assignment) -> SSAValue:
-        
+    def ir_gen_bin_op(self, expr: Assignment) -> QubitValue:
+
         # Symbol coming from verilog
         symbol = expr.left.symbol
 
+        if self.structural_hashing:
+            self.number_expression(expr.right)
+
         # Generate the binary operation
-        final_op_ssa = self.ir_gen_bin(expr.right)
+        value = self.lower(self.ir_gen_bin(expr.right))
 
-        # Add the SSAValue to the symbol_table
-        self.declare(symbol, final_op_ssa)
+        # Add the value to the symbol_table
+        self.declare(symbol, value)
 
-        return final_op_ssa
+        return value
 
     # Switch for the different types of binary operations
-    def ir_gen_bin(self, expr: BinaryOp) -> SSAValue:
+    def ir_gen_bin(self, expr: BinaryOp) -> Lowering:
 
         if expr.op == "BinaryXor":
-            result_ssa = self.ir_gen_xor(expr) # xor operation
+            lowering = self.ir_gen_xor(expr) # xor operation
         elif expr.op == "BinaryAnd":
-            result_ssa = self.ir_gen_and(expr) # and operation
+            lowering = self.ir_gen_and(expr) # and operation
         elif expr.op == "BinaryOr":
-            result_ssa = self.ir_gen_or(expr)  # or operation
+            lowering = self.ir_gen_or(expr)  # or operation
         else:
             raise IRGenError(f"Unknown binary operation {expr.op}")
-        
-        return result_ssa
-
-    # Construction of an operation operand which is a NamedValue.
-    # NamedValue corresponding to input arguments can't be assigned in SystemVerilog.
-    # This means that if the status number of the corresponding SSAValue is odd 
-    # that SSAValue corresponds to a negated value.
-    def ir_gen_named_value(self, expr: NamedValue) -> SSAValue:
-        namedValue_ssa = self.symbol_table[expr.symbol]
-
-        # If the qubit has been negated and the NamedValue is an input argument, negate it again.
-        if int(namedValue_ssa._name[-1])%2 != 0 and int(namedValue_ssa._name[1]) < self.n_args: # odd status number and an input argument
-            self.delete(expr.symbol)
-            not_ssa = self.builder.insert(NotOp.from_value(namedValue_ssa)).res
-            not_ssa._name = namedValue_ssa._name.split('_')[0] + "_" + str(int(namedValue_ssa._name.split('_')[1]) + 1)
-            self.declare(expr.symbol, not_ssa)
-            namedValue_ssa = not_ssa
-        
-        return namedValue_ssa
-    
-    # Generation of operands for a binary operation. Right and left.
-    def ir_gen_operand(self, expr: BinaryOp, side: str) -> SSAValue:
-
-        if side == "left":
-            operand = expr.left
-        elif side == "right":
-            operand = expr.right
+
+        if self.structural_hashing:
+            return self.ir_gen_recorded(expr, lowering)
+        return lowering
+
+    # Give the same number to the sub-expressions of expr that compute the same value: the same operation on operands
+    # with the same numbers, in any order since XOR, AND and OR are commutative.
+    # A variable is numbered by its symbol and by the number of its assignments before the value read (see declare).
+    # Iterative, in post-order.
+    def number_expression(self, expr: ASTNode) -> None:
+        self.expr_numbers = {}
+        stack = [(expr, False)]
+        while stack:
+            node, operands_numbered = stack.pop()
+            if isinstance(node, BinaryOp):
+                if not operands_numbered:
+                    stack += [(node, True), (node.right, False), (node.left, False)]
+                    continue
+                left = self.expr_numbers[id(node.left)]
+                right = self.expr_numbers[id(node.right)]
+                structure = (node.op, min(left, right), max(left, right))
+            elif isinstance(node, UnaryOp):
+                if not operands_numbered:
+                    stack += [(node, True), (node.operand, False)]
+                    continue
+                structure = (node.op, self.expr_numbers[id(node.operand)])
+            elif isinstance(node, Conversion) and isinstance(node.operand, NamedValue):
+                structure = ("NamedValue", node.operand.symbol, self.generations.get(node.operand.symbol, 0))
+            elif isinstance(node, Conversion):
+                structure = ("Conversion", node.constant)
+            elif isinstance(node, NamedValue):
+                structure = ("NamedValue", node.symbol, self.generations.get(node.symbol, 0))
+            else:
+                # never equal to another node
+                structure = ("Node", id(node))
+            self.expr_numbers[id(node)] = self.structures.setdefault(structure, len(self.structures))
+
+    # Lower expr and record the value holding its result under its structure number
+    def ir_gen_recorded(self, expr: BinaryOp | UnaryOp, lowering: Lowering) -> Lowering:
+        value = yield lowering
+        self.structural_table[self.expr_numbers[id(expr)]] = (value, self.writes.get(value.qubit, 0))
+        return value
+
+    # Value holding the result of a sub-expression with the same structure as expr, None if there is none.
+    # The value is valid if no gate wrote its qubit after it: the NOT gates emitted for the polarity don't change it.
+    # Its qubit is shared with its first owner, so it is never written in place.
+    def structural_lookup(self, expr: BinaryOp | UnaryOp) -> QubitValue | None:
+        if not self.structural_hashing:
+            return None
+        entry = self.structural_table.get(self.expr_numbers[id(expr)])
+        if entry is None:
+            return None
+        value, writes = entry
+        if self.writes.get(value.qubit, 0) != writes:
+            return None
+        self.shared.add(value.qubit)
+        self.structural_hits += 1
+        return value
+
+    # Generation of an operand of an operation, returns its value.
+    # Used with yield from, the lowerings of the sub-expressions go straight to IRGen.lower
+    def ir_gen_operand(self, operand: ASTNode) -> Lowering:
+
+        if isinstance(operand, Conversion):
+            if isinstance(operand.operand, NamedValue):     # a variable, zero-extended
+                operand = operand.operand
+            else:                                           # a constant
+                value = self.new_qubit(self.type_of(operand.type))
+                return ~value if self.all_ones(operand) else value
 
         if isinstance(operand, NamedValue):
-            result_ssa = self.ir_gen_named_value(operand)
-        elif isinstance(operand, BinaryOp):
-            result_ssa = self.ir_gen_bin(operand)
-        elif isinstance(operand, UnaryOp):
-            unary_operand = operand.operand
-            # Unary operation on a NamedValue
-            if isinstance(unary_operand, NamedValue):
-                result_ssa = self.symbol_table[unary_operand.symbol]
-            # If it is not a NamedValue or it's not an input argument or it's not with an odd status number.
-            if not(isinstance(unary_operand, NamedValue) and int(result_ssa._name.split("_")[1]) < self.n_args and int(result_ssa._name.split("_")[1])%2 != 0):
-                result_ssa = self.ir_gen_unary(operand,directAssignment=False)
-        elif isinstance(operand, Conversion):
-            result_ssa = self.ir_gen_named_value(operand.operand)
-        
-        self.declare(result_ssa._name, result_ssa)
-        
-        return result_ssa
-    
-    # Every time we negate a qubit, after the operation we restore its original state
-    # by negating it again. Only if the qubit is not an input argument.
-    # If it's an input argument we do it in the gen_named_value function
-    def restore_qubit(self, expr: BinaryOp, side: str) -> None:
-
-        if side == "left":
-            binaryOp_operand = expr.left
-        elif side == "right":
-            binaryOp_operand = expr.right
-        
-        sub_operand = binaryOp_operand.operand
-        if isinstance(sub_operand, NamedValue):
-            sub_operand_ssa = self.symbol_table[sub_operand.symbol]
-            if int(sub_operand_ssa._name[1]) >= self.n_args: # Not one of the input arguments
-                self.delete(sub_operand.symbol)
-                op_new = self.builder.insert(NotOp.from_value(sub_operand_ssa)).res
-                op_new._name = sub_operand_ssa._name.split('_')[0] + "_" + str(int(sub_operand_ssa._name.split('_')[1]) + 1)
-                self.declare(sub_operand.symbol, op_new)
-
-    # Creates a new qubit and instantiates a InitOp.
-    # Then, changes the name of the qubit, declares it in the ScopedSymbolTable.
-    # Returns the ssa of the InitOp result for future reference in the caller.
-    def ir_gen_new_qubit(self, expr: BinaryOp) -> SSAValue:
-
-        # initialize a new qubit or a new qubit register
-        if "[" in expr.type and "]" in expr.type:
-            match = re.match(r"(\w+)\[(\d+):(\d+)\]", expr.type) # regex to match the vector type and size
-            if match:
-                # Extract the keyword, high index, and low index
-                high_index = int(match.group(2))
-                low_index = int(match.group(3))
-                size = high_index - low_index + 1
-            element_type = IntegerType(1)
-            initOp_ssa = self.builder.insert(InitOp.from_value(VectorType(element_type,[size,]))).res
-        else:
-            initOp_ssa = self.builder.insert(InitOp.from_value(IntegerType(1))).res
+            return self.lookup(operand.symbol)
 
-        initOp_ssa._name= "q" + str(self.n_qubit) + "_0"
+        value = self.structural_lookup(operand)
+        if value is None:
+            if isinstance(operand, BinaryOp):
+                value = yield self.ir_gen_bin(operand)
+            else:
+                value = yield self.ir_gen_unary(operand)
+        return value
+
+    # Variable read by operand, through NOTs and zero-extensions, None if operand computes a new value
+    def variable_operand(self, operand: ASTNode) -> NamedValue | None:
+        while isinstance(operand, (UnaryOp, Conversion)):
+            operand = operand.operand
+        return operand if isinstance(operand, NamedValue) else None
+
+    # An assignment of a variable or of its negation gives the new variable the qubit of the one it reads:
+    # if that one is still read afterwards the qubit is shared, neither can be written in place.
+    def alias(self, expr: ASTNode, value: QubitValue) -> None:
+        variable = self.variable_operand(expr)
+        if variable is not None and self.last_uses.get(variable.symbol) != (self.assignment_index, 1):
+            self.shared.add(value.qubit)
+
+    # Creates a new qubit (or register) initialized to 0 with an InitOp, returns its value
+    def new_qubit(self, type: IntegerType | VectorType) -> QubitValue:
+
+        initOp_ssa = self.builder.insert(InitOp.from_value(type)).res
+        set_qubit(initOp_ssa, self.n_qubit)
+        self.states[self.n_qubit] = initOp_ssa
         self.n_qubit += 1
 
-        self.declare(initOp_ssa._name, initOp_ssa)
-
-        return initOp_ssa
+        return QubitValue(qubit_of(initOp_ssa))
+
+    # Insert a gate writing on its target, the result becomes the current state of the qubit
+    def insert_gate(self, gate: NotOp | CNotOp | CCNotOp) -> None:
+        qubit = qubit_of(gate.target)
+        result = self.builder.insert(gate).res
+        next_version(result, gate.target)
+        self.states[qubit] = result
+        if not isinstance(gate, NotOp):
+            self.writes[qubit] = self.writes.get(qubit, 0) + 1
+
+    # True if the qubit of value holds its complement
+    def inverted(self, value: QubitValue) -> bool:
+        return self.polarity.get(value.qubit, False) != value.negated
+
+    # Make the qubit of value hold it complemented or not, with a NOT gate if it doesn't already.
+    # The polarity of the qubit flips with it: every value on the qubit stays the same.
+    def set_inverted(self, value: QubitValue, inverted: bool) -> None:
+        if self.inverted(value) != inverted:
+            self.insert_gate(NotOp.from_value(self.states[value.qubit]))
+            self.polarity[value.qubit] = not self.polarity.get(value.qubit, False)
+
+    # Before a XOR reading a variable whose qubit holds its complement, emit the NOT gate restoring the variable if both
+    # this read and the next one need it restored (see compute_liveness): the gate would be needed anyway by the next
+    # read, and now it saves another one on the result of the XOR.
+    def restore_variable(self, operand: ASTNode, value: QubitValue) -> None:
+        variable = self.variable_operand(operand)
+        if variable is None or not self.inverted(value):
+            return
+        variable_value = self.symbol_table[variable.symbol]
+        restored = not self.inverted(variable_value)
+        needed_now = False
+        for index, inverted in self.demands.get(variable.symbol, ()):
+            if index == self.assignment_index:
+                needed_now = needed_now or inverted == restored
+            elif index > self.assignment_index:
+                if needed_now and inverted == restored:
+                    self.set_inverted(variable_value, restored)
+                return
+
+    # XOR control into target with a CNot, returns the value of the result on the qubit of target.
+    # The qubit holds the XOR of what the two qubits held, so the inversions of both pass to the result.
+    def xor_into(self, target: QubitValue, control: QubitValue) -> QubitValue:
+        self.insert_gate(CNotOp.from_value(self.states[control.qubit], self.states[target.qubit]))
+        return QubitValue(target.qubit, target.negated != self.inverted(control))
+
+    # Copy of value on a new qubit
+    def copy(self, value: QubitValue) -> QubitValue:
+        return self.xor_into(self.new_qubit(self.states[value.qubit].type), value)
+
+    # Type of the qubits holding a value of a SystemVerilog type
+    def type_of(self, type: str) -> IntegerType | VectorType:
+        return register_type(bit_width(type), "[" in type)
+
+    # True if the constant converted by expr sets every bit of its register.
+    # A register is initialized with a single gate, so constants with bits both at 0 and at 1 are not supported.
+    # Unknown bits are 0, as the qubits are initialized.
+    def all_ones(self, expr: Conversion) -> bool:
+        value = constant_value(expr.constant)
+        if not value:
+            return False
+        if value == (1 << bit_width(expr.type)) - 1:
+            return True
+        self.error(f"Constant {expr.constant} has bits at 0 and at 1, a register can only be initialized to all zeros or all ones")
+
+    # Type of the qubits holding the value computed by expr.
+    # Slang converts the operands of an operation to the width of the assignment, but the XOR, AND and OR of zero-extended
+    # operands is the zero-extension of the operation on the operands: the operation is generated at the width of its
+    # operands (the Conversions are skipped by ir_gen_operand) and the bits added by the extension, always 0, get no qubit.
+    # The type is the one of the leftmost operand, the operations check that the other one is the same.
+    # Iterative along the left operands, and each node is visited once per assignment.
+    def value_type(self, expr: ASTNode) -> IntegerType | VectorType:
+        path = []
+        while id(expr) not in self.value_types:
+            if isinstance(expr, BinaryOp):
+                path.append(expr)
+                expr = expr.left
+            elif isinstance(expr, UnaryOp):
+                path.append(expr)
+                expr = expr.operand
+            elif isinstance(expr, Conversion) and isinstance(expr.operand, NamedValue):
+                type = self.type_of(expr.operand.type)
+                break
+            else:
+                type = self.type_of(expr.type)
+                break
+        else:
+            type = self.value_types[id(expr)]
+
+        for node in path:
+            # the negation of a zero-extended value has the added bits at 1
+            if isinstance(node, UnaryOp) and self.type_of(node.type) != type:
+                self.error(f"Negation of a value extended from {type} to {self.type_of(node.type)} is not supported")
+            self.value_types[id(node)] = type
+        return type
+
+    # The operands of a gate must be registers of the same width
+    def check_widths(self, left: QubitValue, right: QubitValue) -> None:
+        left_type = self.states[left.qubit].type
+        right_type = self.states[right.qubit].type
+        if left_type != right_type:
+            self.error(f"Operands of different widths ({left_type} and {right_type}) are not supported")
+
+    # True if operand is a value computed by the expression being lowered (a binary operation, or its negation), whose
+    # qubit belongs to the expression
+    def is_temporary(self, operand: ASTNode) -> bool:
+        while isinstance(operand, UnaryOp):
+            operand = operand.operand
+        return isinstance(operand, BinaryOp)
+
+    # Symbol of the variable read by operand if its qubit can be the target of the XOR reading it, None otherwise.
+    # This must be the last read of the variable in the function (see compute_liveness), and its qubit must not hold
+    # another variable or sub-expression.
+    def dead_operand(self, operand: ASTNode, value: QubitValue) -> str | None:
+        variable = self.variable_operand(operand)
+        if variable is None or self.last_uses.get(variable.symbol) != (self.assignment_index, 1):
+            return None
+        if value.qubit in self.shared:
+            return None
+        return variable.symbol
 
     # Generation of a XOR operation.
     # a XOR b (a ^ b) is implemented in the quantum world by:
@@ -440,217 +908,182 @@ class IRGen:
     # - applying a CNot controlled by a, writing on the third qubit
     # - applying a CNot controlled by b, wrtiting again on the third qubit
     # - the third qubit is the result of the XOR.
-    def ir_gen_xor(self, expr: BinaryOp) -> SSAValue:
-        
+    # The operands are read as they are: if a qubit holds the complement of its operand, the result is complemented.
+    def ir_gen_xor(self, expr: BinaryOp) -> Lowering:
+
         # Set left operand
-        left_ssa = self.ir_gen_operand(expr, "left")
+        left = yield from self.ir_gen_operand(expr.left)
 
         # Set right operand
-        right_ssa = self.ir_gen_operand(expr, "right")
-        
+        right = yield from self.ir_gen_operand(expr.right)
+        self.check_widths(left, right)
+
+        # a ^ a is 0 and a ^ ~a is 1: a new qubit, complemented in the second case
+        if left.qubit == right.qubit:
+            value = self.new_qubit(self.value_type(expr))
+            return ~value if left.negated != right.negated else value
+
+        self.restore_variable(expr.left, left)
+        self.restore_variable(expr.right, right)
+
         # Check if we can do the xor in place:
         # in the case of two consecutive xor (a^b^c), instead of allocating 2 new qubits we use just one.
-        # We can do it only if the two operands are not both named values. 
+        # We can do it only if the two operands are not both named values.
         # Also we need left and right to be either a NamedValue or a Xor operation or a Not operation.
 
-        # try to write on right qubit.
-        if isinstance(expr.right, BinaryOp) or (isinstance(expr.right, UnaryOp) and isinstance(expr.right.operand, BinaryOp)):
-            ssa_name = right_ssa._name
+        # A qubit shared with another expression or a variable can't be written.
+        # A variable read for the last time can be written too, see dead_operand.
 
-            # CNotOp writing on the right operand.
-            cnotOp2_ssa = self.builder.insert(CNotOp.from_value(left_ssa, self.symbol_table[ssa_name])).res
-            cnotOp2_ssa._name = ssa_name.split('_')[0] + "_" + str(int(ssa_name.split('_')[1]) + 1)
-
-            self.declare(cnotOp2_ssa._name, cnotOp2_ssa)
+        # try to write on right qubit.
+        if self.is_temporary(expr.right) and right.qubit not in self.shared:
+            return self.xor_into(right, left)
 
         # if possible write on left qubit
-        elif isinstance(expr.left, BinaryOp) or (isinstance(expr.left, UnaryOp) and isinstance(expr.left.operand, BinaryOp)):
-            ssa_name = left_ssa._name
-
-            # CNotOp writing on the left operand.
-            cnotOp2_ssa = self.builder.insert(CNotOp.from_value(right_ssa, self.symbol_table[ssa_name])).res
-            cnotOp2_ssa._name = ssa_name.split('_')[0] + "_" + str(int(ssa_name.split('_')[1]) + 1)
+        if self.is_temporary(expr.left) and left.qubit not in self.shared:
+            return self.xor_into(left, right)
 
-            self.declare(cnotOp2_ssa._name, cnotOp2_ssa)
+        # else write on a variable not read anymore, left first: the control InPlacing would choose
+        for target, control, operand in ((left, right, expr.left), (right, left, expr.right)):
+            dead_symbol = self.dead_operand(operand, target)
+            if dead_symbol is not None:
+                self.delete(dead_symbol)
+                self.liveness_writes += 1
+                return self.xor_into(target, control)
 
         # Allocate a new qubit.
-        else:
-            
-            initOp_ssa = self.ir_gen_new_qubit(expr)
-        
-            cnotOp1_ssa = self.builder.insert(CNotOp.from_value(left_ssa, self.symbol_table[initOp_ssa._name])).res
-            cnotOp1_ssa._name = initOp_ssa._name.split('_')[0] + "_" + str(int(initOp_ssa._name.split('_')[1]) + 1)
-            name = cnotOp1_ssa._name
-
-            self.declare(cnotOp1_ssa._name, cnotOp1_ssa)
-
-            cnotOp2_ssa = self.builder.insert(CNotOp.from_value(right_ssa, self.symbol_table[name])).res
-            cnotOp2_ssa._name = name.split('_')[0] + "_" + str(int(name.split('_')[1]) + 1)
-            self.declare(cnotOp2_ssa._name, cnotOp2_ssa)
-
-        if isinstance(expr.left, UnaryOp):
-            self.restore_qubit(expr, "left")
-
-        if isinstance(expr.right, UnaryOp):
-            self.restore_qubit(expr, "right")
-
-        return cnotOp2_ssa
+        value = self.new_qubit(self.value_type(expr))
+        value = self.xor_into(value, left)
+        return self.xor_into(value, right)
+
+    # The AND or the OR of a value with itself is the value, copied on a new qubit.
+    # The AND of a value with its complement is 0, the OR is 1.
+    def same_operands(self, expr: BinaryOp, left: QubitValue, right: QubitValue) -> QubitValue:
+        if left.negated == right.negated:
+            return self.copy(left)
+        value = self.new_qubit(self.value_type(expr))
+        return ~value if expr.op == "BinaryOr" else value
 
     # Generation of an AND operation.
     # a AND b (a & b) is implemented in the quantum world bu:
     # - creating a third qubit initialized to zero
     # - applying a CCNot controlled by both a and b, writing on the third qubit.
     # - the third qubit is the result of the AND.
-    def ir_gen_and(self, expr: BinaryOp) -> SSAValue:
-
-        # Initialize a new qubit or a new qubit register
-        initOp_ssa = self.ir_gen_new_qubit(expr)
-
+    # The qubits of a and b are negated first if they hold their complements.
+    def ir_gen_and(self, expr: BinaryOp) -> Lowering:
 
         # Set left operand
-        left_ssa = self.ir_gen_operand(expr, "left")
+        left = yield from self.ir_gen_operand(expr.left)
 
         # Set right operand
-        right_ssa = self.ir_gen_operand(expr, "right")
-        
+        right = yield from self.ir_gen_operand(expr.right)
+        self.check_widths(left, right)
+
+        if left.qubit == right.qubit:
+            return self.same_operands(expr, left, right)
+
+        # Initialize a new qubit or a new qubit register
+        value = self.new_qubit(self.value_type(expr))
+
+        self.set_inverted(left, False)
+        self.set_inverted(right, False)
+
         # Create the CCNot operation
-        ccnotOp_ssa = self.builder.insert(CCNotOp.from_value(left_ssa, right_ssa, self.symbol_table[initOp_ssa._name])).res
-        ccnotOp_ssa._name = initOp_ssa._name.split('_')[0] + "_" + str(int(initOp_ssa._name.split('_')[1]) + 1)
-        self.declare(ccnotOp_ssa._name, ccnotOp_ssa)
-
-        if isinstance(expr.left, UnaryOp):
-            self.restore_qubit(expr, "left")
-
-        if isinstance(expr.right, UnaryOp):
-            self.restore_qubit(expr, "right")
-        
-        return ccnotOp_ssa
-    
-    # Generation of an operand for the OR operation.
-    # It returns the name by which the SSAValue is identified in the SymbolTable
-    # for future reference in the OR creation process.
-    def ir_gen_operand_or(self, expr: BinaryOp, side: str) -> str:
-
-        if side == "left":
-            operand = expr.left
-        elif side == "right":
-            operand = expr.right
-
-        # If the operand is a NamedValue
-        if isinstance(operand, NamedValue):
-            # Extract the corresponding SSAValue
-            operand_ssaValue = self.ir_gen_named_value(operand)
-            self.delete(operand.symbol) # delete it's previous name
-            
-            # Insert the first NOT for the OR conversion
-            notOp1_ssa = self.builder.insert(NotOp.from_value(operand_ssaValue)).res
-            notOp1_ssa._name = operand_ssaValue._name.split('_')[0] + "_" + str(int(operand_ssaValue._name.split('_')[1]) + 1)
-            
-            # Return the name to use for declaring it in the symbol table
-            declaration_name = operand.symbol
-        else:
-            if isinstance(operand, BinaryOp):
-                # Create the binary operation
-                operand_ssaValue = self.ir_gen_bin(operand)
-
-                # Insert the first NOT for the OR conversion
-                notOp1_ssa = self.builder.insert(NotOp.from_value(operand_ssaValue)).res
-                notOp1_ssa._name = operand_ssaValue._name.split('_')[0] + "_" + str(int(operand_ssaValue._name.split('_')[1]) + 1)
-                
-                # Return the name to use for declaring it in the symbol table
-                declaration_name = notOp1_ssa._name
-
-            elif isinstance(operand, UnaryOp):
-                unary_operand = operand.operand
-                # Unary operation on a simple Named Value
-                if isinstance(unary_operand, NamedValue):
-                    operand_ssaValue = self.symbol_table[unary_operand.symbol]
-                # If it is not a NamedValue or it's not an input argument or it's not with an odd status number.
-                if not(isinstance(unary_operand, NamedValue) and int(operand_ssaValue._name[1]) < self.n_args and int(operand_ssaValue._name[-1])%2 != 0):
-                    operand_ssaValue = self.ir_gen_unary(operand,directAssignment=False)
-                if isinstance(unary_operand, NamedValue):
-                    self.delete(unary_operand.symbol)
-                    
-                    # Insert the first NOT for the OR conversion
-                    notOp1_ssa = self.builder.insert(NotOp.from_value(operand_ssaValue)).res
-                    notOp1_ssa._name = operand_ssaValue._name.split('_')[0] + "_" + str(int(operand_ssaValue._name.split('_')[1]) + 1)
-                    
-                    # Return the name to use for declaring it in the symbol table
-                    declaration_name = unary_operand.symbol
-                else:
-                    notOp1_ssa = self.builder.insert(NotOp.from_value(operand_ssaValue)).res
-                    notOp1_ssa._name = operand_ssaValue._name.split('_')[0] + "_" + str(int(operand_ssaValue._name.split('_')[1]) + 1)
-                    
-                    # Return the name to use for declaring it in the symbol table
-                    declaration_name = notOp1_ssa._name
-        
-        self.declare(declaration_name, notOp1_ssa)
-        
-        return declaration_name
-    
-    # Generation of the or operation.
-    # a OR b (a | b) is implemented in the quantum world by:
-    # - creating a third qubit initialized to zero
-    # - negating both a and b 
-    # - applying a CCNot controlled by the negated value of the two operands writing on the third qubit
-    # - negating again a and b 
-    # - negating also the third qubit
-    # - the final value of the third qubit is the result of the OR.
-    def ir_gen_or(self, expr: BinaryOp) -> SSAValue:
+        self.insert_gate(CCNotOp.from_value(self.states[left.qubit], self.states[right.qubit], self.states[value.qubit]))
+
+        return value
 
-        # Auxiliary SSAValue
-        initOp_ssa = self.ir_gen_new_qubit(expr)
+    # Generation of the or operation.
+    # Each OR is lowered by one of OR_LOWERINGS: or_demorgan or or_xor. With or_lowering 'cost' the one of lowest cost
+    # is chosen for each OR (see or_costs), otherwise the one of or_lowering.
+    def ir_gen_or(self, expr: BinaryOp) -> Lowering:
 
         # Rigth and left operand of the or operation
-        left_declaration_name = self.ir_gen_operand_or(expr, "left")
+        left = yield from self.ir_gen_operand(expr.left)
 
-        right_declaration_name = self.ir_gen_operand_or(expr, "right")
+        right = yield from self.ir_gen_operand(expr.right)
+        self.check_widths(left, right)
 
-        # Extract the SSAValues
-        left_ssa = self.symbol_table[left_declaration_name]
-        right_ssa = self.symbol_table[right_declaration_name]
+        if left.qubit == right.qubit:
+            return self.same_operands(expr, left, right)
 
-        # Create the CCNotOp
-        ccnotOp_ssa = self.builder.insert(CCNotOp.from_value(left_ssa, right_ssa, self.symbol_table[initOp_ssa._name])).res
-        ccnotOp_ssa._name = initOp_ssa._name.split('_')[0] + "_" + str(int(initOp_ssa._name.split('_')[1]) + 1)
-
-        self.declare(ccnotOp_ssa._name, ccnotOp_ssa)
-        
-        # Create the final NOT on the left operand
-        notOp3_ssa = self.builder.insert(NotOp.from_value(left_ssa)).res
-        notOp3_ssa._name = left_ssa._name.split('_')[0] + "_" + str(int(left_ssa._name.split('_')[1]) + 1)
-        self.delete(left_declaration_name)
-
-        # If it's a Named Value or a UnaryOp acting on a NamedValue declare it with the name returned by
-        # ir_gen_operand_or.
-        if isinstance(expr.left, NamedValue) or (isinstance(expr.left, UnaryOp) and isinstance(expr.left.operand, NamedValue)):
-            self.declare(left_declaration_name, notOp3_ssa)
-        else: # else use the NotOp name.
-            self.declare(notOp3_ssa._name, notOp3_ssa)
-
-        # Create the final NOT on the right operand.
-        notOp4_ssa = self.builder.insert(NotOp.from_value(right_ssa)).res
-        notOp4_ssa._name = right_ssa._name.split('_')[0] + "_" + str(int(right_ssa._name.split('_')[1]) + 1)
-        self.delete(right_declaration_name)
-
-        if isinstance(expr.right, NamedValue) or (isinstance(expr.right, UnaryOp) and isinstance(expr.right.operand, NamedValue)):
-            self.declare(right_declaration_name, notOp4_ssa)
+        costs = self.or_costs(expr, left, right)
+        if self.or_lowering == 'cost':
+            lowering = min(costs, key=costs.get)
         else:
-            self.declare(notOp4_ssa._name, notOp4_ssa)
-
-        # Create the final NOT on the target qubit of the CCNot.
-        notOp5_ssa = self.builder.insert(NotOp.from_value(ccnotOp_ssa)).res
-        notOp5_ssa._name = ccnotOp_ssa._name.split('_')[0] + "_" + str(int(ccnotOp_ssa._name.split('_')[1]) + 1)
-
-        self.declare(notOp5_ssa._name, notOp5_ssa)
+            lowering = self.or_lowering
+        self.or_counts[lowering] += 1
+
+        lowerings = {'demorgan': self.or_demorgan, 'xor': self.or_xor}
+        return lowerings[lowering](expr, left, right)
+
+    # Cost of each lowering of the OR, with the weights not_cost, cnot_cost and ccnot_cost.
+    # Besides its gates, a lowering costs a NOT if its result is not on the polarity needed by the operation reading it
+    # (see compute_liveness). The De Morgan form leaves its operands negated: a NOT more if the next read of a variable
+    # needs it as it was, one less if it needs it negated.
+    # On equal costs the lowering first in OR_LOWERINGS is chosen.
+    def or_costs(self, expr: BinaryOp, left: QubitValue, right: QubitValue) -> dict[str, float]:
+        plain = (not self.inverted(left)) + (not self.inverted(right))
+        demand = self.or_demands.get(id(expr))
+
+        negations = sum(self.negation_cost(operand, value) for operand, value in ((expr.left, left), (expr.right, right))
+                        if not self.inverted(value))
+        costs = {
+            'demorgan': self.not_cost * (plain + negations + (demand is False)) + self.ccnot_cost,
+            'xor': self.cnot_cost * plain + self.ccnot_cost + self.not_cost * (demand is not None and demand != (plain < 2)),
+        }
+        return costs
+
+    # NOT gates more (1) or less (-1) needed by the next read of the variable read by operand, after the qubit of
+    # value is negated
+    def negation_cost(self, operand: ASTNode, value: QubitValue) -> int:
+        variable = self.variable_operand(operand)
+        if variable is None or variable.symbol not in self.symbol_table:
+            return 0
+        variable_value = self.symbol_table[variable.symbol]
+        if variable_value.qubit != value.qubit:
+            return 0
+        for index, inverted in self.demands.get(variable.symbol, ()):
+            if index > self.assignment_index:
+                return 1 if inverted == self.inverted(variable_value) else -1
+        return 0
+
+    # De Morgan form of the OR: a | b = ~(~a & ~b).
+    # - creating a third qubit initialized to zero
+    # - negating both a and b
+    # - applying a CCNot controlled by the negated value of the two operands writing on the third qubit
+    # - the third qubit holds the complement of the OR: ~a & ~b = ~(a | b).
+    # The qubits of a and b are negated only if they don't already hold their complements, and they are left so.
+    def or_demorgan(self, expr: BinaryOp, left: QubitValue, right: QubitValue) -> QubitValue:
 
-        if isinstance(expr.left, UnaryOp):
-            self.restore_qubit(expr, "left")
+        # Auxiliary qubit
+        value = self.new_qubit(self.value_type(expr))
 
-        if isinstance(expr.right, UnaryOp):
-            self.restore_qubit(expr, "right")
+        self.set_inverted(left, True)
+        self.set_inverted(right, True)
 
-        return notOp5_ssa
+        # Create the CCNotOp
+        self.insert_gate(CCNotOp.from_value(self.states[left.qubit], self.states[right.qubit], self.states[value.qubit]))
+
+        return ~value
+
+    # XOR form of the OR: a | b = a ^ b ^ (a & b), a CCNot and CNots on a third qubit, no NOT gate.
+    # With qa and qb the qubits of a and b, and na (nb) 1 if qa (qb) holds a (b) as it is:
+    # ~a & ~b = (qa ^ na) & (qb ^ nb) = (qa & qb) ^ nb.qa ^ na.qb ^ na.nb
+    # so qa is XORed on the third qubit only if qb holds b as it is, and vice versa. The third qubit holds the OR if both
+    # operands are as they are, its complement otherwise: if both qubits hold the complements, this is or_demorgan
+    # without NOT gates.
+    def or_xor(self, expr: BinaryOp, left: QubitValue, right: QubitValue) -> QubitValue:
+        left_plain = not self.inverted(left)
+        right_plain = not self.inverted(right)
+
+        value = self.new_qubit(self.value_type(expr))
+        self.insert_gate(CCNotOp.from_value(self.states[left.qubit], self.states[right.qubit], self.states[value.qubit]))
+        if right_plain:
+            self.insert_gate(CNotOp.from_value(self.states[left.qubit], self.states[value.qubit]))
+        if left_plain:
+            self.insert_gate(CNotOp.from_value(self.states[right.qubit], self.states[value.qubit]))
+
+        return value if left_plain and right_plain else ~value
 
     # Error message generation.
     def error(self, message: str, cause: Exception | None = None) -> NoReturn:
@@ -3,11 +3,15 @@ from xdsl.pattern_rewriter import PatternRewriter, RewritePattern
 from xdsl.dialects.builtin import ModuleOp
 
 from dialect.dialect import FuncOp, InitOp
+from dialect.qubits import next_version, qubit_of, set_qubit
 
 # Class to drive the removal of unused operations in the main program.
 class QubitRenumber(RewritePattern):
 
-    n_qubits: int = 0
+    n_qubits: int
+
+    def __init__(self):
+        self.n_qubits = 0
 
     # Check if the operation needs to be renumbered.
     def rewrite(self, op: Operation) -> None:
@@ -23,13 +27,13 @@ class QubitRenumber(RewritePattern):
 
         # if the operation is a InitOp we check for the qubit number
         if isinstance(op, InitOp):
-            if op.res._name.split('_')[0] != ("q" + str(self.n_qubits)):
-                op.res._name = "q" + str(self.n_qubits) + "_0"
+            if qubit_of(op.res) != self.n_qubits:
+                set_qubit(op.res, self.n_qubits)
             self.n_qubits = self.n_qubits + 1    
             return
 
         # else check for the target qubit to be the same as the result one
-        op.res._name = op.target._name.split('_')[0] + "_" + str(int(op.target._name.split('_')[1]) + 1)
+        next_version(op.res, op.target)
 
     def match_and_rewrite(self, op: Operation, rewriter: PatternRewriter):
         self.rewrite(op)
\ No newline at end of file
@@ -16,8 +16,13 @@ def is_trivially_dead(op: Operation) -> bool:
 
 # Class to drive the removal of unused operations in the main program.
 class RemoveUnusedOperations(RewritePattern):
-    eliminations: int = 0
-    init_eliminations: int = 0
+    eliminations: int
+    init_eliminations: int
+
+    def __init__(self):
+        self.eliminations = 0
+        self.init_eliminations = 0
+
     def match_and_rewrite(self, op: Operation, rewriter: PatternRewriter):
         if is_trivially_dead(op) and op.parent is not None:
             if op.name == "quantum.init":
@@ -1,9 +1,13 @@
+import argparse
 import os
 
 import backend.JSON_to_DataClasses as JSON_to_DataClasses
+import backend.ast_cache as ast_cache
 from xdsl.printer import Printer
 from frontend.in_placing import InPlacing
-from frontend.ir_gen import IRGen
+from frontend.ir_gen import IRGen, OR_LOWERINGS
+from frontend.fused_ir_gen import FusedIRGen, fused_ir_gen
+from frontend.constant_propagation import ConstantPropagation
 
 from frontend.common_subexpr_elimination import CommonSubexpressionElimination
 from frontend.remove_unused_op import RemoveUnusedOperations
@@ -23,60 +27,138 @@ import psutil
                     
 class QuantumIR():
     
-    # Where to find the json
+    # Where to find the json, can be overridden for each run
     json_path : str = 'build/output.json'
+    # Write the dataclass AST to dataclass_output, only useful for debugging
+    dump_dataclass : bool = False
     # Where to output the dataclass AST
     dataclass_output: str = 'test-outputs/dataclass_ast.txt'
     # General output directory
     output_dir : str = 'test-outputs'
+    # Build the dataclass AST while reading the JSON instead of loading the whole document first
+    stream_json : bool = True
+    # Replace the slang symbols in the dataclass AST with integer ids
+    compact_ast : bool = True
+    # Reuse the dataclass AST of SystemVerilog sources already compiled, see backend/ast_cache.py
+    use_cache : bool = True
+    # How SystemVerilog sources are compiled: 'binary' runs build/verilog_to_json and reads its JSON,
+    # 'pyslang' runs slang in this process through its Python bindings, see backend/pyslang_frontend.py
+    verilog_frontend : str = 'binary'
+    # Fold the constants through the operations of the dataclass AST, see frontend/constant_propagation.py
+    constant_propagation : bool = True
+    # Rewrite the operations with the boolean identities during the constant propagation (a & c | a is a, ~~a is a, ...)
+    boolean_simplification : bool = True
+    # Input ports fixed to a constant value, by name: the circuit is specialized on them, the ports get no qubit.
+    # The specialized ASTs of SystemVerilog sources are cached too.
+    constants : dict[str, int] | None = None
+    # Read the sub-expressions already computed instead of generating them again, see IRGen.structural_lookup
+    structural_hashing : bool = True
+    # Compute the liveness of the variables before generating the IR: a XOR is written on a variable read for the last
+    # time instead of on a new qubit, and NOT gates are placed knowing the next reads. See IRGen.compute_liveness
+    liveness_inplacing : bool = True
+    # Drop the assignments whose values never reach an output before lowering, see IRGen.output_cone
+    dead_logic_elimination : bool = True
+    # Lower the assignments in an order of their dependencies keeping few values live at once, see IRGen.schedule
+    scheduling : bool = True
+    # Lowering of the ORs, one of OR_LOWERINGS or 'cost' to choose one for each OR, see IRGen.ir_gen_or
+    or_lowering : str = 'cost'
+    # Weights of the NOT, CNot and CCNot gates in the cost of the lowerings of an OR, see IRGen.or_costs
+    gate_costs : tuple[float, float, float] = (1.0, 1.0, 1.0)
     # Dataclass AST root
     root : JSON_to_DataClasses.Root
     # MLIR root
     module : ModuleOp
 
     # Number of times each transformation is executed and number of gates it erases
-    num_cse : int = 0
-    cse_gate_elim: int = 0
-    num_dce : int = 0
-    dce_gate_elim: int = 0
-    dce_init_elim: int = 0
-    num_inplacing : int = 0
-    inplacing_gate_elim: int = 0
-    inplacing_init_elim: int = 0
-    num_hge : int = 0
-    hge_gate_elim: int = 0
-    cse_samequbit : int = 0
+    num_cse : int
+    cse_gate_elim: int
+    num_dce : int
+    dce_gate_elim: int
+    dce_init_elim: int
+    num_inplacing : int
+    inplacing_gate_elim: int
+    inplacing_init_elim: int
+    num_hge : int
+    hge_gate_elim: int
+    cse_samequbit : int
     
-    def __init__(self):
-        pass
+    # Each instance holds the whole state of one compilation (the metrics of the input file are in root.context),
+    # so that several instances can compile at the same time in threads or one after the other in the same process.
+    def __init__(self, json_path: str | None = None):
+        if json_path is not None:
+            self.json_path = json_path
+        self.num_cse = 0
+        self.cse_gate_elim = 0
+        self.num_dce = 0
+        self.dce_gate_elim = 0
+        self.dce_init_elim = 0
+        self.num_inplacing = 0
+        self.inplacing_gate_elim = 0
+        self.inplacing_init_elim = 0
+        self.num_hge = 0
+        self.hge_gate_elim = 0
+        self.cse_samequbit = 0
+
+    # The slang output can be given as bytes, as a path or as an open file (or pipe).
+    # By default it is read from json_path, which is never modified.
+    # The path of a SystemVerilog source can be given too: slang is then run only if its AST is not cached.
+    # The constants are propagated unless propagate is False, see run_constant_propagation.
+    def run_dataclass(self, source = None, propagate = True):
+        if source is None:
+            source = self.json_path
+
+        # The ASTs specialized on constants of SystemVerilog sources come from the cache already propagated
+        specialized = ast_cache.is_verilog(source) and self.use_cache and bool(self.constants)
+        if specialized:
+            self.root = ast_cache.ASTCache().load_specialized(source, self.constants, self.stream_json, self.compact_ast, self.verilog_frontend,
+                                                              self.boolean_simplification)
+        elif ast_cache.is_verilog(source):
+            if self.use_cache:
+                self.root = ast_cache.ASTCache().load(source, self.stream_json, self.compact_ast, self.verilog_frontend)
+            else:
+                self.root = ast_cache.verilog_to_dataclass(source, self.stream_json, self.compact_ast, frontend=self.verilog_frontend)
+        else:
+            # Convert JSON to DataClasses
+            self.root = JSON_to_DataClasses.load_dataclass(source, self.stream_json, self.compact_ast)
 
-    def run_dataclass(self):
-        # Read JSON file and fix last characters
+        if propagate and not specialized:
+            self.run_constant_propagation()
 
-        with open(self.json_path, 'r') as file:
-            data = file.read()
+        # Write the dataclass AST to a file
+        if self.dump_dataclass:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(self.dataclass_output, 'w') as file:
+                JSON_to_DataClasses.write_ast(self.root, file)
 
-        pos = data.rfind("}")
-        
-        # If you find last closed curly bracket remove everything after it
-        if pos != -1:
-            data = data[:pos + 1]
-        # Rewrite the file
-        with open(self.json_path, 'w') as file:
-            file.write(data)
+    # Fold the constants of the dataclass AST, fix the input ports of constants to their values and simplify the operations
+    def run_constant_propagation(self):
+        if self.constant_propagation or self.constants:
+            self.root = ConstantPropagation(self.constants, self.boolean_simplification).apply(self.root)
 
-        json_data = JSON_to_DataClasses.read_json_file(self.json_path)
+    # Generate the IR straight from the slang output (or a SystemVerilog source) without building the dataclass AST,
+    # replaces run_dataclass and run_generate_ir. See frontend/fused_ir_gen.py
+    def run_fused_ir_gen(self, source = None, print_output = True):
+        if source is None:
+            source = self.json_path
 
-        # Convert JSON to DataClasses and write it to a file
-        self.root = JSON_to_DataClasses.json_to_dataclass(json_data)
-        
-        os.makedirs(self.output_dir, exist_ok=True)
-        with open(self.dataclass_output, 'w') as file:
-            formatted_ast = JSON_to_DataClasses.format_root(self.root)
-            file.write("\n".join(formatted_ast))
+        self.module = fused_ir_gen(source, self.compact_ast, self.verilog_frontend, self.configure_ir_gen(FusedIRGen()))
+
+        if print_output:
+            print("\nIR:\n")
+            Printer().print_op(self.module)
+
+    # Set the options of the IR generation on ir_gen
+    def configure_ir_gen(self, ir_gen: IRGen) -> IRGen:
+        ir_gen.structural_hashing = self.structural_hashing
+        ir_gen.liveness_inplacing = self.liveness_inplacing
+        ir_gen.dead_logic_elimination = self.dead_logic_elimination
+        ir_gen.scheduling = self.scheduling
+        ir_gen.or_lowering = self.or_lowering
+        ir_gen.not_cost, ir_gen.cnot_cost, ir_gen.ccnot_cost = self.gate_costs
+        return ir_gen
 
     def run_generate_ir(self, print_output = True):
-        ir_gen = IRGen()
+        ir_gen = self.configure_ir_gen(IRGen())
 
         module = ir_gen.ir_gen_module(self.root)
         self.module = module
@@ -85,7 +167,12 @@ class QuantumIR():
             print("\nIR:\n")
             Printer().print_op(self.module)
 
-    def run_transformations(self, print_output = True, gateslist=[], qubitlist=[]):
+    # The number of gates and qubits after each iteration are appended to gateslist and qubitlist
+    def run_transformations(self, print_output = True, gateslist=None, qubitlist=None):
+        if gateslist is None:
+            gateslist = []
+        if qubitlist is None:
+            qubitlist = []
         if print_output:
             print("\n\nTransformations:")
 
@@ -210,10 +297,64 @@ def main():
 
     ccnot_gateslist = []
     ccnot_qubitlist = []
+    parser = argparse.ArgumentParser(description="Compile the SystemVerilog AST produced by slang to quantum IR")
+    parser.add_argument('json_path', nargs='?', help=f"SystemVerilog source or JSON produced by slang (default: {QuantumIR.json_path})")
+    parser.add_argument('--dump-ast', action='store_true', help=f"write the dataclass AST to {QuantumIR.dataclass_output}")
+    parser.add_argument('--no-cache', action='store_true', help="always run slang on SystemVerilog sources")
+    parser.add_argument('--fused', action='store_true', help="generate the IR while reading the JSON, without the dataclass AST; skips scheduling (a variable must be "
+                             "assigned before it is read), dead-logic elimination, liveness in-placing and constant propagation")
+    parser.add_argument('--frontend', choices=ast_cache.VERILOG_FRONTENDS, default=QuantumIR.verilog_frontend,
+                        help="compile SystemVerilog sources with the verilog_to_json executable or in-process with pyslang")
+    parser.add_argument('--constant', action='append', default=[], metavar='NAME=VALUE',
+                        help="fix an input port to a constant (0, 1 or all ones for a register), can be repeated")
+    parser.add_argument('--no-constant-propagation', action='store_true', help="generate the operations on constants instead of folding them")
+    parser.add_argument('--no-boolean-simplification', action='store_true', help="only fold the constants, without rewriting the operations with the boolean identities")
+    parser.add_argument('--no-structural-hashing', action='store_true', help="generate every sub-expression again, even if already computed")
+    parser.add_argument('--no-liveness-inplacing', action='store_true', help="write a XOR on a new qubit even if one of its variables is not read anymore")
+    parser.add_argument('--no-dead-logic-elimination', action='store_true', help="lower the assignments whose values never reach an output too")
+    parser.add_argument('--no-scheduling', action='store_true', help="lower the assignments in the order of the source, a variable must be assigned before it is read")
+    parser.add_argument('--or-lowering', choices=OR_LOWERINGS + ('cost',), default=QuantumIR.or_lowering,
+                        help="lower every OR in De Morgan form or in XOR form, or choose for each OR the cheapest")
+    parser.add_argument('--gate-costs', type=float, nargs=3, metavar=('NOT', 'CNOT', 'CCNOT'), default=QuantumIR.gate_costs,
+                        help="weights of the gates in the choice of the lowering of an OR")
+    parser.add_argument('--clear-cache', action='store_true', help=f"remove every AST from the cache in {ast_cache.CACHE_DIR}")
+    args = parser.parse_args()
+    if args.fused and args.dump_ast:
+        parser.error("--dump-ast needs the dataclass AST, it can't be used with --fused")
+    if args.fused and args.constant:
+        parser.error("--constant specializes the dataclass AST, it can't be used with --fused")
+    constants = {}
+    for constant in args.constant:
+        name, _, value = constant.partition('=')
+        try:
+            constants[name] = int(value, 0)
+        except ValueError:
+            parser.error(f"--constant expects NAME=VALUE, not {constant}")
+
+    if args.clear_cache:
+        print(f"Removed {ast_cache.ASTCache().clear()} cached ASTs")
+        if args.json_path is None:
+            return
+
     try:
-        quantum_ir = QuantumIR()
-        quantum_ir.run_dataclass()
-        quantum_ir.run_generate_ir()
+        quantum_ir = QuantumIR(args.json_path)
+        quantum_ir.dump_dataclass = args.dump_ast
+        quantum_ir.use_cache = not args.no_cache
+        quantum_ir.verilog_frontend = args.frontend
+        quantum_ir.constant_propagation = not args.no_constant_propagation
+        quantum_ir.boolean_simplification = not args.no_boolean_simplification
+        quantum_ir.constants = constants or None
+        quantum_ir.structural_hashing = not args.no_structural_hashing
+        quantum_ir.liveness_inplacing = not args.no_liveness_inplacing
+        quantum_ir.dead_logic_elimination = not args.no_dead_logic_elimination
+        quantum_ir.scheduling = not args.no_scheduling
+        quantum_ir.or_lowering = args.or_lowering
+        quantum_ir.gate_costs = tuple(args.gate_costs)
+        if args.fused:
+            quantum_ir.run_fused_ir_gen()
+        else:
+            quantum_ir.run_dataclass()
+            quantum_ir.run_generate_ir()
         quantum_ir.run_transformations(False,gateslist,qubitlist)
         quantum_ir.metrics_transformation()
         quantum_ir.run_transformations(False,ccnot_gateslist,ccnot_qubitlist)
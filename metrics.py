@@ -1,5 +1,5 @@
 from main import QuantumIR
-import backend.JSON_to_DataClasses as JSON_to_DataClasses
+from dialect.qubits import expand_gate, qubit_indexes, register_width
 
 from qiskit import QuantumCircuit
 
@@ -31,32 +31,33 @@ def create_circuit(first_op, qubit_number, output_number):
 
     circuit.initialize(1)
 
+    # the registers are expanded to single qubits here, a gate on a register of N qubits is N gates
+    indexes, _ = qubit_indexes(first_op.parent)
+
     while(current is not None):
-        operands_names = [op._name for op in current.operands]
-        indexes = [int(name.split("_")[0][1:]) for name in operands_names]
-
-        if current.name == "quantum.not":
-            not_count += 1
-            circuit.x(indexes[0])
-        if current.name  == "quantum.cnot":
-            cnot_count += 1
-            circuit.cx(indexes[0], indexes[1])
-        if current.name == "quantum.ccnot":
-            ccnot_count += 1
-            circuit.ccx(indexes[0], indexes[1], indexes[2])
-        if current.name == "quantum.h":
-            hgate_count += 1
-            circuit.h(indexes[0])
-        if current.name == "quantum.t":
-            tgate_count += 1
-            circuit.t(indexes[0])
-        if current.name == "quantum.tdagger":
-            tdagger_count += 1
-            circuit.tdg(indexes[0])
-        if current.name == "quantum.measure":
-            circuit.measure(indexes[0], cbit_index)
-            cbit_index += 1
-        
+        for bits in expand_gate(current, indexes):
+            if current.name == "quantum.not":
+                not_count += 1
+                circuit.x(bits[0])
+            if current.name  == "quantum.cnot":
+                cnot_count += 1
+                circuit.cx(bits[0], bits[1])
+            if current.name == "quantum.ccnot":
+                ccnot_count += 1
+                circuit.ccx(bits[0], bits[1], bits[2])
+            if current.name == "quantum.h":
+                hgate_count += 1
+                circuit.h(bits[0])
+            if current.name == "quantum.t":
+                tgate_count += 1
+                circuit.t(bits[0])
+            if current.name == "quantum.tdagger":
+                tdagger_count += 1
+                circuit.tdg(bits[0])
+            if current.name == "quantum.measure":
+                circuit.measure(bits[0], cbit_index)
+                cbit_index += 1
+
         current = current.next_op
     
     gatelist ={}
@@ -72,16 +73,16 @@ def create_circuit(first_op, qubit_number, output_number):
 # Support function to return information about the quantum circuit under analysis
 def get_quantum_circuit_info(input_args, first_op):
     # Scroll through the IR tree to count the number of (qu)bits numbers
-    input_number = input_args.__len__()
+    input_number = sum(register_width(arg) for arg in input_args)
     output_number = 0
     init_number = 0
 
     current = first_op
     while(current is not None):
         if current.name == "quantum.init":
-            init_number += 1
+            init_number += register_width(current.res)
         if current.name == "quantum.measure":
-            output_number += 1
+            output_number += register_width(current.res)
         current = current.next_op
 
     qubit_number = input_number + init_number
@@ -126,6 +127,9 @@ def metrics(circuit):
     }
 
 ######### MAIN #########
+# The SystemVerilog source or the JSON produced by slang can be passed as first argument
+json_path = sys.argv[1] if len(sys.argv) > 1 else None
+
 opt_gateEvol = []
 opt_qubitEvol = []
 opt_ccnot_qubitEvol = []
@@ -134,7 +138,7 @@ opt_ccnot_gateEvol = []
 # Generate basic IR, measure time and memory
 tracemalloc.start()
 basictime_start = time.perf_counter()
-quantum_ir = QuantumIR()
+quantum_ir = QuantumIR(json_path)
 quantum_ir.run_dataclass()
 quantum_ir.run_generate_ir(print_output = False)
 print("\nGenerating basic quantum circuit with CCNOT decomposition")
@@ -150,7 +154,7 @@ gc.collect()
 # Generate optimized IR, measure time and memory
 tracemalloc.start()
 opttime_start = time.perf_counter()
-quantum_ir = QuantumIR()
+quantum_ir = QuantumIR(json_path)
 quantum_ir.run_dataclass()
 quantum_ir.run_generate_ir(print_output = False)
 print("\nGenerating optimized quantum circuit with CCNOT decomposition")
@@ -173,14 +177,15 @@ transformed_ir = quantum_ir
 tracemalloc.stop()
 
 # Metrics input file
+input_metrics = transformed_ir.root.context
 print("\n\nInput file metrics:") 
-print(f"    Number of inputs: {JSON_to_DataClasses.num_inputs}")
-print(f"    Number of outputs: {JSON_to_DataClasses.num_outputs}")
-print(f"    Number of local variables: {JSON_to_DataClasses.num_locals}")
-print(f"    Number of AND gates: {JSON_to_DataClasses.num_ands}")
-print(f"    Number of OR gates: {JSON_to_DataClasses.num_ors}")
-print(f"    Number of NOT gates: {JSON_to_DataClasses.num_nots}")
-print(f"    Number of XOR gates: {JSON_to_DataClasses.num_xors}")
+print(f"    Number of inputs: {input_metrics.num_inputs}")
+print(f"    Number of outputs: {input_metrics.num_outputs}")
+print(f"    Number of local variables: {input_metrics.num_locals}")
+print(f"    Number of AND gates: {input_metrics.num_ands}")
+print(f"    Number of OR gates: {input_metrics.num_ors}")
+print(f"    Number of NOT gates: {input_metrics.num_nots}")
+print(f"    Number of XOR gates: {input_metrics.num_xors}")
 # Metrics for basic circuit
 
 module = basic_ir.module
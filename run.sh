@@ -4,7 +4,7 @@
 
 # Check if a filename is provided
 if [ -z "$1" ]; then
-    echo "Usage: $0 <filename> [-validate|-v] [-metrics|-m]"
+    echo "Usage: $0 <filename> [-validate|-v] [-metrics|-m] [-dump|-d] [-nocache|-n] [-fused|-f] [-pyslang|-p] [-threads|-t]"
     exit 1
 fi
 
@@ -15,59 +15,76 @@ shift
 basefile=$(basename "$filename")
 outname=${basefile%%.*}
 
-# Navigate to the build directory
-cd build
-
 # Ensure output file is clean
-rm -f ../test-outputs/${outname}.out
-touch ../test-outputs/${outname}.out
+mkdir -p test-outputs
+rm -f test-outputs/${outname}.out
+touch test-outputs/${outname}.out
 
-# Start program
-./verilog_to_json ../${filename} > ../test-outputs/${outname}.out
-exit_code=$?
-if [ $exit_code -ne 0 ]; then
-    echo "Error: verilog_to_json failed with exit code $exit_code"
-    exit $exit_code
-fi
+# The python scripts run slang themselves, only when the AST of the file is not in the cache (see backend/ast_cache.py)
 # List of allowed filenames for validation
 allowed_files=("test-inputs/and.sv" "test-inputs/cse.sv" "test-inputs/full_adder.sv" "test-inputs/inplace.sv" "test-inputs/not.sv" 
-"test-inputs/proceduralBlock.sv" "test-inputs/remove_unused.sv" "test-inputs/xorInPlace.sv")
+"test-inputs/proceduralBlock.sv" "test-inputs/reassign.sv" "test-inputs/remove_unused.sv" "test-inputs/xorInPlace.sv")
 
 # Parse command-line arguments for optional steps
+run_main=true
 run_validate=false
 run_metrics=false
-# If no argument are provided simply run the program
-if [ $# -eq 0 ];then
-    cd ..
+run_parallel=false
+dump_ast=""
+no_cache=""
+fused=""
+frontend=""
+for arg in "$@"; do
+    case $arg in
+        -validate|-v)
+            run_main=false
+            if [[ " ${allowed_files[@]} " =~ " ${filename} " ]]; then
+                run_validate=true
+            else
+                echo "Validation is not enabled for this file."
+            fi
+            ;;
+        -metrics|-m)
+            run_main=false
+            run_metrics=true
+            ;;
+        -threads|-t)
+            run_main=false
+            run_parallel=true
+            ;;
+        -dump|-d)
+            dump_ast="--dump-ast"
+            ;;
+        -nocache|-n)
+            no_cache="--no-cache"
+            ;;
+        -fused|-f)
+            fused="--fused"
+            ;;
+        -pyslang|-p)
+            frontend="--frontend pyslang"
+            ;;
+        *)
+            echo "Unknown option: $arg"
+            exit 1
+            ;;
+    esac
+done
+# If no validation or metrics are requested simply run the program
+if $run_main; then
     echo ${filename} > "test-outputs/${outname}.out"
-    (time python3 main.py) &>> "test-outputs/${outname}.out"
-else # else decide based on the argument
-    for arg in "$@"; do
-        case $arg in
-            -validate|-v)
-                if [[ " ${allowed_files[@]} " =~ " ${filename} " ]]; then
-                    run_validate=true
-                else
-                    echo "Validation is not enabled for this file."
-                fi
-                ;;
-            -metrics|-m)
-                run_metrics=true
-                ;;
-            *)
-                echo "Unknown option: $arg"
-                exit 1
-                ;;
-        esac
-    done
+    (time python3 main.py "$filename" $dump_ast $no_cache $fused $frontend) &>> "test-outputs/${outname}.out"
 fi
 # Run optional steps
 if $run_validate; then
-    cd ..
-    python3 validate.py ${outname} > "./test-outputs/${outname}.val"
+    python3 validate.py ${outname} "$filename" > "./test-outputs/${outname}.val"
 fi
 
 if $run_metrics; then
-    cd ..
-    python3 metrics.py > "./test-outputs/${outname}.out"
+    python3 metrics.py "$filename" > "./test-outputs/${outname}.out"
+fi
+
+# Compile the file several times at once in a thread pool and fail if a compile differs from the serial one
+if $run_parallel; then
+    python3 benchmark.py parallel "$filename" > "./test-outputs/${outname}.out" || exit 1
 fi
@@ -0,0 +1,13 @@
+module reassign(input logic a, b, c,
+                output logic y, z);
+
+    logic t;
+
+    always_comb begin
+        t = a & b;
+        z = t ^ c;
+        t = t | c;
+        y = t;
+    end
+
+endmodule
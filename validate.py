@@ -1,4 +1,5 @@
 from main import QuantumIR
+from dialect.qubits import expand_gate, qubit_indexes, register_width
 
 from qiskit import QuantumCircuit
 from qiskit_aer import AerSimulator
@@ -23,26 +24,27 @@ def create_circuit(first_op, qubit_number, output_number, state):
 
     circuit.initialize(state, qubit_list)
 
+    # the registers are expanded to single qubits here, a gate on a register of N qubits is N gates
+    indexes, _ = qubit_indexes(first_op.parent)
+
     while(current is not None):
-        operands_names = [op._name for op in current.operands]
-        indexes = [int(name.split("_")[0][1:]) for name in operands_names]
-
-        if current.name == "quantum.not":
-            circuit.x(indexes[0])
-        if current.name  == "quantum.cnot":
-            circuit.cx(indexes[0], indexes[1])
-        if current.name == "quantum.ccnot":
-            circuit.ccx(indexes[0], indexes[1], indexes[2])
-        if current.name == "quantum.h":
-            circuit.h(indexes[0])
-        if current.name == "quantum.t":
-            circuit.t(indexes[0])
-        if current.name == "quantum.tdagger":
-            circuit.tdg(indexes[0])
-        if current.name == "quantum.measure":
-            circuit.measure(indexes[0], cbit_index)
-            cbit_index += 1
-        
+        for bits in expand_gate(current, indexes):
+            if current.name == "quantum.not":
+                circuit.x(bits[0])
+            if current.name  == "quantum.cnot":
+                circuit.cx(bits[0], bits[1])
+            if current.name == "quantum.ccnot":
+                circuit.ccx(bits[0], bits[1], bits[2])
+            if current.name == "quantum.h":
+                circuit.h(bits[0])
+            if current.name == "quantum.t":
+                circuit.t(bits[0])
+            if current.name == "quantum.tdagger":
+                circuit.tdg(bits[0])
+            if current.name == "quantum.measure":
+                circuit.measure(bits[0], cbit_index)
+                cbit_index += 1
+
         current = current.next_op
     
     return circuit
@@ -87,16 +89,16 @@ def generate_classical_truth_table(circuit_name):
 # Support function to return information about the quantum circuit under analysis
 def get_quantum_circuit_info(input_args, first_op):
     # Scroll through the IR tree to count the number of (qu)bits numbers
-    input_number = input_args.__len__()
+    input_number = sum(register_width(arg) for arg in input_args)
     output_number = 0
     init_number = 0
 
     current = first_op
     while(current is not None):
         if current.name == "quantum.init":
-            init_number += 1
+            init_number += register_width(current.res)
         if current.name == "quantum.measure":
-            output_number += 1
+            output_number += register_width(current.res)
         current = current.next_op
 
     qubit_number = input_number + init_number
@@ -123,11 +125,12 @@ def bit_strings_iterative(N):
 
 ######### MAIN #########
 
-if len(sys.argv) != 2:
-    print("Please, provide exaclty one argument: the name of the circuit to be tested.")
+if len(sys.argv) not in (2, 3):
+    print("Please, provide the name of the circuit to be tested and optionally the SystemVerilog source or the JSON produced by slang.")
     sys.exit(1)
 
 circuit_name = sys.argv[1]
+json_path = sys.argv[2] if len(sys.argv) > 2 else None
 print(f"Testing {circuit_name} circuit...")
 
 classical_truth_table = generate_classical_truth_table(circuit_name)
@@ -143,7 +146,7 @@ passed_tests = 0
 for i in range(4):
 
     # Generate IR
-    quantum_ir = QuantumIR()
+    quantum_ir = QuantumIR(json_path)
     quantum_ir.run_dataclass()
     quantum_ir.run_generate_ir(print_output = False)
 